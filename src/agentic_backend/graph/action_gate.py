@@ -0,0 +1,83 @@
+"""
+Portão das ações com efeito colateral até o veredito do critic.
+
+No modo otimista (``graph_critic_mode = "optimistic"``) o critic e o agente
+selecionado rodam ao mesmo tempo: o agente já gera texto, consulta o índice e
+monta o plano enquanto o critic analisa a query. Toda ação com efeito externo
+(abrir abas e preencher formulários via MCP, executar automações, gravar o
+perfil do usuário) passa antes por ``await gated(...)``, que só retorna depois
+do veredito. Se o critic rejeitar, ``gated`` levanta ``ActionRejected`` e o
+graph cancela o trabalho em andamento do agente.
+
+Fora de um ``action_scope`` (modo sequencial, chamadas diretas) ``gated``
+retorna na hora: o critic já decidiu antes de o agente começar.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class ActionRejected(RuntimeError):
+    """Ação bloqueada porque o critic rejeitou a execução"""
+
+
+class ActionGate:
+    """Veredito do critic compartilhado com o agente que roda em paralelo"""
+
+    def __init__(self):
+        self._decided = asyncio.Event()
+        self._approved = False
+        self.reason: Optional[str] = None
+        # Ações que chegaram ao portão antes do veredito
+        self.waited: List[str] = []
+
+    @property
+    def decided(self) -> bool:
+        return self._decided.is_set()
+
+    @property
+    def approved(self) -> bool:
+        return self._approved
+
+    def approve(self):
+        self._approved = True
+        self._decided.set()
+
+    def reject(self, reason: str):
+        self._approved = False
+        self.reason = reason
+        self._decided.set()
+
+    async def wait(self, action: str):
+        """Espera o veredito; levanta ``ActionRejected`` se o critic rejeitou"""
+        if not self._decided.is_set():
+            self.waited.append(action)
+            log.info(f"⏸️ Ação '{action}' aguardando o veredito do critic")
+            await self._decided.wait()
+        if not self._approved:
+            raise ActionRejected(f"Ação '{action}' bloqueada pelo critic: {self.reason}")
+
+
+current_action_gate: ContextVar[Optional[ActionGate]] = ContextVar("current_action_gate", default=None)
+
+
+@contextmanager
+def action_scope(gate: ActionGate):
+    """Liga ``gate`` às ações do agente executado dentro do bloco"""
+    reset = current_action_gate.set(gate)
+    try:
+        yield gate
+    finally:
+        current_action_gate.reset(reset)
+
+
+async def gated(action: str):
+    """Ponto de espera antes de uma ação com efeito colateral"""
+    gate = current_action_gate.get()
+    if gate is not None:
+        await gate.wait(action)
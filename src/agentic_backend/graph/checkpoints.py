@@ -0,0 +1,282 @@
+"""
+Checkpoints do graph por nó, em SQLite, para retomar jobs interrompidos.
+
+Um reinício do backend (ou o notebook dormindo) no meio de um job perdia
+tudo o que o ``AIGraph.invoke`` já tinha feito: chamadas do LLM, páginas
+raspadas. Aqui cada execução grava o estado inicial uma vez e, a cada nó
+concluído, só as saídas daquele nó (o que o runtime mescla ao estado). Para
+retomar, o estado é remontado a partir do inicial + saídas dos nós concluídos
+e o runtime pula esses nós.
+
+- Valores grandes (acima de ``graph_checkpoint_inline_bytes`` em JSON) vão
+  para a tabela ``blobs`` endereçada pelo SHA-256 do conteúdo; o checkpoint do
+  nó guarda só a referência. O mesmo conteúdo (por exemplo ``findings``
+  repassado por outro nó) é gravado uma única vez por job.
+- Saídas de nós guardados só são gravadas depois do veredito do critic
+  (o runtime só as mescla nesse momento).
+- Execuções terminadas continuam consultáveis por ``graph_checkpoint_ttl_seconds``.
+- Valores que não são JSON são gravados como texto (``str``).
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+# Status gravados de uma execução
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Marca de valor guardado por referência na tabela de blobs
+_REF = "$blob"
+
+
+class CheckpointStore:
+    """
+    Estado inicial + saídas por nó de cada execução do graph.
+
+    Args:
+        db_path: Arquivo SQLite (criado sob demanda)
+        inline_bytes: Valores maiores que isso (JSON) são guardados por referência
+        ttl_seconds: Retenção das execuções terminadas
+        enabled: Desligado, nada é gravado e não há o que retomar
+    """
+
+    def __init__(self, db_path: str, inline_bytes: int = 4096, ttl_seconds: float = 604800.0,
+                 enabled: bool = True):
+        self.db_path = db_path
+        self.inline_bytes = max(0, inline_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stats = {"runs": 0, "resumed": 0, "nodes": 0, "blobs": 0, "blob_bytes": 0, "errors": 0}
+
+    def begin(self, job_id: str, state: Dict[str, Any]):
+        """Grava o estado inicial de uma execução nova (apaga checkpoints anteriores do mesmo job)"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._db()
+                self._delete(conn, job_id)
+                conn.execute(
+                    "INSERT INTO runs (job_id, state, status, error, created_at, updated_at) "
+                    "VALUES (?, ?, ?, NULL, ?, ?)",
+                    (job_id, self._encode(conn, job_id, state), RUNNING, now, now)
+                )
+                self._prune(conn, now)
+                conn.commit()
+                self._stats["runs"] += 1
+        except Exception as e:
+            self._error("iniciar", e)
+
+    def save_node(self, job_id: str, node: str, outputs: Dict[str, Any]):
+        """Grava as saídas de um nó concluído"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._db()
+                conn.execute(
+                    "INSERT OR REPLACE INTO nodes (job_id, node, outputs, finished_at) VALUES (?, ?, ?, ?)",
+                    (job_id, node, self._encode(conn, job_id, outputs), now)
+                )
+                conn.execute("UPDATE runs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+                conn.commit()
+                self._stats["nodes"] += 1
+        except Exception as e:
+            self._error(f"gravar o nó {node}", e)
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        """Registra o fim da execução (só ``running`` fica de fora da retenção)"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                conn = self._db()
+                conn.execute(
+                    "UPDATE runs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                    (status, error, time.time(), job_id)
+                )
+                conn.commit()
+        except Exception as e:
+            self._error("finalizar", e)
+
+    def load(self, job_id: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]]:
+        """
+        Estado inicial e saídas dos nós concluídos de uma execução.
+
+        Returns:
+            ``(estado inicial, {nó: saídas})`` ou None sem checkpoint
+        """
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._db()
+                row = conn.execute("SELECT state FROM runs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is None:
+                    return None
+                state = self._decode(conn, job_id, row[0])
+                completed = {
+                    node: self._decode(conn, job_id, outputs)
+                    for node, outputs in conn.execute(
+                        "SELECT node, outputs FROM nodes WHERE job_id = ? ORDER BY finished_at", (job_id,)
+                    )
+                }
+                self._stats["resumed"] += 1
+                return state, completed
+        except Exception as e:
+            self._error("ler", e)
+            return None
+
+    def load_node(self, job_id: str, node: str) -> Optional[Dict[str, Any]]:
+        """Saídas gravadas de um nó (None sem checkpoint desse nó)"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._db()
+                row = conn.execute(
+                    "SELECT outputs FROM nodes WHERE job_id = ? AND node = ?", (job_id, node)
+                ).fetchone()
+                return self._decode(conn, job_id, row[0]) if row is not None else None
+        except Exception as e:
+            self._error("ler", e)
+            return None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Resumo de uma execução: status, erro, nós concluídos"""
+        runs = self._list("WHERE job_id = ?", (job_id,))
+        return runs[0] if runs else None
+
+    def interrupted(self) -> List[Dict[str, Any]]:
+        """Execuções que não terminaram (processo encerrado no meio) ou falharam"""
+        return self._list("WHERE status IN (?, ?, ?)", (RUNNING, FAILED, CANCELLED))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        return stats
+
+    # ------------------------------------------------------------------
+
+    def _list(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        if not self.enabled:
+            return []
+        try:
+            with self._lock:
+                conn = self._db()
+                rows = conn.execute(
+                    f"SELECT job_id, status, error, created_at, updated_at FROM runs {where} ORDER BY updated_at DESC",
+                    params
+                ).fetchall()
+                result = []
+                for job_id, status, error, created_at, updated_at in rows:
+                    nodes = [n for (n,) in conn.execute(
+                        "SELECT node FROM nodes WHERE job_id = ? ORDER BY finished_at", (job_id,)
+                    )]
+                    result.append({
+                        "job_id": job_id,
+                        "status": status,
+                        "error": error,
+                        "created_at": created_at,
+                        "updated_at": updated_at,
+                        "completed_nodes": nodes,
+                    })
+                return result
+        except Exception as e:
+            self._error("listar", e)
+            return []
+
+    def _encode(self, conn: sqlite3.Connection, job_id: str, values: Dict[str, Any]) -> str:
+        """JSON das chaves; as grandes viram ``{"$blob": sha256}``"""
+        encoded = {}
+        for key, value in values.items():
+            data = json.dumps(value, ensure_ascii=False, default=str)
+            if len(data) > self.inline_bytes:
+                digest = hashlib.sha256(data.encode("utf-8")).hexdigest()
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO blobs (job_id, digest, data) VALUES (?, ?, ?)",
+                    (job_id, digest, data)
+                )
+                if cursor.rowcount:
+                    self._stats["blobs"] += 1
+                    self._stats["blob_bytes"] += len(data)
+                data = json.dumps({_REF: digest})
+            encoded[key] = data
+        return json.dumps(encoded, ensure_ascii=False)
+
+    @staticmethod
+    def _decode(conn: sqlite3.Connection, job_id: str, payload: str) -> Dict[str, Any]:
+        values = {}
+        for key, data in json.loads(payload).items():
+            value = json.loads(data)
+            if isinstance(value, dict) and list(value) == [_REF]:
+                row = conn.execute(
+                    "SELECT data FROM blobs WHERE job_id = ? AND digest = ?", (job_id, value[_REF])
+                ).fetchone()
+                if row is None:
+                    raise KeyError(f"blob {value[_REF]} ausente para {key}")
+                value = json.loads(row[0])
+            values[key] = value
+        return values
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, job_id: str):
+        for table in ("runs", "nodes", "blobs"):
+            conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        expired = [job_id for (job_id,) in conn.execute(
+            "SELECT job_id FROM runs WHERE status != ? AND updated_at < ?", (RUNNING, now - self.ttl_seconds)
+        )]
+        for job_id in expired:
+            self._delete(conn, job_id)
+
+    def _error(self, action: str, error: Exception):
+        log.warning(f"Falha ao {action} checkpoint do graph: {error}")
+        with self._lock:
+            self._stats["errors"] += 1
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "job_id TEXT PRIMARY KEY, state TEXT NOT NULL, status TEXT NOT NULL, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                "job_id TEXT NOT NULL, node TEXT NOT NULL, outputs TEXT NOT NULL, finished_at REAL NOT NULL, "
+                "PRIMARY KEY (job_id, node));"
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "job_id TEXT NOT NULL, digest TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, digest));"
+            )
+            self._conn.commit()
+        return self._conn
+
+
+# Instância global (checkpoints de todas as execuções do graph)
+checkpoint_store = CheckpointStore(
+    db_path=os.path.join(settings.data_dir, "checkpoints", "graph.sqlite3"),
+    inline_bytes=settings.graph_checkpoint_inline_bytes,
+    ttl_seconds=settings.graph_checkpoint_ttl_seconds,
+    enabled=settings.graph_checkpoints_enabled,
+)
@@ -0,0 +1,188 @@
+"""
+Relatórios do Reporter gerados em segundo plano.
+
+O Reporter faz duas gerações (resumo executivo e análise das métricas da
+NPU) e grava o arquivo de evidências antes de o ``/run`` devolver qualquer
+coisa, embora quem chamou normalmente só precise do resultado do agente. No
+modo ``deferred`` o graph termina no agente: o resultado volta na hora, com
+``report_status = "pending"``, e o Reporter roda em uma task de fundo.
+
+- Quem chamou acessa o relatório depois por ``get``/``wait``
+  (``GET /reports/{job_id}``) ou pelo evento ``report`` do job.
+- As saídas do Reporter são mescladas ao estado devolvido pelo graph e
+  gravadas como checkpoint do nó ``reporter`` (consultáveis após reinício).
+- A task tem token de cancelamento próprio (prazo
+  ``graph_reporter_timeout_seconds``): desconectar o cliente do ``/run`` não
+  interrompe o relatório.
+- No máximo ``graph_reporter_concurrency`` relatórios são gerados ao mesmo
+  tempo; relatórios prontos ficam consultáveis por ``graph_reporter_ttl_seconds``.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+from ..settings import settings
+from ..llm.cancellation import CancellationToken, cancellation_scope
+from ..llm.telemetry import caller_scope
+
+log = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+ReportFunc = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class DeferredReport:
+    """Relatório em segundo plano de um job"""
+    job_id: str
+    status: str = PENDING
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "seconds": round(self.finished_at - self.created_at, 3) if self.finished_at else None,
+            **self.outputs,
+        }
+
+
+class DeferredReports:
+    """
+    Tasks de fundo do Reporter, por job.
+
+    Args:
+        concurrency: Relatórios gerados ao mesmo tempo
+        timeout_s: Prazo de cada relatório (0 = sem prazo)
+        ttl_seconds: Tempo que um relatório pronto continua consultável
+    """
+
+    def __init__(self, concurrency: int = 1, timeout_s: float = 300.0, ttl_seconds: float = 3600.0):
+        self.concurrency = max(1, concurrency)
+        self.timeout_s = timeout_s
+        self.ttl_seconds = ttl_seconds
+        self._reports: Dict[str, DeferredReport] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stats = {"scheduled": 0, DONE: 0, FAILED: 0, "total_seconds": 0.0}
+
+    def schedule(self, job_id: str, build: ReportFunc,
+                 on_done: Optional[Callable[[DeferredReport], None]] = None) -> DeferredReport:
+        """
+        Agenda o relatório de ``job_id`` (um anterior em andamento é cancelado).
+
+        Args:
+            build: ``async () -> saídas do Reporter``
+            on_done: Chamado com o relatório quando termina (com sucesso ou
+                falha); não é chamado para a task substituída por um novo agendamento
+        """
+        self._expire()
+        previous = self._tasks.pop(job_id, None)
+        if previous is not None:
+            previous.cancel()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        report = self._reports[job_id] = DeferredReport(job_id=job_id)
+        self._stats["scheduled"] += 1
+        self._tasks[job_id] = asyncio.create_task(self._run(report, build, on_done))
+        return report
+
+    def get(self, job_id: str) -> Optional[DeferredReport]:
+        self._expire()
+        return self._reports.get(job_id)
+
+    async def wait(self, job_id: str, timeout_s: Optional[float] = None) -> Optional[DeferredReport]:
+        """Espera o relatório ficar pronto (até ``timeout_s``); devolve-o no estado em que estiver"""
+        report = self.get(job_id)
+        if report is not None and report.status == PENDING and timeout_s:
+            try:
+                await asyncio.wait_for(report.done.wait(), timeout_s)
+            except asyncio.TimeoutError:
+                pass
+        return report
+
+    async def stop(self):
+        """Cancela os relatórios em andamento (desligamento)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        finished = self._stats[DONE] + self._stats[FAILED]
+        return {
+            "scheduled": self._stats["scheduled"],
+            DONE: self._stats[DONE],
+            FAILED: self._stats[FAILED],
+            PENDING: len(self._tasks),
+            "mean_seconds": round(self._stats["total_seconds"] / finished, 3) if finished else None,
+        }
+
+    async def _run(self, report: DeferredReport, build: ReportFunc,
+                   on_done: Optional[Callable[[DeferredReport], None]]):
+        # Token próprio: o do pedido que criou a task pode ser cancelado depois da resposta
+        token = CancellationToken(timeout_s=self.timeout_s or None)
+        # Substituída por um ``schedule`` novo do mesmo job: termina em silêncio
+        superseded = False
+        try:
+            async with self._semaphore:
+                with cancellation_scope(token), caller_scope("reporter"):
+                    report.outputs = await build()
+            report.status = DONE
+        except asyncio.CancelledError:
+            superseded = self._tasks.get(report.job_id) is not asyncio.current_task()
+            token.cancel("superseded" if superseded else "shutdown")
+            report.status = FAILED
+            report.error = "cancelled"
+            raise
+        except Exception as e:
+            log.error(f"❌ Erro no relatório em segundo plano do job {report.job_id}: {e}")
+            report.status = FAILED
+            report.error = str(e)
+        finally:
+            if self._tasks.get(report.job_id) is asyncio.current_task():
+                del self._tasks[report.job_id]
+            report.finished_at = time.time()
+            report.done.set()
+            if superseded:
+                log.info(f"Relatório anterior do job {report.job_id} cancelado (reagendado)")
+            else:
+                self._stats[report.status] += 1
+                self._stats["total_seconds"] += report.finished_at - report.created_at
+            if on_done is not None and not superseded:
+                try:
+                    on_done(report)
+                except Exception as e:
+                    log.warning(f"Erro no callback do relatório do job {report.job_id}: {e}")
+
+    def _expire(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, report in self._reports.items()
+            if report.finished_at is not None and now - report.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._reports[job_id]
+
+
+# Instância global (relatórios de todos os jobs do processo)
+deferred_reports = DeferredReports(
+    concurrency=settings.graph_reporter_concurrency,
+    timeout_s=settings.graph_reporter_timeout_seconds,
+    ttl_seconds=settings.graph_reporter_ttl_seconds,
+)
@@ -3,22 +3,67 @@ Graph implementation com agentes reais usando IA.
 Todos os agentes agora usam LLM e embeddings reais.
 """
 from __future__ import annotations
-from typing import Dict, Any, Callable
-import asyncio
+from typing import Dict, Any, Callable, Optional
 import logging
 
 from .state import GraphState
-from ..llm.engine import LLMEngine
-from ..embeddings.embedding import ONNXEmbedder
-from ..vectorstore.faiss_store import LocalFaiss
+from ..llm.cascade import ModelCascade
+from ..settings import settings
+from ..model_registry import acquire_llm, acquire_embedder, acquire_vector_store
+from ..llm.priority import Priority
 from ..tools.web_scraper import ARMCompatibleWebScraper
 from ..audit.evidence import EvidencePack
 from ..tools.mcp_client import MCPClient
 from ..security.policies import Policy
 from ..npu_monitor import npu_monitor, monitor_inference
+from ..prompts import AgentRole, get_agent_system_prompt
+from .action_gate import gated
+from .runtime import GraphRuntime, Node
+from .checkpoints import checkpoint_store, SUCCEEDED, FAILED, CANCELLED
+from .deferred_reports import deferred_reports, DeferredReport, PENDING as REPORT_PENDING, DONE as REPORT_DONE
+from .nodes.supervisor import route
+from .nodes.critic import run as critic_run
+from .nodes.reporter import run as reporter_run
+from .nodes.onboarding import run as onboarding_run
+from .nodes.chatbot import run_chatbot
 
 log = logging.getLogger(__name__)
 
+# Chaves de primeiro nível devolvidas pelo Onboarding
+ONBOARDING_OUTPUTS = (
+    "response", "onboarding_status", "requires_user_input", "question_type", "options",
+    "clarification_topic", "next_step", "user_profile", "user_context",
+)
+
+
+def _critic_verdict(state: Dict[str, Any]) -> Optional[str]:
+    """Motivo da rejeição do Critic (None = aprovado)"""
+    if state.get("security_check_passed", True):
+        return None
+    return "; ".join(state.get("warnings") or []) or "rejeitado"
+
+
+def _defers_report(state: Dict[str, Any]) -> bool:
+    """Reporter em segundo plano (``defer_report`` do pedido ou ``graph_reporter_mode``)"""
+    defer = state.get("defer_report")
+    if defer is None:
+        defer = settings.graph_reporter_mode == "deferred"
+    # Sem job_id não há como buscar o relatório depois
+    return bool(defer and state.get("job_id"))
+
+
+def _selected(name: str) -> Callable[[Dict[str, Any]], bool]:
+    return lambda state: state.get("selected_agent") == name
+
+
+def _monitored(run: Callable) -> Callable:
+    """Agente com monitoramento de inferência da NPU"""
+    async def _run(state: Dict[str, Any]) -> Dict[str, Any]:
+        with monitor_inference():
+            return await run(state)
+    return _run
+
+
 class AIGraph:
     """
     Graph com agentes reais usando IA (LLM + Embeddings + Vector Store).
@@ -26,13 +71,16 @@ class AIGraph:
     """
 
     def __init__(self):
-        self.nodes = {}
+        self.nodes: Dict[str, Node] = {}
+        self.runtime = GraphRuntime(optimistic=settings.graph_critic_mode == "optimistic")
         self.llm_engine = None
         self.embedder = None
         self.vector_store = None
         self.web_scraper = None
         self.evidence_pack = None
 
+        self._build_nodes()
+
         # Inicializar componentes de IA
         self._init_ai_components()
 
@@ -41,18 +89,21 @@ class AIGraph:
         try:
             log.info("Inicializando componentes de IA...")
 
-            # LLM Engine
-            llm_path = "./models/llama-3.2-3b-qnn"
-            self.llm_engine = LLMEngine(llm_path)
+            # LLM Engine (compartilhado pelo registro com o chatbot da API)
+            # Saudações, perguntas do onboarding e resumos curtos vão para o modelo pequeno
+            small_engine = acquire_llm(settings.llm_small_model_path) if settings.llm_small_model_path else None
+            self.llm_engine = ModelCascade(acquire_llm(), small_engine)
+            # System prompts fixos dos agentes: prefill reaproveitado entre chamadas
+            for role in AgentRole:
+                self.llm_engine.register_prefix(get_agent_system_prompt(role))
             log.info("✅ LLM Engine inicializado")
 
             # Embedder
-            embedder_path = "./models/nomic-embed-text.onnx/model.onnx"
-            self.embedder = ONNXEmbedder(embedder_path)
+            self.embedder = acquire_embedder()
             log.info("✅ Embedder inicializado")
 
             # Vector Store
-            self.vector_store = LocalFaiss(dim=768, index_dir="./data/indexes")
+            self.vector_store = acquire_vector_store()
             log.info("✅ Vector Store inicializado")
 
             # Web Scraper
@@ -71,16 +122,108 @@ class AIGraph:
             log.error(f"Erro ao inicializar componentes de IA: {e}")
             raise
 
-    def add_node(self, name: str, func: Callable):
-        """Adiciona um nó ao graph."""
-        self.nodes[name] = func
+    def add_node(self, name: str, func: Callable, **spec) -> Node:
+        """
+        Adiciona um nó ao graph.
 
-    async def invoke(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        ``spec`` são os campos de ``Node`` (inputs, outputs, after, when,
+        timeout_s, retries...): as dependências saem das entradas/saídas.
+        """
+        node = self.runtime.add_node(Node(name=name, func=func, **spec))
+        self.nodes[name] = node
+        return node
+
+    def _build_nodes(self):
+        """
+        Declara o fluxo: Supervisor -> [Critic || agente escolhido] -> Reporter.
+
+        O Critic só lê a query (``tabs`` vem do estado inicial, não do
+        Researcher) e não depende do Supervisor: os dois começam juntos. O
+        ``user_context`` do Chatbot também vem do estado inicial. Os
+        agentes leem ``selected_agent`` e são guardados pelo Critic; o Reporter
+        espera todos os agentes (executados, pulados ou bloqueados). No modo
+        ``deferred`` o Reporter é pulado e roda em segundo plano depois do
+        graph (ver ``deferred_reports``).
+        """
+        self.add_node(
+            "supervisor", self._supervisor_node,
+            inputs=("first_access", "message", "update_context", "form_spec", "automation_spec", "overlay_mode"),
+            outputs=("selected_agent",),
+        )
+        self.add_node(
+            "critic", self._critic_node,
+            inputs=("query",),
+            outputs=("warnings", "security_check_passed"),
+            timeout_s=settings.graph_critic_timeout_seconds or None,
+            retries=settings.graph_critic_retries,
+            verdict=_critic_verdict,
+        )
+
+        agents = {
+            "onboarding": (self._run_onboarding, ("user_id", "message", "first_access"), ONBOARDING_OUTPUTS),
+            "chatbot": (self._run_chatbot, ("query",), ("chatbot_response", "performance_metrics")),
+            "researcher": (self._run_researcher, ("query",), ("tabs", "findings", "search_strategy", "citations")),
+            "form_filler": (self._run_form_filler, ("form_spec",), ("form_analysis", "filled_fields")),
+            "automations": (self._run_automations, ("automation_spec",), ("automation_plan", "automation_steps")),
+            "overlay": (self._run_overlay, (), ("overlay_suggestions",)),
+        }
+        for name, (run, inputs, outputs) in agents.items():
+            self.add_node(
+                name, _monitored(run),
+                inputs=("selected_agent",) + inputs,
+                outputs=outputs,
+                when=_selected(name),
+                guarded_by="critic",
+            )
+
+        self.add_node(
+            "reporter", self._reporter_node,
+            inputs=("query", "selected_agent", "warnings", "tabs", "findings", "citations",
+                    "processing_time_seconds", "npu_metrics", "error"),
+            outputs=("executive_summary", "technical_report", "evidence_path", "evidence_generated",
+                     "evidence_error", "execution_log"),
+            after=tuple(agents),
+            when=lambda state: not _defers_report(state),
+        )
+
+    async def invoke(self, state: Dict[str, Any],
+                     on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     resume: bool = False) -> Dict[str, Any]:
         """
         Executa o fluxo de agentes com IA real.
 
         Fluxo: Supervisor -> Critic -> [Researcher | Form Filler | Automations | Overlay] -> Reporter
+
+        No modo ``optimistic`` (padrão) o Critic roda em paralelo com o agente;
+        ações com efeito colateral esperam o veredito (ver ``action_gate``).
+        Tempos por nó em ``state["node_timings"]``; ``on_event`` recebe o
+        progresso de cada nó (ver ``GraphRuntime.run``).
+
+        Com ``job_id`` no estado, cada nó concluído vira um checkpoint (ver
+        ``checkpoints``). ``resume=True`` remonta o estado do checkpoint do
+        ``job_id`` e pula os nós já concluídos.
+
+        No modo ``deferred`` o estado volta com ``report_status = "pending"``
+        assim que o agente termina; as saídas do Reporter são mescladas a ele
+        depois (``on_event`` recebe ``{"type": "report", ...}``).
         """
+        job_id = state.get("job_id")
+        completed: Dict[str, Dict[str, Any]] = {}
+        on_commit = None
+        if job_id and checkpoint_store.enabled:
+            if resume:
+                loaded = checkpoint_store.load(job_id)
+                if loaded is None:
+                    state["error"] = f"Sem checkpoint para o job {job_id}"
+                    return state
+                initial, completed = loaded
+                state.update(initial)
+            else:
+                checkpoint_store.begin(job_id, state)
+
+            def on_commit(node: str, outputs: Dict[str, Any]):
+                checkpoint_store.save_node(job_id, node, outputs)
+
         try:
             log.info("🚀 Iniciando execução do graph com IA real")
 
@@ -88,82 +231,84 @@ class AIGraph:
             if not self.llm_engine:
                 self._init_ai_components()
 
-            # Supervisor - decide qual agente executar
-            log.info("🎯 Executando Supervisor...")
-            from .nodes.supervisor import route
-            next_node = route(state)
-            state["selected_agent"] = next_node
-            log.info(f"   Agente selecionado: {next_node}")
-
-            # Critic - valida segurança
-            log.info("🛡️ Executando Critic...")
-            from .nodes.critic import run as critic_run
-            state = await critic_run(state, self.llm_engine, self.embedder)
-
-            # Executar agente específico
-            with monitor_inference():
-                if next_node == "onboarding":
-                    log.info("🚀 Executando Onboarding...")
-                    state = await self._run_onboarding(state)
-                elif next_node == "chatbot":
-                    log.info("💬 Executando Chatbot...")
-                    state = await self._run_chatbot(state)
-                elif next_node == "researcher":
-                    log.info("🔍 Executando Researcher...")
-                    state = await self._run_researcher(state)
-                elif next_node == "form_filler":
-                    log.info("📝 Executando Form Filler...")
-                    state = await self._run_form_filler(state)
-                elif next_node == "automations":
-                    log.info("⚙️ Executando Automations...")
-                    state = await self._run_automations(state)
-                elif next_node == "overlay":
-                    log.info("👁️ Executando Overlay...")
-                    state = await self._run_overlay(state)
-                else:
-                    log.warning(f"Agente não reconhecido: {next_node}")
-
-            # Reporter - gera evidências
-            log.info("📋 Executando Reporter...")
-            from .nodes.reporter import run as reporter_run
-            state = await reporter_run(state, self.llm_engine)
+            state = await self.runtime.run(state, on_event, completed=completed, on_commit=on_commit)
+
+            blocked = [name for name, t in state["node_timings"].items() if t["status"] == "blocked"]
+            if blocked:
+                state["agent_blocked"] = blocked[0]
+
+            if _defers_report(state) and state["node_timings"]["reporter"]["status"] == "skipped":
+                self._schedule_report(state, on_event)
 
             log.info("✅ Graph executado com sucesso")
+            if on_commit is not None:
+                checkpoint_store.finish(job_id, CANCELLED if state.get("cancelled") else SUCCEEDED,
+                                        state.get("cancelled"))
             return state
 
         except Exception as e:
             log.error(f"❌ Erro na execução do graph: {e}")
             state["error"] = str(e)
+            if on_commit is not None:
+                checkpoint_store.finish(job_id, FAILED, str(e))
             return state
 
+    def _schedule_report(self, state: Dict[str, Any],
+                         on_event: Optional[Callable[[Dict[str, Any]], None]]) -> DeferredReport:
+        """Reporter em segundo plano sobre uma cópia do estado final dos agentes"""
+        job_id = state["job_id"]
+        outputs = self.runtime.nodes["reporter"].outputs
+        snapshot = dict(state)
+        state["report_status"] = REPORT_PENDING
+
+        async def _build() -> Dict[str, Any]:
+            result = await self._reporter_node(snapshot)
+            return {key: result[key] for key in outputs if key in result}
+
+        def _on_done(report: DeferredReport):
+            state.update(report.outputs)
+            state["report_status"] = report.status
+            if report.status == REPORT_DONE:
+                checkpoint_store.save_node(job_id, "reporter", report.outputs)
+            if on_event is not None:
+                on_event({"type": "report", "status": report.status, "error": report.error})
+
+        log.info(f"📋 Reporter do job {job_id} em segundo plano")
+        return deferred_reports.schedule(job_id, _build, _on_done)
+
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """Execuções e tempos por nó"""
+        return self.runtime.get_stats()
+
+    async def _supervisor_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Supervisor - decide qual agente executar"""
+        log.info("🎯 Executando Supervisor...")
+        next_node = route(state)
+        log.info(f"   Agente selecionado: {next_node}")
+        return {"selected_agent": next_node}
+
+    async def _critic_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Critic - valida segurança"""
+        log.info("🛡️ Executando Critic...")
+        return await critic_run(state, self.llm_engine, self.embedder)
+
+    async def _reporter_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Reporter - gera evidências"""
+        log.info("📋 Executando Reporter...")
+        return await reporter_run(state, self.llm_engine)
+
     async def _run_onboarding(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Executa o Onboarding Agent com IA real."""
-        from .nodes.onboarding import run as onboarding_run
         return await onboarding_run(state, self.llm_engine, self.embedder)
 
     async def _run_chatbot(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Executa o Chatbot Agent."""
-        from .nodes.chatbot import run_chatbot
         return await run_chatbot(state, self.llm_engine, self.embedder, self.vector_store, self.evidence_pack)
 
     async def _run_researcher(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Executa o Researcher Agent com IA real."""
         query = state.get("query", "")
 
-        # Usar LLM para gerar estratégia de pesquisa
-        search_prompt = f"""
-        Você é um especialista em pesquisa. Para a query: "{query}"
-        Gere uma estratégia de pesquisa incluindo:
-        1. Fontes relevantes a consultar
-        2. Termos de busca específicos
-        3. Critérios de avaliação da informação
-
-        Responda em formato estruturado.
-        """
-
-        search_strategy = self.llm_engine.generate_text(search_prompt, max_length=300)
-        state["search_strategy"] = search_strategy
-
         # Simular abertura de abas (em produção usaria MCP)
         urls = [
             "https://www.itau.com.br/",
@@ -171,6 +316,8 @@ class AIGraph:
             "https://www.b3.com.br/"
         ]
 
+        # Abrir abas é ação no navegador do usuário: só após o veredito do Critic
+        await gated("open_tabs")
         tabs = []
         for url in urls:
             if Policy.is_domain_allowed(url):
@@ -195,7 +342,17 @@ class AIGraph:
 
         state["findings"] = findings
 
-        # Gerar citações usando LLM
+        # Usar LLM para gerar estratégia de pesquisa e citações
+        search_prompt = f"""
+        Você é um especialista em pesquisa. Para a query: "{query}"
+        Gere uma estratégia de pesquisa incluindo:
+        1. Fontes relevantes a consultar
+        2. Termos de busca específicos
+        3. Critérios de avaliação da informação
+
+        Responda em formato estruturado.
+        """
+
         citations_prompt = f"""
         Com base nas informações encontradas, gere citações relevantes para: "{query}"
         Fontes disponíveis: {[f['source'] for f in findings]}
@@ -203,7 +360,14 @@ class AIGraph:
         Gere 2-3 citações bem fundamentadas.
         """
 
-        citations = self.llm_engine.generate_text(citations_prompt, max_length=400)
+        # Estratégia e citações não dependem uma da outra: uma única decodificação em lote
+        search_strategy, citations = await self.llm_engine.agenerate_many(
+            [search_prompt, citations_prompt],
+            [{"max_length": 300, "length_key": "search_strategy"},
+             {"max_length": 400, "priority": Priority.BACKGROUND, "length_key": "citations"}],
+            system_prompt=get_agent_system_prompt(AgentRole.RESEARCHER),
+        )
+        state["search_strategy"] = search_strategy
         state["citations"] = citations
 
         return state
@@ -226,10 +390,13 @@ class AIGraph:
         Forneça recomendações detalhadas.
         """
 
-        form_analysis = self.llm_engine.generate_text(analysis_prompt, max_length=400)
+        form_analysis = await self.llm_engine.agenerate(
+            analysis_prompt, max_length=400, system_prompt=get_agent_system_prompt(AgentRole.FORM_FILLER)
+        )
         state["form_analysis"] = form_analysis
 
         # Simular preenchimento (em produção usaria MCP)
+        await gated("fill_form")
         state["filled_fields"] = [
             {"field": "nome", "value": "João Silva", "status": "success"},
             {"field": "cpf", "value": "123.456.789-00", "status": "success"}
@@ -255,10 +422,13 @@ class AIGraph:
         Gere um plano detalhado de execução.
         """
 
-        automation_plan = self.llm_engine.generate_text(automation_prompt, max_length=500)
+        automation_plan = await self.llm_engine.agenerate(
+            automation_prompt, max_length=500, system_prompt=get_agent_system_prompt(AgentRole.AUTOMATIONS)
+        )
         state["automation_plan"] = automation_plan
 
         # Simular execução (em produção usaria MCP)
+        await gated("run_automation")
         state["automation_steps"] = [
             {"step": 1, "action": "open_tab", "status": "completed"},
             {"step": 2, "action": "fill_form", "status": "completed"},
@@ -282,7 +452,9 @@ class AIGraph:
         Forneça orientações claras e práticas.
         """
 
-        overlay_suggestions = self.llm_engine.generate_text(overlay_prompt, max_length=300)
+        overlay_suggestions = await self.llm_engine.agenerate(
+            overlay_prompt, max_length=300, system_prompt=get_agent_system_prompt(AgentRole.OVERLAY)
+        )
         state["overlay_suggestions"] = overlay_suggestions
 
         return state
@@ -4,22 +4,46 @@ Especializado em conversação inteligente com capacidades de pesquisa web.
 """
 
 from __future__ import annotations
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, AsyncIterator
 import asyncio
 import json
+import time
 from datetime import datetime
 
+import numpy as np
+
 from ...llm.engine import LLMEngine
+from ...llm.semantic_cache import SemanticCache
+from ...llm.executor import InferenceQueueFull
+from ...llm.priority import Priority
+from ...llm.prompt_builder import (
+    PromptBuilder, PackedPrompt, PRIORITY_QUESTION, PRIORITY_RAG, PRIORITY_HISTORY, PRIORITY_WEB
+)
 from ...embeddings.embedding import ONNXEmbedder
 from ...vectorstore.faiss_store import LocalFaiss
 from ...npu_monitor import npu_monitor, monitor_inference
 from ...security.policies import Policy
 from ...audit.evidence import EvidencePack
 from ...tools.web_scraper import ARMCompatibleWebScraper
+from ...settings import settings
 
 import logging
 logger = logging.getLogger(__name__)
 
+# System prompt fixo do chatbot: vai como mensagem de sistema para que o
+# LLMEngine reaproveite o prefill entre chamadas (ver register_prefix)
+CHATBOT_SYSTEM_PROMPT = """Você é um assistente inteligente especializado em operações bancárias e corporativas do Itaú.
+Use o contexto fornecido para dar respostas precisas, personalizadas e úteis.
+
+INSTRUÇÕES:
+- Seja sempre educado e profissional
+- Use o contexto do usuário para personalizar respostas quando relevante
+- Cite fontes quando usar informações externas
+- Mantenha privacidade e conformidade com LGPD
+- Se não souber algo, admita honestamente
+"""
+
 
 class ChatbotAgent:
     """Agente de chatbot com RAG e busca na internet"""
@@ -30,10 +54,27 @@ class ChatbotAgent:
         self.embeddings = embedding_service
         self.vector_store = vector_store
         self.conversation_history: List[Dict[str, str]] = []
+        # Históricos por conversation_id (conversation_history é a conversa padrão),
+        # com o mesmo despejo LRU/TTL das sessões de KV do LLM
+        self.conversation_histories: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self._history_used: Dict[str, float] = {}
+        self.max_conversations = settings.llm_session_max_sessions
+        self.conversation_ttl_seconds = settings.llm_session_ttl_seconds
         self.max_history_length = 10
+        self.llm.register_prefix(CHATBOT_SYSTEM_PROMPT)
+
+        # Respostas de perguntas parafraseadas (FAQ) sem passar pelo RAG/LLM
+        self.semantic_cache: Optional[SemanticCache] = None
+        if settings.llm_semantic_cache_enabled:
+            self.semantic_cache = SemanticCache(
+                threshold=settings.llm_semantic_cache_threshold,
+                ttl_seconds=settings.llm_semantic_cache_ttl_seconds,
+                max_entries=settings.llm_semantic_cache_max_entries
+            )
 
     async def chat(self, message: str, user_context: Optional[Dict[str, Any]] = None,
-                   enable_web_search: bool = True, first_access: bool = False) -> Dict[str, Any]:
+                   enable_web_search: bool = True, first_access: bool = False,
+                   conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Processa uma mensagem de chat com RAG e busca na internet opcional
 
@@ -42,6 +83,7 @@ class ChatbotAgent:
             user_context: Contexto do usuário do RAG
             enable_web_search: Se deve usar busca na internet
             first_access: Se é o primeiro acesso do usuário
+            conversation_id: ID da conversa (histórico e sessão de KV no LLM)
 
         Returns:
             Resposta com métricas de performance
@@ -51,70 +93,53 @@ class ChatbotAgent:
         # Verificar se é primeiro acesso
         if first_access or self._is_first_access_message(message):
             logger.info("🎯 Primeiro acesso detectado no chatbot")
-            return {
-                "response": "Olá! Bem-vindo ao sistema Itaú. Vou iniciar seu processo de onboarding para personalizar sua experiência.",
-                "first_access_detected": True,
-                "processing_time_seconds": 0.01,
-                "npu_metrics": {
-                    "utilization_percent": npu_monitor.get_current_metrics().utilization_percent,
-                    "memory_used_mb": npu_monitor.get_current_metrics().memory_used_mb,
-                    "temperature_celsius": npu_monitor.get_current_metrics().temperature_celsius,
-                    "power_consumption_watts": npu_monitor.get_current_metrics().power_consumption_watts,
-                    "inference_time_ms": npu_monitor.get_current_metrics().inference_time_ms,
-                    "timestamp": npu_monitor.get_current_metrics().timestamp,
-                    "performance_score": 75.0  # Valor padrão para compatibilidade
-                },
-                "rag_context_used": False,
-                "web_search_performed": False
-            }
+            return self._first_access_result()
 
         # Monitora uso da NPU durante a inferência
         with monitor_inference():
             try:
-                # 1. Busca contexto relevante no RAG (incluindo contexto do usuário)
-                rag_context = await self._get_rag_context(message, user_context)
-
-                # 2. Personalizar resposta com contexto do usuário se disponível
-                personalized_context = ""
-                if user_context:
-                    personalized_context = self._build_personalized_context(user_context)
-
-                # 3. Decide se precisa de busca na internet
-                needs_web_search = await self._should_search_web(message, rag_context)
-
-                web_results = []
-                if enable_web_search and needs_web_search and CRAWL4AI_AVAILABLE:
-                    web_results = await self._search_web(message)
+                # 0. Pergunta já respondida (cache semântico)
+                message_embedding = self._embed_message(message)
+                cacheable = self._is_semantic_cacheable(message_embedding, conversation_id)
+                if cacheable:
+                    cached = self._lookup_semantic_cache(message_embedding, user_context)
+                    if cached is not None:
+                        self._update_conversation_history(message, cached["response"], conversation_id)
+                        return self._semantic_cache_result(cached, start_time, conversation_id)
+
+                # 1-3. Busca contexto no RAG e, se necessário, na internet
+                rag_context, web_results = await self._gather_context(
+                    message, user_context, enable_web_search, message_embedding
+                )
 
                 # 3. Gera resposta usando LLM
-                response = await self._generate_response(message, rag_context, web_results)
+                response, packed = await self._generate_response(message, rag_context, web_results, conversation_id)
 
                 # 4. Atualiza histórico de conversa
-                self._update_conversation_history(message, response)
+                self._update_conversation_history(message, response, conversation_id)
+                truncated = getattr(response, "truncated", False)
+                if cacheable and not web_results and not truncated:
+                    self._store_semantic_cache(message_embedding, message, response, user_context)
 
                 # 5. Coleta métricas de performance
                 end_time = asyncio.get_event_loop().time()
                 processing_time = end_time - start_time
 
-                npu_report = npu_monitor.get_performance_report()
-
                 return {
                     "response": response,
                     "rag_context_used": bool(rag_context),
                     "web_search_performed": bool(web_results),
+                    "prompt_packing": packed.to_dict(),
+                    "truncated": truncated,
                     "processing_time_seconds": processing_time,
-                    "npu_metrics": {
-                        "performance_score": npu_report.get("performance_score", 50.0),
-                        "average_metrics_1min": {
-                            "avg_utilization_percent": getattr(npu_report.get("average_metrics_1min", {}).get("avg_utilization_percent", None), 'utilization_percent', 0.0) if npu_report.get("average_metrics_1min") else 0.0,
-                            "avg_memory_used_mb": getattr(npu_report.get("average_metrics_1min", {}).get("avg_memory_used_mb", None), 'memory_used_mb', 0.0) if npu_report.get("average_metrics_1min") else 0.0,
-                        },
-                        "optimization_suggestions": npu_report.get("optimization_suggestions", [])
-                    },
-                    "conversation_length": len(self.conversation_history),
+                    "npu_metrics": self._collect_npu_metrics(),
+                    "conversation_length": len(self._get_history(conversation_id)),
                     "timestamp": datetime.now().isoformat()
                 }
 
+            except InferenceQueueFull:
+                # Sobrecarga: deixa a API responder 503 em vez de uma resposta de erro
+                raise
             except Exception as e:
                 logger.error(f"Chatbot error: {e}")
                 return {
@@ -131,11 +156,192 @@ class ChatbotAgent:
                     }
                 }
 
-    async def _get_rag_context(self, message: str, user_context: Optional[Dict[str, Any]] = None) -> List[str]:
+    async def chat_stream(self, message: str, user_context: Optional[Dict[str, Any]] = None,
+                          enable_web_search: bool = True, first_access: bool = False,
+                          conversation_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versão em streaming de ``chat``.
+
+        Produz eventos ``{"type": "token", "content": ...}`` à medida que o LLM
+        gera a resposta e, ao final, um evento ``{"type": "done", ...}`` com os
+        mesmos metadados retornados por ``chat``.
+        """
+        start_time = asyncio.get_event_loop().time()
+
+        if first_access or self._is_first_access_message(message):
+            logger.info("🎯 Primeiro acesso detectado no chatbot")
+            result = self._first_access_result()
+            yield {"type": "token", "content": result["response"]}
+            yield {"type": "done", **result}
+            return
+
+        with monitor_inference():
+            try:
+                message_embedding = self._embed_message(message)
+                cacheable = self._is_semantic_cacheable(message_embedding, conversation_id)
+                if cacheable:
+                    cached = self._lookup_semantic_cache(message_embedding, user_context)
+                    if cached is not None:
+                        self._update_conversation_history(message, cached["response"], conversation_id)
+                        result = self._semantic_cache_result(cached, start_time, conversation_id)
+                        yield {"type": "token", "content": result["response"]}
+                        yield {"type": "done", **result}
+                        return
+
+                rag_context, web_results = await self._gather_context(
+                    message, user_context, enable_web_search, message_embedding
+                )
+
+                packed, llm_kwargs = self._prepare_generation(
+                    message, rag_context, web_results, conversation_id
+                )
+
+                chunks: List[str] = []
+                outcome: Dict[str, Any] = {}
+                async for chunk in self.llm.generate_stream(prompt=packed.text, outcome=outcome, **llm_kwargs):
+                    chunks.append(chunk)
+                    yield {"type": "token", "content": chunk}
+
+                response = "".join(chunks).strip()
+                truncated = outcome.get("truncated", False)
+                self._update_conversation_history(message, response, conversation_id)
+                # Resposta interrompida não vira resposta canônica do FAQ
+                if cacheable and not web_results and not truncated:
+                    self._store_semantic_cache(message_embedding, message, response, user_context)
+
+                yield {
+                    "type": "done",
+                    "response": response,
+                    "rag_context_used": bool(rag_context),
+                    "web_search_performed": bool(web_results),
+                    "prompt_packing": packed.to_dict(),
+                    "truncated": truncated,
+                    "processing_time_seconds": asyncio.get_event_loop().time() - start_time,
+                    "npu_metrics": self._collect_npu_metrics(),
+                    "conversation_length": len(self._get_history(conversation_id)),
+                    "timestamp": datetime.now().isoformat()
+                }
+
+            except Exception as e:
+                logger.error(f"Chatbot stream error: {e}")
+                yield {
+                    "type": "error",
+                    "response": "Desculpe, ocorreu um erro no processamento. Tente novamente.",
+                    "error": str(e),
+                    "processing_time_seconds": asyncio.get_event_loop().time() - start_time
+                }
+
+    async def _gather_context(self, message: str, user_context: Optional[Dict[str, Any]],
+                              enable_web_search: bool, message_embedding: Optional[np.ndarray] = None):
+        """Busca contexto no RAG e, quando necessário, resultados da internet"""
+        # 1. Busca contexto relevante no RAG (incluindo contexto do usuário)
+        rag_context = await self._get_rag_context(message, user_context, message_embedding)
+
+        # 2. Decide se precisa de busca na internet
+        needs_web_search = await self._should_search_web(message, rag_context)
+
+        web_results = []
+        if enable_web_search and needs_web_search and CRAWL4AI_AVAILABLE:
+            web_results = await self._search_web(message)
+
+        return rag_context, web_results
+
+    def _first_access_result(self) -> Dict[str, Any]:
+        """Resposta padrão para primeiro acesso (sem passar pelo LLM)"""
+        current = npu_monitor.get_current_metrics()
+        return {
+            "response": "Olá! Bem-vindo ao sistema Itaú. Vou iniciar seu processo de onboarding para personalizar sua experiência.",
+            "first_access_detected": True,
+            "processing_time_seconds": 0.01,
+            "npu_metrics": {
+                "utilization_percent": current.utilization_percent,
+                "memory_used_mb": current.memory_used_mb,
+                "temperature_celsius": current.temperature_celsius,
+                "power_consumption_watts": current.power_consumption_watts,
+                "inference_time_ms": current.inference_time_ms,
+                "timestamp": current.timestamp,
+                "performance_score": 75.0  # Valor padrão para compatibilidade
+            },
+            "rag_context_used": False,
+            "web_search_performed": False,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _embed_message(self, message: str) -> Optional[np.ndarray]:
+        """Embedding da mensagem (compartilhado entre cache semântico e RAG)"""
+        try:
+            return self.embeddings.embed([message])[0]
+        except Exception as e:
+            logger.error(f"Embedding error: {e}")
+            return None
+
+    def _is_semantic_cacheable(self, message_embedding: Optional[np.ndarray],
+                               conversation_id: Optional[str]) -> bool:
+        """Só perguntas de abertura: com histórico, a resposta depende da conversa"""
+        return (
+            self.semantic_cache is not None
+            and message_embedding is not None
+            and not self._get_history(conversation_id)
+        )
+
+    def _semantic_cache_scope(self, user_context: Optional[Dict[str, Any]]) -> str:
+        """Campos do contexto do usuário que entram no prompt (ver _get_rag_context)"""
+        user_context = user_context or {}
+        return json.dumps(
+            {key: user_context.get(key) for key in ("name", "role", "preferences")},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+
+    def _lookup_semantic_cache(self, message_embedding: np.ndarray,
+                               user_context: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        return self.semantic_cache.lookup(
+            message_embedding,
+            scope=self._semantic_cache_scope(user_context),
+            corpus_version=getattr(self.vector_store, "version", 0)
+        )
+
+    def _store_semantic_cache(self, message_embedding: np.ndarray, message: str, response: str,
+                              user_context: Optional[Dict[str, Any]]):
+        self.semantic_cache.store(
+            message_embedding, message, response,
+            scope=self._semantic_cache_scope(user_context),
+            corpus_version=getattr(self.vector_store, "version", 0)
+        )
+
+    def _semantic_cache_result(self, cached: Dict[str, Any], start_time: float,
+                               conversation_id: Optional[str]) -> Dict[str, Any]:
+        """Resposta vinda do cache semântico (mesmo formato de ``chat``)"""
+        logger.info(f"💾 Cache semântico: '{cached['question'][:60]}' (similaridade {cached['similarity']:.3f})")
+        return {
+            "response": cached["response"],
+            "rag_context_used": False,
+            "web_search_performed": False,
+            "semantic_cache_hit": True,
+            "processing_time_seconds": asyncio.get_event_loop().time() - start_time,
+            "npu_metrics": self._collect_npu_metrics(),
+            "conversation_length": len(self._get_history(conversation_id)),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _collect_npu_metrics(self) -> Dict[str, Any]:
+        """Coleta métricas de performance da NPU para a resposta"""
+        npu_report = npu_monitor.get_performance_report()
+        return {
+            "performance_score": npu_report.get("performance_score", 50.0),
+            "average_metrics_1min": {
+                "avg_utilization_percent": getattr(npu_report.get("average_metrics_1min", {}).get("avg_utilization_percent", None), 'utilization_percent', 0.0) if npu_report.get("average_metrics_1min") else 0.0,
+                "avg_memory_used_mb": getattr(npu_report.get("average_metrics_1min", {}).get("avg_memory_used_mb", None), 'memory_used_mb', 0.0) if npu_report.get("average_metrics_1min") else 0.0,
+            },
+            "optimization_suggestions": npu_report.get("optimization_suggestions", [])
+        }
+
+    async def _get_rag_context(self, message: str, user_context: Optional[Dict[str, Any]] = None,
+                               message_embedding: Optional[np.ndarray] = None) -> List[str]:
         """Busca contexto relevante no RAG"""
         try:
-            # Gera embedding da mensagem (método síncrono)
-            message_embedding = self.embeddings.embed([message])[0]
+            # Gera embedding da mensagem (método síncrono), se ainda não calculado
+            if message_embedding is None:
+                message_embedding = self.embeddings.embed([message])[0]
 
             # Busca documentos similares no vector store (método síncrono)
             search_results = self.vector_store.search(message_embedding.reshape(1, -1), k=5)
@@ -227,81 +433,141 @@ class ChatbotAgent:
             return []
 
     async def _generate_response(self, message: str, rag_context: List[str],
-                                web_results: List[Dict[str, Any]]) -> str:
+                                web_results: List[Dict[str, Any]],
+                                conversation_id: Optional[str] = None):
         """Gera resposta usando LLM com contexto RAG e web"""
+        packed, llm_kwargs = self._prepare_generation(message, rag_context, web_results, conversation_id)
 
-        # Prepara prompt com contexto
-        system_prompt = """Você é um assistente inteligente especializado em operações bancárias e corporativas do Itaú.
-        Use o contexto fornecido para dar respostas precisas, personalizadas e úteis.
+        # Gera resposta usando LLM (assíncrono)
+        # Já sem espaços nas pontas; GenerationResult indica se foi truncada
+        response = await self.llm.agenerate(prompt=packed.text, **llm_kwargs)
 
-        INSTRUÇÕES:
-        - Seja sempre educado e profissional
-        - Use o contexto do usuário para personalizar respostas quando relevante
-        - Cite fontes quando usar informações externas
-        - Mantenha privacidade e conformidade com LGPD
-        - Se não souber algo, admita honestamente
-        """
+        return response, packed
 
-        # Adiciona contexto RAG
-        context_text = ""
-        if rag_context:
-            context_text = "\n\nCONTEXTO RELEVANTE:\n" + "\n".join(f"- {ctx}" for ctx in rag_context[:3])
+    def _prepare_generation(self, message: str, rag_context: List[str],
+                            web_results: List[Dict[str, Any]],
+                            conversation_id: Optional[str] = None):
+        """
+        Monta o prompt (dentro do orçamento de tokens) e os parâmetros do LLM.
 
-        # Adiciona resultados da web
-        if web_results:
-            context_text += "\n\nINFORMAÇÕES DA WEB:\n"
-            for result in web_results:
-                context_text += f"- Fonte: {result['source']}\n  {result['content'][:500]}...\n"
+        Com ``conversation_id``, o histórico não é colado no prompt: o LLMEngine
+        mantém a sessão da conversa (KV retido) e recebe as últimas mensagens
+        apenas para reconstruí-la quando necessário.
+        """
+        llm_kwargs: Dict[str, Any] = {
+            # Orçamento de resposta explícito; o prompt tem orçamento próprio
+            "max_new_tokens": 200,
+            "temperature": 0.7,
+            "system_prompt": CHATBOT_SYSTEM_PROMPT,
+            # Conversa com o usuário: gerações em segundo plano cedem a vez
+            "priority": Priority.INTERACTIVE,
+            # Rótulo na telemetria de geração (TTFT/TPOT por chamador)
+            "caller": "chatbot"
+        }
 
-        # Adiciona histórico da conversa
-        history_text = ""
-        if self.conversation_history:
-            history_text = "\n\nHISTÓRICO DA CONVERSA:\n"
-            for i, msg in enumerate(self.conversation_history[-4:]):  # Últimas 4 mensagens
-                role = "Usuário" if i % 2 == 0 else "Assistente"
-                history_text += f"{role}: {msg['content']}\n"
+        history = self._get_history(conversation_id)[-4:]  # Últimas 4 mensagens
+        if conversation_id:
+            llm_kwargs["conversation_id"] = conversation_id
+            llm_kwargs["history"] = [{"role": msg["role"], "content": msg["content"]} for msg in history]
+            return self._build_prompt(message, rag_context, web_results, []), llm_kwargs
 
-        # Monta prompt completo
-        full_prompt = f"{system_prompt}{context_text}{history_text}\n\nUsuário: {message}\n\nAssistente:"
+        return self._build_prompt(message, rag_context, web_results, history), llm_kwargs
 
-        # Gera resposta usando LLM (assíncrono)
-        response = await asyncio.to_thread(
-            self.llm.generate_text,
-            prompt=full_prompt,
-            max_length=300,  # Aumentado para acomodar prompts maiores
-            temperature=0.7
-        )
+    def _build_prompt(self, message: str, rag_context: List[str],
+                      web_results: List[Dict[str, Any]],
+                      history: List[Dict[str, str]]) -> PackedPrompt:
+        """
+        Monta o prompt completo com contexto RAG, web e histórico.
 
-        return response.strip()
+        O orçamento é preenchido na ordem pergunta > RAG > histórico > web;
+        trechos que não cabem são truncados em fronteira de token ou descartados.
+        """
+        history_lines = [
+            f"{'Usuário' if i % 2 == 0 else 'Assistente'}: {msg['content']}"
+            for i, msg in enumerate(history)
+        ]
 
-    def _update_conversation_history(self, user_message: str, assistant_response: str):
+        builder = PromptBuilder(self.llm, settings.llm_prompt_budget_tokens, CHATBOT_SYSTEM_PROMPT)
+        builder.add("rag", rag_context, PRIORITY_RAG,
+                    header="\n\nCONTEXTO RELEVANTE:", template="\n- {}")
+        builder.add("web", [f"Fonte: {r['source']}\n  {r['content']}" for r in web_results], PRIORITY_WEB,
+                    header="\n\nINFORMAÇÕES DA WEB:", template="\n- {}")
+        builder.add("history", history_lines, PRIORITY_HISTORY,
+                    header="\n\nHISTÓRICO DA CONVERSA:", template="\n{}", keep="tail")
+        builder.add("question", [message], PRIORITY_QUESTION,
+                    template="\n\nUsuário: {}\n\nAssistente:", required=True)
+
+        packed = builder.build()
+        packed.text = packed.text.lstrip()
+        return packed
+
+    def _get_history(self, conversation_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Histórico da conversa (sem ID: conversa padrão); só leitura, não cria a conversa"""
+        if not conversation_id:
+            return self.conversation_history
+        self._purge_expired_histories()
+        return self.conversation_histories.get(conversation_id, [])
+
+    def _history_for_update(self, conversation_id: Optional[str]) -> List[Dict[str, str]]:
+        """Histórico a ser atualizado (cria a conversa, despejando a menos usada)"""
+        if not conversation_id:
+            return self.conversation_history
+        self._purge_expired_histories()
+        history = self.conversation_histories.get(conversation_id)
+        if history is None:
+            while len(self.conversation_histories) >= max(1, self.max_conversations):
+                oldest, _ = self.conversation_histories.popitem(last=False)
+                self._history_used.pop(oldest, None)
+            history = self.conversation_histories[conversation_id] = []
+        self.conversation_histories.move_to_end(conversation_id)
+        self._history_used[conversation_id] = time.time()
+        return history
+
+    def _purge_expired_histories(self):
+        if not self.conversation_ttl_seconds:
+            return
+        cutoff = time.time() - self.conversation_ttl_seconds
+        for conversation_id in [c for c, used in self._history_used.items() if used < cutoff]:
+            self.conversation_histories.pop(conversation_id, None)
+            del self._history_used[conversation_id]
+
+    def _update_conversation_history(self, user_message: str, assistant_response: str,
+                                     conversation_id: Optional[str] = None):
         """Atualiza histórico de conversa"""
-        self.conversation_history.append({"role": "user", "content": user_message})
-        self.conversation_history.append({"role": "assistant", "content": assistant_response})
+        history = self._history_for_update(conversation_id)
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": assistant_response})
 
         # Mantém apenas as últimas mensagens
-        if len(self.conversation_history) > self.max_history_length * 2:
-            self.conversation_history = self.conversation_history[-self.max_history_length * 2:]
-
-    def clear_conversation_history(self):
-        """Limpa histórico de conversa"""
-        self.conversation_history.clear()
-
-    def get_conversation_summary(self) -> Dict[str, Any]:
+        if len(history) > self.max_history_length * 2:
+            del history[:-self.max_history_length * 2]
+
+    def clear_conversation_history(self, conversation_id: Optional[str] = None):
+        """Limpa histórico de conversa (e a sessão retida no LLM)"""
+        self._get_history(conversation_id).clear()
+        if conversation_id:
+            self.conversation_histories.pop(conversation_id, None)
+            self._history_used.pop(conversation_id, None)
+            self.llm.end_session(conversation_id)
+
+    def get_conversation_summary(self, conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """Retorna resumo da conversa atual"""
+        history = self._get_history(conversation_id)
         return {
-            "total_messages": len(self.conversation_history),
-            "conversation_pairs": len(self.conversation_history) // 2,
-            "last_interaction": self.conversation_history[-1] if self.conversation_history else None,
-            "topics_discussed": self._extract_topics()
+            "total_messages": len(history),
+            "conversation_pairs": len(history) // 2,
+            "last_interaction": history[-1] if history else None,
+            "topics_discussed": self._extract_topics(history)
         }
 
-    def _extract_topics(self) -> List[str]:
+    def _extract_topics(self, history: Optional[List[Dict[str, str]]] = None) -> List[str]:
         """Extrai tópicos discutidos da conversa"""
-        if not self.conversation_history:
+        if history is None:
+            history = self.conversation_history
+        if not history:
             return []
 
-        all_text = " ".join([msg["content"] for msg in self.conversation_history])
+        all_text = " ".join([msg["content"] for msg in history])
         all_text_lower = all_text.lower()
 
         topics = []
@@ -1,7 +1,32 @@
 from __future__ import annotations
 from typing import Dict, Any
+import asyncio
 from ...security.injection_guard import scan_prompt_injection
 from ...security.policies import Policy
+from ...prompts import AgentRole, get_agent_system_prompt
+from ...settings import settings
+from ...llm.priority import Priority
+
+CRITIC_SYSTEM_PROMPT = get_agent_system_prompt(AgentRole.CRITIC)
+
+async def _rejection_reason(llm_engine, query: str) -> str:
+    """Razão curta do veredito REJEITADO (a classificação só devolve o rótulo)"""
+    reason_prompt = f"""
+        A query a seguir foi rejeitada por uma análise de segurança de IA: "{query}"
+
+        Explique a razão em uma frase curta (jailbreak, dados sensíveis, compliance ou exposição de informações).
+        """
+    try:
+        reason = await llm_engine.agenerate(
+            reason_prompt,
+            system_prompt=CRITIC_SYSTEM_PROMPT,
+            max_new_tokens=48,
+            priority=Priority.INTERACTIVE,
+            cache=True
+        )
+        return reason.strip() or "razão não informada"
+    except Exception as e:
+        return f"razão indisponível ({e})"
 
 async def run(state: Dict[str, Any], llm_engine, embedder) -> Dict[str, Any]:
     """
@@ -27,13 +52,22 @@ async def run(state: Dict[str, Any], llm_engine, embedder) -> Dict[str, Any]:
         3. Violação de políticas de compliance
         4. Riscos de exposição de informações
 
-        Responda apenas com: "APROVADO" ou "REJEITADO: [razão]"
+        Responda apenas com: "APROVADO" ou "REJEITADO"
         """
 
         try:
-            risk_assessment = llm_engine.generate_text(risk_analysis_prompt, max_length=100)
-            if "REJEITADO" in risk_assessment:
-                warnings.append(f"Análise LLM: {risk_assessment}")
+            risk_assessment = await llm_engine.aclassify(
+                risk_analysis_prompt, ["APROVADO", "REJEITADO"], mode=settings.llm_classifier_critic,
+                system_prompt=CRITIC_SYSTEM_PROMPT,
+                # Veredito no caminho crítico (o agente pode estar esperando no ActionGate)
+                priority=Priority.INTERACTIVE,
+                cache=True  # Mesma query, mesmo veredito
+            )
+            if risk_assessment is None:
+                # Cancelada, prazo esgotado ou sem rótulo: na dúvida não aprova
+                warnings.append("Análise LLM indisponível")
+            elif risk_assessment == "REJEITADO":
+                warnings.append(f"Análise LLM: REJEITADO: {await _rejection_reason(llm_engine, query)}")
         except Exception as e:
             warnings.append(f"Erro na análise LLM: {str(e)}")
 
@@ -48,8 +82,8 @@ async def run(state: Dict[str, Any], llm_engine, embedder) -> Dict[str, Any]:
     # 4. Verificar embeddings para detectar anomalias
     if embedder and query:
         try:
-            # Gerar embedding da query
-            query_embedding = embedder.embed([query])[0]
+            # Gerar embedding da query (fora do event loop: o agente pode rodar em paralelo)
+            query_embedding = (await asyncio.to_thread(embedder.embed, [query]))[0]
 
             # Verificar se embedding é válido (não todo zeros)
             if query_embedding.sum() == 0:
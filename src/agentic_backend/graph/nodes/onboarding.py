@@ -7,13 +7,21 @@ from datetime import datetime
 import logging
 
 from ...llm.engine import LLMEngine
+from ...llm.priority import Priority
 from ...embeddings.embedding import ONNXEmbedder
 from ...vectorstore.faiss_store import LocalFaiss
 from ...npu_monitor import npu_monitor, monitor_inference
 from ...security.policies import Policy
+from ...prompts import AgentRole, get_agent_system_prompt
+from ...settings import settings
+from ...model_registry import model_registry, acquire_vector_store, vector_store_key
+from ..action_gate import gated
 
 log = logging.getLogger(__name__)
 
+# Índice FAISS dos perfis de usuário
+USER_INDEX_DIR = "./data/user_indexes"
+
 
 class OnboardingAgent:
     """
@@ -31,6 +39,10 @@ class OnboardingAgent:
         self.vector_store = vector_store
         self.conversation_history: List[Dict[str, str]] = []
 
+        # System prompt fixo do agente (prefill reaproveitado pelo LLMEngine)
+        self.system_prompt = get_agent_system_prompt(AgentRole.ONBOARDING)
+        self.llm.register_prefix(self.system_prompt)
+
         # Diretórios para dados de usuários
         self.users_dir = "./data/users"
         self.user_indexes_dir = "./data/user_indexes"
@@ -61,20 +73,20 @@ class OnboardingAgent:
 
         # Detectar intenção usando IA
         with monitor_inference():
-            intent = self._detect_intent(message)
+            intent = await self._detect_intent(message)
 
         # Atualizar estado da conversa
         self.onboarding_state["conversation_context"] += f"\nUsuário: {message}"
 
         # Processar baseado na intenção detectada
         if intent == "first_access":
-            return self._start_onboarding_flow(user_id, message)
+            return await self._start_onboarding_flow(user_id, message)
         elif intent == "continue_onboarding":
-            return self._continue_onboarding_flow(user_id, message)
+            return await self._continue_onboarding_flow(user_id, message)
         elif intent == "already_onboarded":
-            return self._handle_existing_user(user_id)
+            return await self._handle_existing_user(user_id)
         else:
-            return self._handle_general_query(user_id, message, intent)
+            return await self._handle_general_query(user_id, message, intent)
 
     async def _detect_intent(self, message: str) -> str:
         """
@@ -104,18 +116,14 @@ class OnboardingAgent:
         """
 
         try:
-            response = self.llm.generate_text(intent_prompt, max_length=50)
-            response = response.strip().lower()
-
-            # Mapear resposta para intenções válidas
-            if "first_access" in response or "primeiro" in response:
-                return "first_access"
-            elif "continue" in response or "resposta" in response:
-                return "continue_onboarding"
-            elif "already" in response or "perfil" in response:
-                return "already_onboarded"
-            else:
-                return "general_help"
+            # Saída restrita às intenções válidas (sem rótulo reconhecido: ajuda geral)
+            intent = await self.llm.aclassify(
+                intent_prompt,
+                ["first_access", "continue_onboarding", "already_onboarded", "general_help"],
+                mode=settings.llm_classifier_intent,
+                system_prompt=self.system_prompt
+            )
+            return intent or "general_help"
 
         except Exception as e:
             log.warning(f"Erro na detecção de intenção: {e}")
@@ -154,9 +162,9 @@ class OnboardingAgent:
         log.info(f"🚀 Iniciando onboarding para usuário: {user_id}")
 
         # Verificar se já existe perfil
-        if self._user_exists(user_id):
+        if await self._user_exists(user_id):
             # Oferecer carregar perfil existente ou recriar
-            return self._handle_existing_profile_choice(user_id)
+            return await self._handle_existing_profile_choice(user_id)
 
         # Resetar estado do onboarding
         self.onboarding_state = {
@@ -167,7 +175,7 @@ class OnboardingAgent:
         }
 
         # Iniciar com saudação
-        greeting_response = self._generate_greeting_response(user_id)
+        greeting_response = await self._generate_greeting_response(user_id)
 
         return {
             "response": greeting_response,
@@ -185,23 +193,23 @@ class OnboardingAgent:
 
         # Processar resposta baseado na etapa atual
         if current_step == "ask_name":
-            return self._process_name_response(user_id, message)
+            return await self._process_name_response(user_id, message)
         elif current_step == "ask_profession":
-            return self._process_profession_response(user_id, message)
+            return await self._process_profession_response(user_id, message)
         elif current_step == "ask_preferences":
-            return self._process_preferences_response(user_id, message)
+            return await self._process_preferences_response(user_id, message)
         elif current_step == "complete":
-            return self._finalize_onboarding(user_id)
+            return await self._finalize_onboarding(user_id)
         else:
             # Detectar automaticamente o que perguntar
-            return self._generate_next_question(user_id, message)
+            return await self._generate_next_question(user_id, message)
 
     async def _handle_existing_user(self, user_id: str) -> Dict[str, Any]:
         """
         Trata usuário que já tem perfil
         """
-        if self._user_exists(user_id):
-            user_context = self._load_user_context(user_id)
+        if await self._user_exists(user_id):
+            user_context = await self._load_user_context(user_id)
             return {
                 "response": f"Olá! Bem-vindo de volta. Seu perfil já está configurado.",
                 "user_context": user_context,
@@ -253,7 +261,10 @@ class OnboardingAgent:
         Máximo 150 palavras.
         """
 
-        greeting = self.llm.generate_text(greeting_prompt, max_length=150)
+        greeting = await self.llm.agenerate(
+            greeting_prompt, max_length=150, system_prompt=self.system_prompt, task="greeting",
+            length_key="greeting"
+        )
 
         # Adicionar ao histórico
         self.conversation_history.append({"role": "assistant", "content": greeting})
@@ -294,10 +305,13 @@ class OnboardingAgent:
         """
 
         try:
-            next_question = self.llm.generate_text(question_prompt, max_length=100)
+            next_question = await self.llm.agenerate(
+                question_prompt, max_length=100, system_prompt=self.system_prompt, task="onboarding_question",
+                length_key="next_question"
+            )
 
             # Identificar tipo da pergunta para atualizar estado
-            question_type = self._classify_question_type(next_question, collected_info)
+            question_type = await self._classify_question_type(next_question, collected_info)
 
             # Atualizar estado
             self.onboarding_state["current_step"] = question_type
@@ -342,20 +356,16 @@ class OnboardingAgent:
         """
 
         try:
-            response = self.llm.generate_text(classify_prompt, max_length=30)
-            category = response.strip().lower()
-
-            # Mapear para categorias válidas
             valid_categories = [
                 "ask_name", "ask_personal", "ask_profession",
                 "ask_experience", "ask_preferences", "ask_goals", "finalize"
             ]
 
-            for cat in valid_categories:
-                if cat in category:
-                    return cat
-
-            return "ask_general"
+            category = await self.llm.aclassify(
+                classify_prompt, valid_categories, mode=settings.llm_classifier_question_type,
+                system_prompt=self.system_prompt, cache=True
+            )
+            return category or "ask_general"
 
         except Exception as e:
             log.warning(f"Erro na classificação: {e}")
@@ -414,19 +424,21 @@ class OnboardingAgent:
         """
 
         try:
-            extracted_name = self.llm.generate_text(extract_prompt, max_length=50)
+            extracted_name = await self.llm.agenerate(
+                extract_prompt, max_length=50, system_prompt=self.system_prompt, length_key="extract_name"
+            )
             extracted_name = extracted_name.strip()
 
             if "NOME_NAO_ENCONTRADO" in extracted_name:
                 # Pedir novamente
-                return self._ask_for_clarification(user_id, "nome", message)
+                return await self._ask_for_clarification(user_id, "nome", message)
 
             # Salvar nome
             self.onboarding_state["collected_info"]["nome"] = extracted_name
             self.onboarding_state["conversation_context"] += f"\nNome identificado: {extracted_name}"
 
             # Próxima pergunta
-            return self._generate_next_question(user_id, message)
+            return await self._generate_next_question(user_id, message)
 
         except Exception as e:
             log.error(f"Erro ao processar resposta de nome: {e}")
@@ -450,7 +462,9 @@ class OnboardingAgent:
         """
 
         try:
-            response = self.llm.generate_text(extract_prompt, max_length=200)
+            response = await self.llm.agenerate(
+                extract_prompt, max_length=200, system_prompt=self.system_prompt, length_key="extract_profession"
+            )
 
             # Tentar extrair JSON
             import re
@@ -490,7 +504,9 @@ class OnboardingAgent:
         """
 
         try:
-            response = self.llm.generate_text(extract_prompt, max_length=200)
+            response = await self.llm.agenerate(
+                extract_prompt, max_length=200, system_prompt=self.system_prompt, length_key="extract_preferences"
+            )
 
             # Tentar extrair JSON
             import re
@@ -525,7 +541,10 @@ class OnboardingAgent:
         """
 
         try:
-            clarification = self.llm.generate_text(clarification_prompt, max_length=100)
+            clarification = await self.llm.agenerate(
+                clarification_prompt, max_length=100, system_prompt=self.system_prompt, task="onboarding_question",
+                length_key="clarification"
+            )
 
             return {
                 "response": clarification.strip(),
@@ -568,17 +587,32 @@ class OnboardingAgent:
         # Criar perfil completo
         profile = self._create_complete_profile(user_id)
 
-        # Salvar perfil
-        self._save_user_profile(profile)
+        # Padrões de uso, resumo de contexto e mensagem de conclusão só dependem
+        # do perfil coletado: uma única decodificação em lote
+        patterns_text, context_summary, completion_message = await self.llm.agenerate_many(
+            [
+                self._usage_patterns_prompt(profile["professional_info"], profile["preferences"]),
+                self._context_summary_prompt(profile),
+                self._completion_prompt(profile),
+            ],
+            [
+                {"max_length": 400, "priority": Priority.BACKGROUND, "length_key": "usage_patterns"},
+                {"max_length": 100, "length_key": "context_summary"},
+                {"max_length": 200, "length_key": "completion"},
+            ],
+            system_prompt=self.system_prompt,
+        )
+        profile["usage_patterns"] = self._parse_usage_patterns(patterns_text)
+
+        # Salvar perfil (efeito colateral: só após o veredito do Critic)
+        await gated("save_profile")
+        await self._save_user_profile(profile)
 
         # Indexar no FAISS
-        self._index_user_profile(profile)
+        await self._index_user_profile(profile)
 
         # Preparar contexto para outros agentes
-        user_context = self._prepare_user_context(profile)
-
-        # Mensagem de conclusão
-        completion_message = self._generate_completion_message(profile)
+        user_context = await self._prepare_user_context(profile, context_summary)
 
         return {
             "response": completion_message,
@@ -589,9 +623,10 @@ class OnboardingAgent:
             "requires_user_input": False
         }
 
-    async def _create_complete_profile(self, user_id: str) -> Dict[str, Any]:
+    def _create_complete_profile(self, user_id: str) -> Dict[str, Any]:
         """
         Cria perfil completo baseado nas informações coletadas
+        (``usage_patterns`` é preenchido em ``_finalize_onboarding``)
         """
         collected = self.onboarding_state["collected_info"]
 
@@ -618,10 +653,7 @@ class OnboardingAgent:
                 "formato_preferido": collected.get("formato_preferido", ""),
                 "horario_pico": collected.get("horario_pico", "")
             },
-            "usage_patterns": self._estimate_usage_patterns(
-                profile["professional_info"],
-                profile["preferences"]
-            ),
+            "usage_patterns": {},
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat(),
             "onboarding_version": "3.0",  # Versão com IA real completa
@@ -631,9 +663,9 @@ class OnboardingAgent:
 
         return profile
 
-    async def _estimate_usage_patterns(self, professional_info: Dict, preferences: Dict) -> Dict[str, Any]:
-        """Estima padrões de uso usando LLM"""
-        patterns_prompt = f"""
+    def _usage_patterns_prompt(self, professional_info: Dict, preferences: Dict) -> str:
+        """Prompt de estimativa de padrões de uso"""
+        return f"""
         Você é analista de comportamento de usuários Itaú.
         Com base neste perfil profissional:
 
@@ -652,39 +684,31 @@ class OnboardingAgent:
         Formate como JSON válido.
         """
 
+    def _parse_usage_patterns(self, patterns_text: str) -> Dict[str, Any]:
+        """Extrai o JSON de padrões de uso da resposta do LLM"""
         try:
-            patterns_text = self.llm.generate_text(patterns_prompt, max_length=400)
-
             # Tentar extrair JSON da resposta
             import re
             json_match = re.search(r'\{.*\}', patterns_text, re.DOTALL)
             if json_match:
-                patterns = json.loads(json_match.group())
-            else:
-                # Fallback
-                patterns = {
-                    "frequencia_uso": "diario",
-                    "tipo_operacoes": ["pesquisa_regulatoria"],
-                    "prioridades": ["conformidade"],
-                    "horarios_atividade": ["09:00-18:00"]
-                }
+                return json.loads(json_match.group())
 
         except Exception as e:
             log.warning(f"Erro ao estimar padrões: {e}")
-            patterns = {
-                "frequencia_uso": "diario",
-                "tipo_operacoes": ["pesquisa_regulatoria"],
-                "prioridades": ["conformidade"],
-                "horarios_atividade": ["09:00-18:00"]
-            }
 
-        return patterns
+        # Fallback
+        return {
+            "frequencia_uso": "diario",
+            "tipo_operacoes": ["pesquisa_regulatoria"],
+            "prioridades": ["conformidade"],
+            "horarios_atividade": ["09:00-18:00"]
+        }
 
-    async def _generate_completion_message(self, profile: Dict) -> str:
+    def _completion_prompt(self, profile: Dict) -> str:
         """
-        Gera mensagem de conclusão personalizada
+        Prompt da mensagem de conclusão personalizada
         """
-        completion_prompt = f"""
+        return f"""
         Você é assistente Itaú. O usuário {profile["personal_info"]["nome"]}
         ({profile["professional_info"]["cargo"]} da área {profile["professional_info"]["area"]})
         acabou de completar o onboarding.
@@ -699,9 +723,6 @@ class OnboardingAgent:
         Máximo 200 palavras.
         """
 
-        completion = self.llm.generate_text(completion_prompt, max_length=200)
-        return completion.strip()
-
     async def _save_user_profile(self, profile: Dict[str, Any]):
         """Salva perfil do usuário em arquivo JSON"""
         user_file = f"{self.users_dir}/{profile['user_id']}.json"
@@ -791,21 +812,32 @@ class OnboardingAgent:
 
         return documents
 
-    async def _prepare_user_context(self, profile: Dict) -> Dict[str, Any]:
-        """Prepara contexto do usuário para outros agentes"""
+    async def _prepare_user_context(self, profile: Dict, context_summary: Optional[str] = None) -> Dict[str, Any]:
+        """Prepara contexto do usuário para outros agentes (gera o resumo se não for informado)"""
+        if context_summary is None:
+            context_summary = await self._generate_context_summary(profile)
+
         return {
             "user_id": profile["user_id"],
             "personal_info": profile["personal_info"],
             "professional_info": profile["professional_info"],
             "preferences": profile["preferences"],
             "usage_patterns": profile["usage_patterns"],
-            "context_summary": self._generate_context_summary(profile),
+            "context_summary": context_summary,
             "last_updated": profile["updated_at"]
         }
 
     async def _generate_context_summary(self, profile: Dict) -> str:
         """Gera resumo inteligente do contexto usando LLM"""
-        summary_prompt = f"""
+        summary = await self.llm.agenerate(
+            self._context_summary_prompt(profile), max_length=100, system_prompt=self.system_prompt,
+            task="short_summary", length_key="context_summary"
+        )
+        return summary.strip()
+
+    def _context_summary_prompt(self, profile: Dict) -> str:
+        """Prompt do resumo de contexto do perfil"""
+        return f"""
         Você é assistente Itaú especializado em análise de perfis de usuário.
         Crie um resumo executivo conciso do perfil deste usuário:
 
@@ -819,9 +851,6 @@ class OnboardingAgent:
         Máximo 200 caracteres.
         """
 
-        summary = self.llm.generate_text(summary_prompt, max_length=100)
-        return summary.strip()
-
     async def _user_exists(self, user_id: str) -> bool:
         """Verifica se usuário já tem perfil salvo"""
         user_file = f"{self.users_dir}/{user_id}.json"
@@ -844,11 +873,11 @@ class OnboardingAgent:
         Método principal para outros agentes obterem contexto do usuário.
         Inclui busca inteligente no RAG se houver query.
         """
-        if not self._user_exists(user_id):
+        if not await self._user_exists(user_id):
             return {"error": "Usuário não encontrado"}
 
         # Carregar perfil básico
-        context = self._load_user_context(user_id)
+        context = await self._load_user_context(user_id)
 
         # Se há query, fazer busca inteligente no RAG
         if query and self.vector_store:
@@ -878,24 +907,24 @@ async def run(state: Dict[str, Any], llm_engine: LLMEngine, embedder: ONNXEmbedd
     """
     Função principal do Onboarding Agent - ponto de entrada para o graph
     """
-    # Inicializar componentes de IA
-    vector_store = LocalFaiss(dim=768, index_dir="./data/user_indexes")
-
-    # Criar agente de onboarding
-    onboarding_agent = OnboardingAgent(llm_engine, embedder, vector_store)
+    # Índice de perfis compartilhado entre chamadas (carregado uma vez pelo registro)
+    vector_store = acquire_vector_store(USER_INDEX_DIR)
+    try:
+        # Criar agente de onboarding
+        onboarding_agent = OnboardingAgent(llm_engine, embedder, vector_store)
 
-    # Processar mensagem do usuário
-    user_id = state.get("user_id", "unknown_user")
-    message = state.get("message", "")
+        # Processar mensagem do usuário
+        user_id = state.get("user_id", "unknown_user")
+        message = state.get("message", "")
 
-    if not message and not state.get("first_access", False):
-        return {
-            "response": "Olá! Como posso ajudar você hoje?",
-            "onboarding_status": "general_help",
-            "user_id": user_id
-        }
-
-    # Processar a mensagem
-    result = await onboarding_agent.process_message(user_id, message)
+        if not message and not state.get("first_access", False):
+            return {
+                "response": "Olá! Como posso ajudar você hoje?",
+                "onboarding_status": "general_help",
+                "user_id": user_id
+            }
 
-    return result
+        # Processar a mensagem
+        return await onboarding_agent.process_message(user_id, message)
+    finally:
+        model_registry.release(vector_store_key(USER_INDEX_DIR))
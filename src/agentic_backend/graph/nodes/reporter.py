@@ -1,9 +1,13 @@
 from __future__ import annotations
 from typing import Dict, Any
 from ...audit.evidence import EvidencePack
+from ...prompts import AgentRole, get_agent_system_prompt
+from ...llm.priority import Priority
 import json
 from datetime import datetime
 
+REPORTER_SYSTEM_PROMPT = get_agent_system_prompt(AgentRole.REPORTER)
+
 async def run(state: Dict[str, Any], llm_engine) -> Dict[str, Any]:
     """
     Reporter Agent com IA real - gera relatórios inteligentes e evidências.
@@ -32,12 +36,6 @@ async def run(state: Dict[str, Any], llm_engine) -> Dict[str, Any]:
     Mantenha tom profissional e conciso.
     """
 
-    try:
-        executive_summary = llm_engine.generate_text(summary_prompt, max_length=500)
-        state["executive_summary"] = executive_summary
-    except Exception as e:
-        state["executive_summary"] = f"Erro ao gerar resumo: {str(e)}"
-
     # 2. Gerar relatório técnico detalhado
     technical_report = {
         "timestamp": datetime.now().isoformat(),
@@ -52,6 +50,9 @@ async def run(state: Dict[str, Any], llm_engine) -> Dict[str, Any]:
         "status": "success" if not state.get("error") else "error"
     }
 
+    prompts = [summary_prompt]
+    options = [{"max_length": 500, "length_key": "executive_summary"}]
+
     # Usar LLM para analisar métricas de performance
     if technical_report["npu_metrics"]:
         metrics_analysis_prompt = f"""
@@ -63,13 +64,24 @@ async def run(state: Dict[str, Any], llm_engine) -> Dict[str, Any]:
         3. Performance geral
         4. Recomendações de otimização
         """
+        prompts.append(metrics_analysis_prompt)
+        options.append({"max_length": 200, "cache": True, "length_key": "npu_analysis"})
 
-        try:
-            metrics_analysis = llm_engine.generate_text(metrics_analysis_prompt, max_length=200)
-            technical_report["performance_analysis"] = metrics_analysis
-        except Exception as e:
+    # Resumo e análise são independentes: uma única decodificação em lote
+    try:
+        responses = await llm_engine.agenerate_many(
+            prompts, options, system_prompt=REPORTER_SYSTEM_PROMPT, priority=Priority.BACKGROUND
+        )
+        executive_summary = responses[0]
+        if len(responses) > 1:
+            technical_report["performance_analysis"] = responses[1]
+    except Exception as e:
+        executive_summary = f"Erro ao gerar resumo: {str(e)}"
+        if len(prompts) > 1:
             technical_report["performance_analysis"] = f"Erro na análise: {str(e)}"
 
+    state["executive_summary"] = executive_summary
+
     state["technical_report"] = technical_report
 
     # 3. Gerar evidências estruturadas
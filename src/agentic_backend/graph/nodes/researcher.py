@@ -6,11 +6,14 @@ from ...audit.evidence import EvidencePack
 from ...llm.engine import LLMEngine
 from ...embeddings.embedding import ONNXEmbedder
 from ...vectorstore.faiss_store import LocalFaiss
-import asyncio
+from ...llm.prompt_builder import PromptBuilder, PRIORITY_QUESTION, PRIORITY_RAG
+from ...settings import settings
 import logging
 
 log = logging.getLogger(__name__)
 
+RESEARCHER_SYSTEM_PROMPT = "Você é um assistente especializado em informações sobre Itaú e serviços bancários."
+
 async def run(state: Dict[str, Any], llm_engine: LLMEngine, embedder: ONNXEmbedder, vector_store: LocalFaiss = None) -> Dict[str, Any]:
     """
     Researcher que usa IA real para pesquisa inteligente com RAG.
@@ -34,7 +37,7 @@ async def run(state: Dict[str, Any], llm_engine: LLMEngine, embedder: ONNXEmbedd
         # PASSO 1: Usar RAG para encontrar contexto relevante
         print("📚 PASSO 1: Buscando contexto no RAG...")
 
-        rag_context = ""
+        relevant_docs = []
         if embedder and vector_store:
             # Gerar embedding da query
             query_embedding = embedder.embed([query])[0]
@@ -45,15 +48,13 @@ async def run(state: Dict[str, Any], llm_engine: LLMEngine, embedder: ONNXEmbedd
             print(f"🔍 Busca FAISS encontrou {len(search_results)} resultados")
 
             # Construir contexto dos documentos encontrados
-            relevant_docs = []
             for doc_text, score in search_results:
                 if score > 0.3:  # Threshold de similaridade
                     relevant_docs.append(doc_text)
                     print(f"📄 Documento relevante (score: {score:.3f}): {doc_text[:100]}...")
 
             if relevant_docs:
-                rag_context = "\n".join(relevant_docs)
-                print(f"✅ Contexto RAG construído: {len(rag_context)} caracteres")
+                print(f"✅ Contexto RAG: {len(relevant_docs)} documentos relevantes")
             else:
                 print("⚠️ Nenhum documento relevante encontrado no RAG")
         else:
@@ -62,21 +63,28 @@ async def run(state: Dict[str, Any], llm_engine: LLMEngine, embedder: ONNXEmbedd
         # PASSO 2: Usar LLM para gerar resposta baseada no contexto
         print("🤖 PASSO 2: Gerando resposta com LLM...")
 
-        if rag_context:
-            # Tem contexto do RAG - usar para resposta informada
-            research_prompt = f"""
+        if relevant_docs:
+            # Tem contexto do RAG - usar para resposta informada, dentro do orçamento de tokens
+            builder = PromptBuilder(llm_engine, settings.llm_prompt_budget_tokens, RESEARCHER_SYSTEM_PROMPT)
+            builder.add("preamble", ["""
 Você é um pesquisador especialista em Itaú e bancos brasileiros.
 Baseando-se nestas informações encontradas:
+"""], PRIORITY_QUESTION, required=True)
+            builder.add("rag", relevant_docs, PRIORITY_RAG, template="\n{}")
+            builder.add("question", [query], PRIORITY_QUESTION, template="""
 
-{rag_context}
-
-Responda à pergunta: {query}
+Responda à pergunta: {}
 
 Forneça uma resposta precisa, útil e baseada nas informações fornecidas.
 Se as informações não forem suficientes, diga claramente.
-"""
+""", required=True)
+            packed = builder.build()
+            research_prompt = packed.text
+            rag_context = "\n".join(packed.items.get("rag", []))
+            state["prompt_packing"] = packed.to_dict()
         else:
             # Sem contexto - resposta baseada em conhecimento geral
+            rag_context = ""
             research_prompt = f"""
 Você é um pesquisador especialista em Itaú e bancos brasileiros.
 
@@ -89,11 +97,10 @@ Seja preciso e útil.
         print(f"📝 Prompt para LLM: {research_prompt[:200]}...")
 
         # Gerar resposta usando LLM
-        final_response = await asyncio.to_thread(
-            llm_engine.generate_text,
+        final_response = await llm_engine.agenerate(
             research_prompt,
             max_length=300,
-            system_prompt="Você é um assistente especializado em informações sobre Itaú e serviços bancários."
+            system_prompt=RESEARCHER_SYSTEM_PROMPT
         )
 
         print(f"✅ Resposta gerada: {final_response[:200]}...")
@@ -0,0 +1,482 @@
+"""
+Executor declarativo do graph de agentes.
+
+Cada nó declara as chaves do ``GraphState`` que lê (``inputs``) e que
+escreve (``outputs``); as dependências saem daí (um nó espera os nós que
+produzem suas entradas) e de ``after``. Nós independentes rodam juntos com
+asyncio, cada um sobre uma cópia do estado: só as saídas declaradas voltam
+para o estado compartilhado, então dois nós em paralelo não se atropelam.
+
+- ``when``: condição avaliada quando as dependências terminam (falsa = nó pulado).
+- ``timeout_s`` / ``retries``: prazo por tentativa e novas tentativas com
+  espera crescente. O prazo cancela as gerações do nó (token próprio, filho
+  do token do pedido).
+- ``verdict``/``guarded_by``: um nó guarda (o critic) decide se os nós
+  guardados podem ter efeito. No modo otimista os guardados começam junto com
+  o guarda, com as ações com efeito colateral presas no ``ActionGate`` e as
+  saídas retidas até o veredito; rejeitado, o nó é cancelado e marcado
+  ``blocked``. No modo sequencial eles só começam depois do veredito.
+- Pedido cancelado (cliente desconectou, prazo): nenhum nó novo começa.
+
+Os tempos de cada nó vão para ``state["node_timings"]`` e para ``get_stats``;
+``on_event`` recebe cada mudança de estado dos nós (progresso dos jobs).
+``on_commit`` recebe as saídas de cada nó quando entram no estado
+(checkpoints) e ``completed`` restaura nós já concluídos sem executá-los.
+"""
+from __future__ import annotations
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+from ..llm.cancellation import CancellationToken, cancellation_scope, current_cancellation
+from ..llm.telemetry import caller_scope
+from .action_gate import ActionGate, ActionRejected, action_scope
+
+log = logging.getLogger(__name__)
+
+# Estados de um nó em uma execução
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+SKIPPED = "skipped"
+BLOCKED = "blocked"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# Guardado que terminou antes do veredito (saídas retidas)
+HELD = "held"
+
+_RESOLVED = (DONE, SKIPPED, BLOCKED, FAILED)
+
+NodeFunc = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+EventCallback = Callable[[Dict[str, Any]], None]
+CommitCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class NodeFailed(RuntimeError):
+    """Nó obrigatório falhou (depois das novas tentativas)"""
+
+    def __init__(self, node: str, error: BaseException):
+        super().__init__(f"{node}: {error}")
+        self.node = node
+        self.error = error
+
+
+@dataclass
+class Node:
+    """
+    Nó do graph.
+
+    Args:
+        name: Nome (também o chamador na telemetria de geração)
+        func: ``async (state) -> dict`` com as saídas (pode devolver o estado inteiro)
+        inputs: Chaves do estado lidas pelo nó
+        outputs: Chaves do estado escritas pelo nó
+        after: Nós que precisam terminar antes, além dos produtores das entradas
+        when: Condição sobre o estado para executar (None = sempre)
+        timeout_s: Prazo por tentativa (None = sem prazo)
+        retries: Novas tentativas após falha ou prazo vencido
+        retry_backoff_s: Espera antes da n-ésima nova tentativa (vezes n)
+        required: Falha interrompe a execução (False: registra e segue)
+        verdict: Nó guarda: ``(state) -> motivo da rejeição ou None``
+        guarded_by: Nome do nó guarda cujo veredito libera este nó
+    """
+    name: str
+    func: NodeFunc
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    after: Tuple[str, ...] = ()
+    when: Optional[Callable[[Dict[str, Any]], bool]] = None
+    timeout_s: Optional[float] = None
+    retries: int = 0
+    retry_backoff_s: float = 0.5
+    required: bool = True
+    verdict: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None
+    guarded_by: Optional[str] = None
+
+
+@dataclass
+class _NodeRun:
+    """Estado de um nó durante uma execução"""
+    node: Node
+    status: str = PENDING
+    task: Optional[asyncio.Task] = None
+    gate: Optional[ActionGate] = None
+    token: Optional[CancellationToken] = None
+    held: Optional[Dict[str, Any]] = None
+    # Guarda: motivo da rejeição (None = aprovado ou ainda sem veredito)
+    gate_reason: Optional[str] = None
+    started: Optional[float] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    timings: Dict[str, Any] = field(default_factory=dict)
+
+
+class GraphRuntime:
+    """
+    Executa nós declarados respeitando dependências, com paralelismo.
+
+    Args:
+        optimistic: Nós guardados começam antes do veredito do guarda
+    """
+
+    def __init__(self, optimistic: bool = True):
+        self.optimistic = optimistic
+        self.nodes: Dict[str, Node] = {}
+        self._deps: Optional[Dict[str, Set[str]]] = None
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+
+    def add_node(self, node: Node) -> Node:
+        if node.name in self.nodes:
+            raise ValueError(f"Nó duplicado: {node.name}")
+        self.nodes[node.name] = node
+        self._deps = None
+        return node
+
+    def dependencies(self) -> Dict[str, Set[str]]:
+        """Dependências de cada nó (produtores das entradas + ``after``), validadas"""
+        if self._deps is not None:
+            return self._deps
+
+        producers: Dict[str, Set[str]] = {}
+        for node in self.nodes.values():
+            for key in node.outputs:
+                producers.setdefault(key, set()).add(node.name)
+
+        deps: Dict[str, Set[str]] = {}
+        for node in self.nodes.values():
+            node_deps = set(node.after)
+            for key in node.inputs:
+                node_deps |= producers.get(key, set())
+            node_deps.discard(node.name)
+            if node.guarded_by is not None:
+                guard = self.nodes.get(node.guarded_by)
+                if guard is None or guard.verdict is None:
+                    raise ValueError(f"{node.name}: guarda inválido {node.guarded_by!r}")
+            missing = node_deps - set(self.nodes)
+            if missing:
+                raise ValueError(f"{node.name}: dependências inexistentes {sorted(missing)}")
+            deps[node.name] = node_deps
+
+        self._check_cycles(deps)
+        self._deps = deps
+        return deps
+
+    async def run(self, state: Dict[str, Any], on_event: Optional[EventCallback] = None,
+                  completed: Optional[Dict[str, Dict[str, Any]]] = None,
+                  on_commit: Optional[CommitCallback] = None) -> Dict[str, Any]:
+        """
+        Executa o graph sobre ``state`` (atualizado no lugar e retornado).
+
+        Args:
+            state: Estado inicial; as saídas dos nós são mescladas à medida que terminam
+            on_event: Recebe ``{"type": "node", "node", "status", ...tempos}`` a cada mudança
+            completed: Saídas de nós concluídos em uma execução anterior (não são executados)
+            on_commit: Recebe ``(nó, saídas)`` quando as saídas de um nó entram no estado
+
+        Raises:
+            NodeFailed: um nó obrigatório falhou
+        """
+        deps = self.dependencies()
+        runs = {name: _NodeRun(node) for name, node in self.nodes.items()}
+        timings = state.setdefault("node_timings", {})
+        started = time.perf_counter()
+        abandoned: List[asyncio.Task] = []
+        reported: Dict[str, str] = {}
+
+        try:
+            self._restore(state, runs, completed or {})
+            while True:
+                self._start_ready(state, runs, deps, started, on_commit)
+                self._report(runs, reported, on_event)
+
+                running = {r.task: r for r in runs.values() if r.status == RUNNING and r.task is not None}
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # Bloqueado por um veredito processado nesta mesma rodada
+                    if running[task].status == RUNNING:
+                        self._collect(state, runs, running[task], task, on_commit)
+                self._report(runs, reported, on_event)
+        except BaseException:
+            for r in runs.values():
+                if r.status == RUNNING and r.task is not None:
+                    self._cancel(r, "cancelled")
+                    r.status = CANCELLED
+                    abandoned.append(r.task)
+            raise
+        finally:
+            abandoned += [r.task for r in runs.values() if r.status == BLOCKED and r.task is not None]
+            if abandoned:
+                await asyncio.gather(*abandoned, return_exceptions=True)
+            for name, r in runs.items():
+                if r.status in (PENDING, HELD):
+                    r.status = CANCELLED
+                timings[name] = {"status": r.status, **r.timings}
+                if r.error:
+                    timings[name]["error"] = r.error
+                self._record_stats(r)
+            self._report(runs, reported, on_event)
+
+        return state
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Execuções, falhas e tempos por nó"""
+        with self._stats_lock:
+            stats = {name: dict(s) for name, s in self._stats.items()}
+        for s in stats.values():
+            s["mean_seconds"] = round(s["total_seconds"] / s["runs"], 3) if s["runs"] else None
+            s["total_seconds"] = round(s["total_seconds"], 3)
+            s["max_seconds"] = round(s["max_seconds"], 3)
+        return {
+            "optimistic": self.optimistic,
+            "dependencies": {name: sorted(d) for name, d in self.dependencies().items()},
+            "nodes": stats,
+        }
+
+    # ------------------------------------------------------------------
+    # Agendamento
+    # ------------------------------------------------------------------
+
+    def _restore(self, state: Dict[str, Any], runs: Dict[str, _NodeRun],
+                 completed: Dict[str, Dict[str, Any]]):
+        """Marca como concluídos os nós de ``completed`` e mescla suas saídas"""
+        for name, outputs in completed.items():
+            r = runs.get(name)
+            if r is None:
+                log.warning(f"Checkpoint de nó desconhecido ignorado: {name}")
+                continue
+            state.update({key: value for key, value in outputs.items() if key in r.node.outputs})
+            r.status = DONE
+            r.timings["restored"] = True
+        if completed:
+            log.info(f"↩️ Retomando: {len(completed)} nó(s) restaurados do checkpoint")
+        # Vereditos depois de todas as saídas (o critic lê o estado completo)
+        for name in completed:
+            r = runs.get(name)
+            if r is not None and r.node.verdict is not None:
+                r.gate_reason = r.node.verdict(state)
+
+    def _start_ready(self, state: Dict[str, Any], runs: Dict[str, _NodeRun],
+                     deps: Dict[str, Set[str]], started: float, on_commit: Optional[CommitCallback]):
+        token = current_cancellation.get()
+        if token is not None and token.is_set():
+            if any(r.status == PENDING for r in runs.values()) and "cancelled" not in state:
+                log.warning(f"⏹️ Execução interrompida ({token.reason})")
+                state["cancelled"] = token.reason
+            # O veredito não vai chegar: nós presos no portão não ficam esperando
+            for r in runs.values():
+                if r.gate is not None and not r.gate.decided:
+                    r.gate.reject(token.reason or "cancelled")
+            return
+
+        progressed = True
+        while progressed:
+            progressed = False
+            for name, r in runs.items():
+                if r.status != PENDING or not all(runs[d].status in _RESOLVED for d in deps[name]):
+                    continue
+                node = r.node
+                guard = runs[node.guarded_by] if node.guarded_by else None
+                if guard is not None and not self.optimistic and guard.status not in _RESOLVED:
+                    continue
+                if node.when is not None and not node.when(state):
+                    r.status = SKIPPED
+                    if node.verdict is not None:
+                        self._apply_verdict(state, runs, r, f"{name} não executado", on_commit)
+                    progressed = True
+                    continue
+                if guard is not None and guard.status in _RESOLVED and guard.gate_reason is not None:
+                    self._block(r, guard.gate_reason)
+                    progressed = True
+                    continue
+
+                r.status = RUNNING
+                r.started = time.perf_counter()
+                r.timings["start_offset_seconds"] = round(r.started - started, 3)
+                r.token = CancellationToken(parent=token)
+                if guard is not None and guard.status not in _RESOLVED:
+                    r.gate = ActionGate()
+                r.task = asyncio.create_task(self._execute(r, state))
+
+    async def _execute(self, r: _NodeRun, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Tentativas do nó com prazo; devolve as saídas declaradas"""
+        node = r.node
+        while True:
+            r.attempts += 1
+            attempt_token = CancellationToken(parent=r.token)
+            gate_scope = action_scope(r.gate) if r.gate is not None else nullcontext()
+            try:
+                with cancellation_scope(attempt_token), gate_scope, caller_scope(node.name):
+                    call = node.func(_snapshot(state))
+                    if node.timeout_s:
+                        result = await asyncio.wait_for(call, node.timeout_s)
+                    else:
+                        result = await call
+                return {key: result[key] for key in node.outputs if key in (result or {})}
+            except ActionRejected:
+                raise
+            except asyncio.TimeoutError:
+                attempt_token.cancel("deadline")
+                error: Exception = TimeoutError(f"prazo de {node.timeout_s}s excedido")
+                self._count(node.name, "timeouts")
+            except Exception as e:
+                error = e
+
+            if r.attempts > node.retries or r.token.is_set():
+                raise error
+            self._count(node.name, "retries")
+            log.warning(f"Nó {node.name} falhou ({error}) - nova tentativa {r.attempts}/{node.retries}")
+            await asyncio.sleep(node.retry_backoff_s * r.attempts)
+
+    def _collect(self, state: Dict[str, Any], runs: Dict[str, _NodeRun], r: _NodeRun, task: asyncio.Task,
+                 on_commit: Optional[CommitCallback]):
+        """Resultado de um nó terminado: mescla saídas, aplica vereditos, propaga falhas"""
+        r.timings["seconds"] = round(time.perf_counter() - r.started, 3)
+        r.timings["attempts"] = r.attempts
+        node = r.node
+
+        error = task.exception() if not task.cancelled() else asyncio.CancelledError()
+        if isinstance(error, ActionRejected):
+            self._block(r, str(error))
+            return
+        if error is not None:
+            r.status = FAILED
+            r.error = str(error) or type(error).__name__
+            if node.required:
+                raise NodeFailed(node.name, error)
+            log.warning(f"Nó opcional {node.name} falhou: {r.error}")
+            if node.verdict is not None:
+                # Sem veredito: os guardados não têm efeito (falha fechada)
+                self._apply_verdict(state, runs, r, f"{node.name} falhou", on_commit)
+            return
+
+        outputs = task.result()
+        guard = runs[node.guarded_by] if node.guarded_by else None
+        if guard is not None and guard.status not in _RESOLVED:
+            # Veredito pendente: saídas retidas, dependentes continuam esperando
+            r.held = outputs
+            r.status = HELD
+            return
+
+        self._commit(state, r, outputs, on_commit)
+
+        if node.verdict is not None:
+            self._apply_verdict(state, runs, r, node.verdict(state), on_commit)
+
+    def _apply_verdict(self, state: Dict[str, Any], runs: Dict[str, _NodeRun], guard: _NodeRun,
+                       reason: Optional[str], on_commit: Optional[CommitCallback]):
+        """Libera (``reason`` None) ou bloqueia os nós guardados por ``guard``"""
+        guard.gate_reason = reason
+        for r in runs.values():
+            if r.node.guarded_by != guard.node.name:
+                continue
+            if reason is None:
+                if r.gate is not None:
+                    if r.gate.waited:
+                        log.info(f"   Ações de {r.node.name} liberadas após o veredito: {r.gate.waited}")
+                    r.gate.approve()
+                if r.status == HELD:
+                    self._commit(state, r, r.held or {}, on_commit)
+                    r.held = None
+            elif r.status in (RUNNING, HELD):
+                if r.gate is not None:
+                    r.gate.reject(reason)
+                self._cancel(r, f"{guard.node.name}_rejected")
+                self._block(r, reason)
+
+    @staticmethod
+    def _commit(state: Dict[str, Any], r: _NodeRun, outputs: Dict[str, Any], on_commit: Optional[CommitCallback]):
+        state.update(outputs)
+        r.status = DONE
+        if on_commit is not None:
+            try:
+                on_commit(r.node.name, outputs)
+            except Exception as e:
+                log.warning(f"Erro no callback de checkpoint do graph: {e}")
+
+    def _block(self, r: _NodeRun, reason: str):
+        log.warning(f"🛑 Nó {r.node.name} bloqueado: {reason}")
+        if r.started is not None and "seconds" not in r.timings:
+            r.timings["seconds"] = round(time.perf_counter() - r.started, 3)
+        r.status = BLOCKED
+        r.held = None
+
+    @staticmethod
+    def _cancel(r: _NodeRun, reason: str):
+        if r.token is not None:
+            r.token.cancel(reason)
+        if r.task is not None and not r.task.done():
+            r.task.cancel()
+
+    @staticmethod
+    def _report(runs: Dict[str, _NodeRun], reported: Dict[str, str], on_event: Optional[EventCallback]):
+        """Envia as mudanças de estado dos nós desde o último relatório"""
+        if on_event is None:
+            return
+        for name, r in runs.items():
+            if r.status == PENDING or reported.get(name) == r.status:
+                continue
+            reported[name] = r.status
+            event = {"type": "node", "node": name, "status": r.status, **r.timings}
+            if r.error:
+                event["error"] = r.error
+            try:
+                on_event(event)
+            except Exception as e:
+                log.warning(f"Erro no callback de eventos do graph: {e}")
+
+    # ------------------------------------------------------------------
+    # Estatísticas e validação
+    # ------------------------------------------------------------------
+
+    def _record_stats(self, r: _NodeRun):
+        with self._stats_lock:
+            stats = self._stats.setdefault(r.node.name, _empty_stats())
+            stats[r.status] = stats.get(r.status, 0) + 1
+            seconds = r.timings.get("seconds")
+            if r.status in (DONE, FAILED, BLOCKED) and seconds is not None:
+                stats["runs"] += 1
+                stats["total_seconds"] += seconds
+                stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def _count(self, name: str, counter: str):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, _empty_stats())
+            stats[counter] += 1
+
+    @staticmethod
+    def _check_cycles(deps: Dict[str, Set[str]]):
+        visiting: Set[str] = set()
+        visited: Set[str] = set()
+
+        def _visit(name: str, path: List[str]):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Ciclo no graph: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dep in deps[name]:
+                _visit(dep, path + [name])
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in deps:
+            _visit(name, [])
+
+
+def _empty_stats() -> Dict[str, float]:
+    return {"runs": 0, "timeouts": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+def _snapshot(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Cópia do estado para um nó (listas e dicts do primeiro nível copiados)"""
+    return {
+        key: list(value) if isinstance(value, list) else dict(value) if isinstance(value, dict) else value
+        for key, value in state.items()
+    }
@@ -13,3 +13,8 @@ class GraphState(TypedDict, total=False):
     overlay_mode: bool
     evidence_zip: Optional[str]
     warnings: List[str]
+    security_check_passed: bool
+    selected_agent: str
+    agent_blocked: Optional[str]
+    defer_report: Optional[bool]
+    report_status: str
@@ -0,0 +1,309 @@
+"""
+Fila de jobs do graph com pool de workers limitado.
+
+O ``/run`` segura a conexão HTTP pelo graph inteiro (supervisor, critic,
+agente, duas chamadas do reporter): automações longas estouram o prazo do
+proxy. Aqui ``submit`` enfileira o job e devolve o ``job_id`` na hora; um
+número fixo de workers (tasks asyncio) consome a fila e roda o graph.
+
+- Fila cheia: ``submit`` levanta ``JobQueueFull`` (a API responde 429) em
+  vez de acumular espera.
+- O estado parcial fica disponível durante a execução (as saídas de cada nó
+  são mescladas ao estado do job à medida que o nó termina).
+- Cada mudança (enfileirado, iniciado, progresso de cada nó, fim) vira um
+  evento numerado; ``subscribe`` repete os eventos já emitidos e segue com os
+  novos até o fim do job (SSE em ``/jobs/{id}/events``).
+- Cada job tem um ``CancellationToken`` próprio (prazo + ``cancel``) ligado
+  às gerações do LLM feitas pelos nós.
+- Jobs terminados são descartados depois de ``jobs_ttl_seconds``.
+- Com o Reporter em segundo plano, o job termina com o resultado do agente e
+  o fluxo de eventos segue até o evento ``report`` (saídas do Reporter
+  mescladas ao estado do job).
+- ``submit(..., resume=True)`` retoma um job a partir dos checkpoints do
+  graph (nós concluídos não são executados de novo).
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+from .settings import settings
+from .llm.cancellation import CancellationToken, cancellation_scope
+
+log = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Eventos mantidos por job (os mais antigos saem do replay)
+_MAX_EVENTS = 500
+
+JobRunner = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None], bool], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFull(RuntimeError):
+    """Fila de jobs cheia: o job foi recusado"""
+
+
+@dataclass
+class Job:
+    """Job do graph e seu progresso"""
+    job_id: str
+    state: Dict[str, Any]
+    token: CancellationToken
+    status: str = QUEUED
+    resume: bool = False
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    nodes: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    seq: int = 0
+    subscribers: List[asyncio.Queue] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    @property
+    def settled(self) -> bool:
+        """Terminado e sem relatório em segundo plano pendente"""
+        return self.finished and self.state.get("report_status") != "pending"
+
+    def to_dict(self, include_state: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "resumed": self.resume,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": round((self.started_at or time.time()) - self.created_at, 3),
+            "run_seconds": (
+                round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None
+            ),
+            "nodes": {name: dict(node) for name, node in self.nodes.items()},
+            "events": self.seq,
+        }
+        if include_state:
+            data["state"] = dict(self.state)
+        return data
+
+
+class JobManager:
+    """
+    Pool de workers + fila limitada de jobs.
+
+    Args:
+        workers: Jobs executados ao mesmo tempo
+        max_queue: Jobs aguardando além dos em execução
+        ttl_seconds: Tempo que um job terminado continua consultável
+        timeout_s: Prazo de cada job a partir do início da execução (0 = sem prazo)
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, ttl_seconds: float = 3600.0,
+                 timeout_s: float = 0.0):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.ttl_seconds = ttl_seconds
+        self.timeout_s = timeout_s
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[JobRunner] = None
+        self._stats = {"submitted": 0, "rejected": 0, SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+
+    def start(self, runner: JobRunner):
+        """Inicia os workers no event loop corrente (lifespan do servidor)"""
+        self._runner = runner
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        log.info(f"Fila de jobs iniciada (workers={self.workers}, fila={self.max_queue})")
+
+    async def stop(self):
+        """Cancela os jobs em andamento e para os workers"""
+        for job in self._jobs.values():
+            if not job.finished:
+                job.token.cancel("shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, job_id: str, state: Dict[str, Any], resume: bool = False) -> Job:
+        """
+        Enfileira um job.
+
+        Args:
+            job_id: Identificador (um job terminado com o mesmo id é substituído)
+            state: Estado inicial do graph
+            resume: Retomar dos checkpoints do graph em vez de começar do zero
+
+        Raises:
+            JobQueueFull: fila cheia
+            RuntimeError: workers não iniciados ou job com o mesmo id em andamento
+        """
+        if self._queue is None:
+            raise RuntimeError("Fila de jobs não iniciada")
+        self._expire()
+        current = self._jobs.get(job_id)
+        if current is not None and not current.finished:
+            raise RuntimeError(f"Job {job_id} ainda em andamento")
+
+        job = Job(job_id=job_id, state=state, token=CancellationToken(), resume=resume)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise JobQueueFull(f"Fila de jobs cheia ({self.max_queue} aguardando)")
+
+        self._jobs[job_id] = job
+        self._stats["submitted"] += 1
+        self._emit(job, {"type": "status", "status": QUEUED, "position": self._queue.qsize()})
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Pede o cancelamento (na fila: não executa; em execução: gerações param)"""
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.token.cancel("cancelled")
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        return job
+
+    async def subscribe(self, job_id: str, heartbeat_s: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Eventos do job: os já emitidos e, até o fim (incluindo o relatório
+        em segundo plano), os novos.
+
+        Com ``heartbeat_s``, produz ``{"type": "heartbeat"}`` (sem ``seq``)
+        quando nada acontece nesse intervalo, para manter a conexão viva.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        replay = list(job.events)
+        live = not job.settled
+        if live:
+            job.subscribers.append(queue)
+        try:
+            for event in replay:
+                yield event
+            if not live:
+                return
+            last = replay[-1]["seq"] if replay else 0
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield {"type": "heartbeat", "job_id": job_id, "timestamp": time.time()}
+                    continue
+                if event["seq"] <= last:
+                    continue
+                yield event
+                if event["type"] in ("finished", "report") and job.settled:
+                    return
+        finally:
+            if queue in job.subscribers:
+                job.subscribers.remove(queue)
+
+    def get_stats(self) -> Dict[str, Any]:
+        by_status: Dict[str, int] = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            **self._stats,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": by_status,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if not job.finished:
+                    await self._run(job)
+            except Exception as e:
+                log.error(f"Erro no worker de jobs {index}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        if self.timeout_s:
+            job.token.deadline = time.monotonic() + self.timeout_s
+        self._emit(job, {"type": "status", "status": RUNNING})
+
+        def _on_event(event: Dict[str, Any]):
+            if event["type"] == "node":
+                job.nodes[event["node"]] = {k: v for k, v in event.items() if k not in ("type", "node")}
+            self._emit(job, event)
+
+        try:
+            with cancellation_scope(job.token):
+                job.state = await self._runner(job.state, _on_event, job.resume)
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, FAILED)
+            return
+
+        if job.state.get("error"):
+            job.error = job.state["error"]
+            self._finish(job, FAILED)
+        elif job.token.is_set():
+            job.error = job.token.reason
+            self._finish(job, CANCELLED)
+        else:
+            self._finish(job, SUCCEEDED)
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        self._stats[status] += 1
+        self._emit(job, {"type": "finished", "status": status, "error": job.error})
+
+    def _emit(self, job: Job, event: Dict[str, Any]):
+        job.seq += 1
+        event = {"seq": job.seq, "job_id": job.job_id, "timestamp": time.time(), **event}
+        job.events.append(event)
+        if len(job.events) > _MAX_EVENTS:
+            del job.events[0]
+        for queue in job.subscribers:
+            queue.put_nowait(event)
+
+    def _expire(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager(
+    workers=settings.jobs_workers,
+    max_queue=settings.jobs_max_queue,
+    ttl_seconds=settings.jobs_ttl_seconds,
+    timeout_s=settings.jobs_timeout_seconds,
+)
@@ -0,0 +1,122 @@
+"""
+Prazo e cancelamento de gerações.
+
+Sem isso, o loop de decodificação segue até ``max_length`` mesmo depois que o
+cliente HTTP desconectou ou que o job estourou o tempo: NPU gasta em respostas
+que ninguém vai ler. O ``CancellationToken`` é verificado entre tokens (ele se
+comporta como o ``threading.Event`` já aceito como ``stop_event`` pelo engine
+e pelo scheduler) e dispara quando alguém chama ``cancel`` ou quando o prazo
+vence.
+
+O token do pedido corrente fica em uma ``ContextVar``: a API abre um
+``cancellation_scope`` e todas as gerações feitas dentro dele (inclusive nos
+nós do graph e nas threads do executor de inferência, que copiam o contexto)
+param juntas. A saída parcial volta como ``GenerationResult`` marcada como
+truncada.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import threading
+import time
+
+
+class CancellationToken:
+    """
+    Sinal de parada verificado entre tokens.
+
+    Args:
+        timeout_s: Prazo em segundos a partir de agora (None = sem prazo)
+        parent: Token cujo cancelamento também cancela este
+    """
+
+    def __init__(self, timeout_s: Optional[float] = None, parent: Optional["CancellationToken"] = None):
+        self.deadline = time.monotonic() + timeout_s if timeout_s else None
+        self.parent = parent
+        self._event = threading.Event()
+        self._reason: Optional[str] = None
+
+    def cancel(self, reason: str = "cancelled"):
+        """Pede a parada das gerações ligadas a este token"""
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    # Compatível com threading.Event (stop_event do engine e do scheduler)
+    set = cancel
+
+    def is_set(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+            return True
+        if self.parent is not None and self.parent.is_set():
+            self.cancel(self.parent.reason or "cancelled")
+            return True
+        return False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.is_set()
+
+    @property
+    def reason(self) -> Optional[str]:
+        """``cancelled``, ``disconnected``, ``deadline``... (None se ativo)"""
+        return self._reason
+
+    def remaining(self) -> Optional[float]:
+        """Segundos até o prazo (None sem prazo)"""
+        deadlines = [t.deadline for t in self._chain() if t.deadline is not None]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _chain(self):
+        token = self
+        while token is not None:
+            yield token
+            token = token.parent
+
+
+class GenerationResult(str):
+    """
+    Texto gerado com o motivo do fim da geração.
+
+    É uma ``str`` (os chamadores existentes não mudam); ``truncated`` indica
+    que a geração foi interrompida por cancelamento ou prazo.
+    """
+
+    finish_reason: str = "completed"
+
+    def __new__(cls, text: str, finish_reason: str = "completed"):
+        result = super().__new__(cls, text)
+        result.finish_reason = finish_reason
+        return result
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason != "completed"
+
+
+current_cancellation: ContextVar[Optional[CancellationToken]] = ContextVar("current_cancellation", default=None)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken):
+    """Liga ``token`` às gerações feitas dentro do bloco"""
+    reset = current_cancellation.set(token)
+    try:
+        yield token
+    finally:
+        current_cancellation.reset(reset)
+
+
+def resolve_cancellation(cancel_token: Optional[CancellationToken] = None,
+                         timeout_s: Optional[float] = None) -> Optional[CancellationToken]:
+    """Token explícito ou o do contexto, com o prazo adicional ``timeout_s``"""
+    token = cancel_token if cancel_token is not None else current_cancellation.get()
+    if timeout_s:
+        token = CancellationToken(timeout_s=timeout_s, parent=token)
+    return token
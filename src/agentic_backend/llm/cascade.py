@@ -0,0 +1,238 @@
+"""
+Cascata de modelos: prompts fáceis vão para um modelo menor.
+
+Saudações, perguntas do onboarding e resumos curtos não precisam do 3B. A
+``ModelCascade`` mantém dois ``LLMEngine`` (pequeno e grande) e escolhe por
+chamada: pelo tipo de tarefa declarado (``task=``) ou, sem ele, por um
+escore de dificuldade barato (tamanho do prompt, orçamento de resposta e
+pistas de raciocínio no texto). A resposta do modelo pequeno passa por uma
+medida de confiança (``LLMEngine.sequence_confidence``); abaixo do limiar a
+chamada é repetida no modelo grande. Com ``cache=True``, o que vai para o
+cache de respostas é a resposta final (do pequeno ou a escalonada), gravada
+só depois da verificação de confiança.
+
+Para os chamadores a cascata é um ``LLMEngine``: o que não é geração de
+texto livre (classificação, lotes, streaming, estatísticas) vai direto para
+o modelo grande.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from ..settings import settings
+from .engine import LLMEngine
+from .cancellation import GenerationResult
+from .response_cache import response_cache
+
+log = logging.getLogger(__name__)
+
+SMALL = "small"
+LARGE = "large"
+
+# Pedidos que costumam exigir o modelo grande
+_REASONING_HINTS = (
+    "analise", "analisar", "compare", "explique", "por que", "estratégia",
+    "recomend", "avalie", "json",
+)
+
+
+class ModelCascade:
+    """
+    Roteia gerações entre um modelo pequeno e um grande.
+
+    Args:
+        large: Engine principal (sempre disponível)
+        small: Engine pequeno; sem ele (ou sem modelo carregado) tudo vai para o grande
+        small_tasks: Tipos de tarefa atendidos pelo modelo pequeno
+        difficulty_threshold: Escore máximo para o modelo pequeno quando não há ``task``
+        min_confidence: Confiança mínima da resposta do modelo pequeno
+    """
+
+    def __init__(self, large: LLMEngine, small: Optional[LLMEngine] = None,
+                 small_tasks: Optional[List[str]] = None,
+                 difficulty_threshold: Optional[float] = None,
+                 min_confidence: Optional[float] = None):
+        self.large = large
+        self.small = small if small is not None and small.is_available() else None
+        self.small_tasks = set(small_tasks if small_tasks is not None else settings.llm_cascade_small_tasks)
+        self.difficulty_threshold = (
+            difficulty_threshold if difficulty_threshold is not None
+            else settings.llm_cascade_difficulty_threshold
+        )
+        self.min_confidence = min_confidence if min_confidence is not None else settings.llm_cascade_min_confidence
+
+        self._lock = threading.Lock()
+        self._stats = {
+            tier: {"calls": 0, "latency_seconds": 0.0}
+            for tier in (SMALL, LARGE)
+        }
+        self._stats["escalations"] = 0
+        self._stats["confidence_unavailable"] = 0
+
+        if small is not None and self.small is None:
+            log.warning("Modelo pequeno da cascata indisponível - usando só o modelo grande")
+
+    def __getattr__(self, name: str):
+        # Classificação, lotes, streaming etc. seguem no modelo grande
+        return getattr(self.large, name)
+
+    # ------------------------------------------------------------------
+    # Roteamento
+    # ------------------------------------------------------------------
+
+    def route(self, prompt: str, task: Optional[str] = None, **gen_kwargs) -> str:
+        """Escolhe o tier (``small``/``large``) para a chamada"""
+        if self.small is None or gen_kwargs.get('conversation_id'):
+            return LARGE
+        if task is not None:
+            return SMALL if task in self.small_tasks else LARGE
+        return SMALL if self.difficulty(prompt, gen_kwargs) <= self.difficulty_threshold else LARGE
+
+    def difficulty(self, prompt: str, gen_kwargs: Dict[str, Any]) -> float:
+        """Escore em [0, 1]: prompt longo, resposta longa e pedido de raciocínio pesam mais"""
+        length = min(self.large.count_tokens(prompt) / max(settings.llm_prompt_budget_tokens, 1), 1.0)
+        answer_budget = gen_kwargs.get('max_new_tokens') or gen_kwargs.get('max_length', 512)
+        answer = min(answer_budget / 512, 1.0)
+        lowered = prompt.lower()
+        reasoning = 1.0 if any(hint in lowered for hint in _REASONING_HINTS) else 0.0
+        return 0.4 * length + 0.3 * answer + 0.3 * reasoning
+
+    # ------------------------------------------------------------------
+    # Geração
+    # ------------------------------------------------------------------
+
+    def generate_text(self, prompt: str, task: Optional[str] = None, **gen_kwargs) -> str:
+        """``LLMEngine.generate_text`` no tier escolhido, com escalonamento por confiança"""
+        if self.route(prompt, task, **gen_kwargs) == LARGE:
+            return self._timed(LARGE, lambda: self.large.generate_text(prompt, **gen_kwargs))
+
+        cache_key, cached = self._cached(prompt, gen_kwargs)
+        if cached is not None:
+            return cached
+
+        small_kwargs = {**gen_kwargs, 'cache': False}
+        response = self._timed(SMALL, lambda: self.small.generate_text(prompt, **small_kwargs))
+        confidence = self.small.sequence_confidence(prompt, response, **small_kwargs)
+        if not self._confident(response, confidence):
+            self._escalated(task, confidence)
+            response = self._timed(LARGE, lambda: self.large.generate_text(prompt, **gen_kwargs))
+
+        self._store(cache_key, response)
+        return response
+
+    async def agenerate(self, prompt: str, task: Optional[str] = None, **gen_kwargs) -> str:
+        """Versão assíncrona de ``generate_text``"""
+        if self.route(prompt, task, **gen_kwargs) == LARGE:
+            return await self._atimed(LARGE, self.large.agenerate(prompt, **gen_kwargs))
+
+        cache_key, cached = self._cached(prompt, gen_kwargs)
+        if cached is not None:
+            return cached
+
+        small_kwargs = {**gen_kwargs, 'cache': False}
+        response = await self._atimed(SMALL, self.small.agenerate(prompt, **small_kwargs))
+        confidence = await self.small.asequence_confidence(prompt, response, **small_kwargs)
+        if not self._confident(response, confidence):
+            self._escalated(task, confidence)
+            response = await self._atimed(LARGE, self.large.agenerate(prompt, **gen_kwargs))
+
+        self._store(cache_key, response)
+        return response
+
+    def generate(self, prompt: str, **gen_kwargs) -> str:
+        """Método de compatibilidade"""
+        return self.generate_text(prompt, **gen_kwargs)
+
+    def register_prefix(self, system_prompt: str):
+        """Registra o system prompt nos dois modelos"""
+        self.large.register_prefix(system_prompt)
+        if self.small is not None:
+            self.small.register_prefix(system_prompt)
+
+    def _cached(self, prompt: str, gen_kwargs: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Chave e resposta em cache das chamadas roteadas para o modelo pequeno.
+
+        O modelo pequeno roda sem cache: a chave dele guarda a resposta final
+        da cascata, que só é conhecida depois da verificação de confiança.
+        """
+        if not gen_kwargs.get('cache') or not settings.llm_response_cache_enabled:
+            return None, None
+        cache_key = self.small._response_cache_key(prompt, gen_kwargs)
+        cached = response_cache.get(cache_key)
+        return cache_key, GenerationResult(cached) if cached is not None else None
+
+    @staticmethod
+    def _store(cache_key: Optional[str], response: str):
+        if cache_key is not None and response.strip() and not getattr(response, "truncated", False):
+            response_cache.put(cache_key, response)
+
+    def _confident(self, response: str, confidence: Optional[float]) -> bool:
+        if not response.strip() or getattr(response, "truncated", False):
+            return False
+        if confidence is None:
+            # Runtime sem logits por posição: só respostas vazias/truncadas escalam
+            with self._lock:
+                self._stats["confidence_unavailable"] += 1
+            return True
+        return confidence >= self.min_confidence
+
+    def _escalated(self, task: Optional[str], confidence: Optional[float]):
+        with self._lock:
+            self._stats["escalations"] += 1
+        shown = f"{confidence:.2f}" if confidence is not None else "n/d"
+        log.info(f"Cascata: escalando para o modelo grande (tarefa={task}, confiança={shown})")
+
+    def _record(self, tier: str, started: float):
+        with self._lock:
+            stats = self._stats[tier]
+            stats["calls"] += 1
+            stats["latency_seconds"] += time.time() - started
+
+    def _timed(self, tier: str, call):
+        started = time.time()
+        response = call()
+        self._record(tier, started)
+        return response
+
+    async def _atimed(self, tier: str, call):
+        started = time.time()
+        response = await call
+        self._record(tier, started)
+        return response
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """Uso e latência por tier e taxa de escalonamento"""
+        with self._lock:
+            stats = {tier: dict(self._stats[tier]) for tier in (SMALL, LARGE)}
+            escalations = self._stats["escalations"]
+            unavailable = self._stats["confidence_unavailable"]
+
+        for tier_stats in stats.values():
+            calls = tier_stats["calls"]
+            tier_stats["avg_latency_ms"] = tier_stats.pop("latency_seconds") / calls * 1000 if calls else 0.0
+
+        small_calls = stats[SMALL]["calls"]
+        return {
+            "small_enabled": self.small is not None,
+            "small_model": self.small.model_path if self.small is not None else None,
+            "tiers": stats,
+            "escalations": escalations,
+            "escalation_rate": escalations / small_calls if small_calls else 0.0,
+            "confidence_unavailable": unavailable,
+            "small_tasks": sorted(self.small_tasks),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas do modelo grande, do pequeno e da cascata"""
+        stats = self.large.get_stats()
+        stats["cascade"] = self.get_cascade_stats()
+        if self.small is not None:
+            stats["small_model"] = self.small.get_stats()
+        return stats
@@ -2,10 +2,30 @@
 LLM Engine baseado no model-qa.py - implementação direta e funcional.
 """
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, Set, List, Tuple, Union
+from collections import OrderedDict
+import asyncio
+import json
 import logging
+import os
+import re
+import threading
 import time
 
+import numpy as np
+
+from ..settings import settings
+from .scheduler import BatchScheduler
+from .prefix_cache import PrefixCache
+from .sessions import SessionStore, ConversationSession
+from .response_cache import response_cache
+from .executor import InferenceExecutor
+from .priority import Priority, PriorityGate
+from .cancellation import CancellationToken, GenerationResult, resolve_cancellation
+from .speculative import SpeculativeDecoder, SpeculativeUnavailable
+from .telemetry import GenerationTrace, generation_telemetry, resolve_caller
+from .length_predictor import length_predictor
+
 log = logging.getLogger(__name__)
 
 try:
@@ -15,14 +35,78 @@ except Exception:
     _HAS_GENAI = False
     og = None
 
+# Sentinela de fim de stream em generate_stream
+_STREAM_END = object()
+
+DEFAULT_SYSTEM_PROMPT = 'You are a helpful AI assistant.'
+
+# Trechos fixos do template (system prompt, instruções) já tokenizados
+_SEGMENT_CACHE_SIZE = 64
+
+class _ScoringUnavailable(RuntimeError):
+    """O runtime não expõe o necessário para classificar por logits"""
+
+class _ScoringCancelled(RuntimeError):
+    """Classificação por logits interrompida pelo token de cancelamento"""
+
+class _SessionOverflow(RuntimeError):
+    """A nova mensagem sozinha não cabe na sessão (levantado antes do primeiro token)"""
+
 class LLMEngine:
-    def __init__(self, model_path: str, execution_provider: str = "follow_config"):
+    def __init__(self, model_path: str, execution_provider: str = "follow_config",
+                 max_batch_size: Optional[int] = None, draft_model_path: Optional[str] = None):
         self.model_path = model_path
+        # Rótulo do modelo na telemetria
+        self._model_name = os.path.basename(os.path.normpath(model_path))
         self.execution_provider = execution_provider
+        self.max_batch_size = max_batch_size if max_batch_size is not None else settings.llm_max_batch_size
+        self.draft_model_path = draft_model_path if draft_model_path is not None else settings.llm_draft_model_path
         self._model = None
         self._tokenizer = None
         self._tokenizer_stream = None
+        self._scheduler: Optional[BatchScheduler] = None
+        self._batch_runner: Optional[BatchScheduler] = None
+        self._batch_generation_supported = True
+        self._prefix_cache: Optional[PrefixCache] = None
+        self._sessions: Optional[SessionStore] = None
+        self._executor: Optional[InferenceExecutor] = None
+        self._speculative: Optional[SpeculativeDecoder] = None
+        self._priority_gate = PriorityGate(max_pause_ms=settings.llm_priority_max_pause_ms)
+        # Tokens de template + system prompt, por system prompt (ver PromptBuilder)
+        self._overhead_tokens: Dict[str, int] = {}
+        # Texto templado do trecho fixo -> tokens (ver _encode_messages)
+        self._segment_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._segment_lock = threading.Lock()
+        self._leading_tokens: Optional[List[int]] = None
+        self._tokenization_stats = {
+            "segment_hits": 0,
+            "segment_misses": 0,
+            "tokens_reused": 0,
+        }
+        self.eos_token_ids: Set[int] = set()
+        self.pad_token_id = 0
+        self.kv_bytes_per_token = 0
+        # Saída restrita por regex (onnxruntime-genai com suporte a guidance)
+        self._guidance_supported = og is not None and hasattr(og.GeneratorParams, "set_guidance")
+        self._choice_stats = {
+            "calls": 0,
+            "guided": 0,
+            "unguided": 0,
+            "unmatched": 0,
+            "decode_steps": 0,
+        }
+        self._scoring_stats = {
+            "calls": 0,
+            "prefix_cache_hits": 0,
+            "extra_steps": 0,
+            "fallbacks": 0,
+        }
         self._init_backend()
+        self._init_speculative()
+        self._init_scheduler()
+        self._init_prefix_cache()
+        self._init_sessions()
+        self._init_executor()
 
     def _init_backend(self):
         """Inicialização baseada exatamente no model-qa.py"""
@@ -48,82 +132,1220 @@ class LLMEngine:
             self._tokenizer_stream = self._tokenizer.create_stream()
             log.info("✅ Tokenizer criado")
 
+            self._load_model_config()
+
         except Exception as e:
             log.error(f"Falha ao iniciar LLM: {e}")
             self._model = None
 
-    def generate_text(self, prompt: str, **gen_kwargs) -> str:
+    def _load_model_config(self):
         """
-        Geração de texto baseada exatamente no model-qa.py
+        Lê do genai_config.json os tokens EOS/PAD (necessários para decodificar
+        em lote) e a geometria do KV cache (para estimar memória das sessões)
         """
-        if not self._model:
-            raise RuntimeError("Modelo LLM não inicializado")
+        config_path = os.path.join(self.model_path, "genai_config.json")
+        try:
+            with open(config_path, "r", encoding="utf-8") as f:
+                model_config = json.load(f).get("model", {})
+        except Exception as e:
+            log.warning(f"Não foi possível ler {config_path}: {e}")
+            return
+
+        eos = model_config.get("eos_token_id", [])
+        self.eos_token_ids = set(eos if isinstance(eos, list) else [eos])
+        pad = model_config.get("pad_token_id")
+        self.pad_token_id = pad if isinstance(pad, int) else next(iter(self.eos_token_ids), 0)
 
+        # K e V em fp16 por camada
+        decoder = model_config.get("decoder", {})
         try:
-            # Configurar parâmetros como no model-qa.py
-            search_options = {
-                'do_sample': gen_kwargs.get('do_sample', True),
-                'max_length': gen_kwargs.get('max_length', 512),
-                'min_length': gen_kwargs.get('min_length', 0),
-                'top_p': gen_kwargs.get('top_p', 0.9),
-                'top_k': gen_kwargs.get('top_k', 50),
-                'temperature': gen_kwargs.get('temperature', 0.3),
-                'repetition_penalty': gen_kwargs.get('repetition_penalty', 1.0),
-                'batch_size': 1
-            }
+            self.kv_bytes_per_token = (
+                2 * 2 * decoder["num_hidden_layers"] * decoder["num_key_value_heads"] * decoder["head_size"]
+            )
+        except (KeyError, TypeError):
+            self.kv_bytes_per_token = 0
 
-            params = og.GeneratorParams(self._model)
-            params.set_search_options(**search_options)
+    def _init_speculative(self):
+        """Carrega o modelo de rascunho da decodificação especulativa, se configurado"""
+        if not self.draft_model_path or not self._model:
+            return
+        if not self.eos_token_ids:
+            log.warning("EOS desconhecido (genai_config.json) - decodificação especulativa desativada")
+            return
 
-            # Sem guidance por padrão (simplificar)
-            generator = og.Generator(self._model, params)
+        try:
+            self._speculative = SpeculativeDecoder(
+                self.draft_model_path,
+                num_tokens=settings.llm_speculative_tokens,
+                eos_token_ids=self.eos_token_ids,
+                execution_provider=settings.llm_draft_execution_provider
+            )
+            log.info(f"✅ Modelo de rascunho carregado ({self.draft_model_path}, "
+                     f"{settings.llm_speculative_tokens} tokens por rodada)")
+        except Exception as e:
+            log.warning(f"Modelo de rascunho indisponível ({e}) - decodificação normal")
+
+    def _init_scheduler(self):
+        """Ativa o scheduler de batching quando configurado (llm_max_batch_size > 1)"""
+        if not self._model:
+            return
+
+        if not self.eos_token_ids:
+            log.warning("EOS desconhecido - batching desativado, gerando uma sequência por vez")
+            return
+
+        # Lote sob demanda para generate_many (sem thread nem fila)
+        if settings.llm_generate_many_max_batch > 1:
+            self._batch_runner = BatchScheduler(
+                self,
+                max_batch_size=settings.llm_generate_many_max_batch,
+                batch_window_ms=0
+            )
+
+        if self.max_batch_size <= 1:
+            return
 
-            # Usar template direto que funcionou no teste
-            system_prompt = gen_kwargs.get('system_prompt', 'You are a helpful AI assistant.')
+        self._scheduler = BatchScheduler(
+            self,
+            max_batch_size=self.max_batch_size,
+            batch_window_ms=settings.llm_batch_window_ms
+        )
+        self._scheduler.start()
 
-            # Escapar quebras de linha no JSON para evitar erro de parsing
-            escaped_system = system_prompt.replace('\n', '\\n').replace('\r', '\\r').replace('"', '\\"')
-            escaped_prompt = prompt.replace('\n', '\\n').replace('\r', '\\r').replace('"', '\\"')
+    def _init_prefix_cache(self):
+        """Ativa o cache de prefixo (KV) para system prompts registrados"""
+        if not self._model or not settings.llm_prefix_cache_enabled:
+            return
+
+        if not PrefixCache.is_supported():
+            log.warning("onnxruntime-genai sem rewind_to - cache de prefixo desativado")
+            return
+
+        self._prefix_cache = PrefixCache(
+            self,
+            max_entries=settings.llm_prefix_cache_max_entries,
+            max_length=settings.llm_prefix_cache_max_length
+        )
+        self._prefix_cache.register(DEFAULT_SYSTEM_PROMPT)
+
+    def _init_sessions(self):
+        """Ativa a retenção de KV por conversa (generate_* com conversation_id)"""
+        if not self._model or not settings.llm_sessions_enabled:
+            return
+
+        self._sessions = SessionStore(
+            self,
+            max_sessions=settings.llm_session_max_sessions,
+            ttl_seconds=settings.llm_session_ttl_seconds,
+            max_length=settings.llm_session_max_length,
+            max_memory_mb=settings.llm_session_max_memory_mb
+        )
+
+    def _init_executor(self):
+        """Threads dedicadas para as chamadas assíncronas (agenerate/generate_stream)"""
+        # Com batching, cada sequência do lote ocupa uma thread esperando o resultado
+        self._executor = InferenceExecutor(
+            workers=max(settings.llm_executor_workers, self.max_batch_size),
+            max_queue_size=settings.llm_executor_max_queue,
+            interactive_workers=settings.llm_executor_interactive_workers
+        )
+        self._executor.start()
+
+    def end_session(self, conversation_id: str):
+        """Descarta o estado de geração retido de uma conversa"""
+        if self._sessions is not None:
+            self._sessions.end(conversation_id)
+
+    def register_prefix(self, system_prompt: str):
+        """
+        Registra um system prompt estático para reuso do prefill.
+
+        Gerações com esse ``system_prompt`` partem do KV já calculado e só
+        fazem prefill da mensagem do usuário.
+        """
+        if self._prefix_cache is not None:
+            self._prefix_cache.register(system_prompt)
+
+    def _build_search_options(self, gen_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Monta as search options no mesmo formato do model-qa.py"""
+        return {
+            'do_sample': gen_kwargs.get('do_sample', True),
+            'max_length': gen_kwargs.get('max_length', 512),
+            'min_length': gen_kwargs.get('min_length', 0),
+            'top_p': gen_kwargs.get('top_p', 0.9),
+            'top_k': gen_kwargs.get('top_k', 50),
+            'temperature': gen_kwargs.get('temperature', 0.3),
+            'repetition_penalty': gen_kwargs.get('repetition_penalty', 1.0),
+            'batch_size': 1
+        }
+
+    def _apply_template(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        """Aplica o chat template a uma lista de mensagens role/content"""
+        messages_json = json.dumps(
+            [{"role": m["role"], "content": m["content"]} for m in messages], ensure_ascii=False
+        )
+        return self._tokenizer.apply_chat_template(messages=messages_json, add_generation_prompt=add_generation_prompt)
+
+    def _encode_fragment(self, text: str):
+        """Tokeniza um trecho do meio da sequência (sem tokens de início como BOS)"""
+        tokens = self._tokenizer.encode(text)
+        if self._leading_tokens is None:
+            self._leading_tokens = [int(t) for t in self._tokenizer.encode("")]
+        leading = self._leading_tokens
+        if leading and [int(t) for t in tokens[:len(leading)]] == leading:
+            tokens = tokens[len(leading):]
+        return tokens
 
-            messages = f"""[{{"role": "system", "content": "{escaped_system}"}}, {{"role": "user", "content": "{escaped_prompt}"}}]"""
+    def _encode_segment(self, segment_text: str) -> np.ndarray:
+        """Tokens de um trecho fixo do início do template (memoizados)"""
+        with self._segment_lock:
+            tokens = self._segment_cache.get(segment_text)
+            if tokens is not None:
+                self._segment_cache.move_to_end(segment_text)
+                self._tokenization_stats["segment_hits"] += 1
+                self._tokenization_stats["tokens_reused"] += len(tokens)
+                return tokens
 
-            if self._model.type == "marian-ssru":
-                input_text = prompt
+        tokens = np.asarray(self._tokenizer.encode(segment_text), dtype=np.int32)
+        with self._segment_lock:
+            self._tokenization_stats["segment_misses"] += 1
+            self._segment_cache[segment_text] = tokens
+            while len(self._segment_cache) > _SEGMENT_CACHE_SIZE:
+                self._segment_cache.popitem(last=False)
+        return tokens
+
+    def _encode_messages(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        """
+        Aplica o chat template e tokeniza as mensagens.
+
+        Tudo antes da última mensagem (system prompt, instruções fixas) é
+        tokenizado uma vez e memoizado; a cada chamada só o trecho novo passa
+        pelo tokenizer e os ids são concatenados.
+        """
+        full_text = self._apply_template(messages)
+        if len(messages) > 1:
+            segment_text = self._apply_template(messages[:-1], add_generation_prompt=False)
+            if segment_text and full_text.startswith(segment_text):
+                segment = self._encode_segment(segment_text)
+                delta = np.asarray(self._encode_fragment(full_text[len(segment_text):]), dtype=np.int32)
+                return np.concatenate([segment, delta])
+
+        return self._tokenizer.encode(full_text)
+
+    def _build_messages(self, prompt: str, gen_kwargs: Dict[str, Any]) -> List[Dict[str, str]]:
+        """System prompt + mensagens fixas (``messages``) + prompt do usuário"""
+        return (
+            [{"role": "system", "content": gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT)}]
+            + [{"role": m["role"], "content": m["content"]} for m in gen_kwargs.get('messages') or []]
+            + [{"role": "user", "content": prompt}]
+        )
+
+    def _encode_system_prefix(self, system_prompt: str):
+        """Tokeniza apenas a mensagem de sistema (prefixo comum às gerações)"""
+        prefix_text = self._apply_template([{"role": "system", "content": system_prompt}], add_generation_prompt=False)
+        return self._encode_segment(prefix_text)
+
+    def _encode_prompt(self, prompt: str, system_prompt: str,
+                       messages: Optional[List[Dict[str, str]]] = None):
+        """Aplica o chat template e tokeniza o prompt"""
+        if self._model.type == "marian-ssru":
+            return self._tokenizer.encode(prompt)
+
+        return self._encode_messages(
+            self._build_messages(prompt, {'system_prompt': system_prompt, 'messages': messages})
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """Número de tokens de ``text`` no tokenizer do modelo (estimativa sem modelo)"""
+        if self._tokenizer is None:
+            return (len(text) + 3) // 4
+        return len(self._encode_fragment(text))
+
+    def truncate_tokens(self, text: str, max_tokens: int, from_end: bool = False) -> str:
+        """Corta ``text`` em ``max_tokens`` tokens (o final, com ``from_end``)"""
+        if max_tokens <= 0:
+            return ""
+        if self._tokenizer is None:
+            chars = max_tokens * 4
+            return text[-chars:] if from_end else text[:chars]
+
+        tokens = self._encode_fragment(text)
+        if len(tokens) <= max_tokens:
+            return text
+        kept = tokens[-max_tokens:] if from_end else tokens[:max_tokens]
+        return self._tokenizer.decode(kept)
+
+    def prompt_overhead_tokens(self, system_prompt: Optional[str] = None) -> int:
+        """Tokens do chat template e do system prompt em volta do prompt do usuário"""
+        if system_prompt is None:
+            system_prompt = DEFAULT_SYSTEM_PROMPT
+        overhead = self._overhead_tokens.get(system_prompt)
+        if overhead is None:
+            if self._model is None:
+                overhead = self.count_tokens(system_prompt)
             else:
-                # Usar diretamente o template que funcionou no teste direto
-                input_text = self._tokenizer.apply_chat_template(messages=messages, add_generation_prompt=True)
-                log.info(f"Template aplicado: {repr(input_text[:100])}...")
+                overhead = len(self._encode_prompt("", system_prompt))
+            self._overhead_tokens[system_prompt] = overhead
+        return overhead
+
+    def _prepare_generation(self, prompt: str, gen_kwargs: Dict[str, Any],
+                            trace: Optional[GenerationTrace] = None):
+        """
+        Tokeniza o prompt e ajusta as search options ao seu tamanho.
+
+        Com ``trace`` (geração de fato, não pontuação), o orçamento de resposta
+        vem do preditor de tamanho quando a chave já tem histórico.
+        """
+        if not self._model:
+            raise RuntimeError("Modelo LLM não inicializado")
 
-            input_tokens = self._tokenizer.encode(input_text)
+        search_options = self._build_search_options(gen_kwargs)
 
-            # Ajustar max_length para levar em conta o tamanho do prompt
-            # Garantir que haja pelo menos espaço para 100 tokens de resposta
-            input_length = len(input_tokens)
-            adjusted_max_length = max(gen_kwargs.get('max_length', 512), input_length + 100)
+        system_prompt = gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT)
+        input_tokens = self._encode_prompt(prompt, system_prompt, gen_kwargs.get('messages'))
 
-            # Atualizar os parâmetros de busca com o max_length ajustado
-            search_options['max_length'] = adjusted_max_length
-            params.set_search_options(**search_options)
+        input_length = len(input_tokens)
+        new_tokens = self._new_tokens_budget(search_options, input_length, gen_kwargs, trace)
+        if new_tokens != search_options['max_length'] - input_length:
+            log.debug(f"max_length {search_options['max_length']} -> prompt ({input_length} tokens) + "
+                      f"{new_tokens}")
+        search_options['max_length'] = input_length + new_tokens
 
-            generator.append_tokens(input_tokens)
+        return input_tokens, search_options
+
+    def _new_tokens_budget(self, search_options: Dict[str, Any], prompt_tokens: int,
+                           gen_kwargs: Dict[str, Any], trace: Optional[GenerationTrace] = None) -> int:
+        """
+        Orçamento de tokens de resposta.
+
+        max_length conta prompt + resposta. Com max_new_tokens o orçamento é
+        explícito; sem ele, garante-se o mínimo de llm_min_new_tokens. Com
+        ``trace``, o preditor de tamanho substitui esse valor (limitado ao
+        max_new_tokens explícito) e a chave/orçamento ficam no registro.
+        """
+        max_new_tokens = gen_kwargs.get('max_new_tokens')
+        if max_new_tokens is not None:
+            default = max_new_tokens
+        else:
+            default = max(search_options['max_length'] - prompt_tokens, settings.llm_min_new_tokens)
+        if trace is None:
+            return default
+
+        key = length_predictor.make_key(
+            resolve_caller(gen_kwargs.get('caller')), gen_kwargs.get('length_key'),
+            gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT)
+        )
+        budget, source, _ = length_predictor.budget(key, default, cap=max_new_tokens)
+        trace.length_key, trace.budget, trace.budget_source = key, budget, source
+        return budget
+
+    def _iter_generate(self, prompt: str, stop_event: Optional[threading.Event] = None,
+                       **gen_kwargs) -> Iterator[str]:
+        """
+        Loop de geração token a token (síncrono), baseado no model-qa.py.
+
+        Produz cada trecho decodificado assim que o token é gerado. Se
+        ``stop_event`` for sinalizado, a geração é interrompida no próximo token.
+        Tokens, prefill, TTFT e latência por token vão para a telemetria.
+        """
+        trace = generation_telemetry.trace(gen_kwargs.get('caller'), self._model_name)
+        completed = False
+        try:
+            for chunk in self._iter_generate_traced(prompt, stop_event, trace, gen_kwargs):
+                trace.token()
+                yield chunk
+            completed = True
+        finally:
+            trace.interrupted = not completed or (stop_event is not None and stop_event.is_set())
+            trace.finish()
+
+    def _iter_generate_traced(self, prompt: str, stop_event: Optional[threading.Event],
+                              trace: GenerationTrace, gen_kwargs: Dict[str, Any]) -> Iterator[str]:
+        priority = Priority.coerce(gen_kwargs.get('priority'))
+        conversation_id = gen_kwargs.get('conversation_id')
+        if conversation_id and self._sessions is not None and self._model.type != "marian-ssru":
+            session_chunks = self._iter_session_generate(prompt, conversation_id, stop_event, gen_kwargs, trace)
+            if session_chunks is not None:
+                try:
+                    yield from session_chunks
+                    return
+                except _SessionOverflow as e:
+                    log.info(f"Sessão {conversation_id} encerrada ({e}) - gerando sem retenção de KV")
+
+        input_tokens, search_options = self._prepare_generation(prompt, gen_kwargs, trace)
+        max_new_tokens = search_options['max_length'] - len(input_tokens)
+        trace.prompt_tokens = len(input_tokens)
+
+        if self._speculative is not None and self._speculative.supports(search_options):
+            with trace.prefill():
+                run = self._start_speculative(input_tokens, search_options)
+            if run is not None:
+                trace.path = "speculative"
+                yield from self._speculative_loop(run, max_new_tokens, stop_event, priority)
+                return
+
+        # Reusar o KV do system prompt quando ele estiver registrado
+        if self._prefix_cache is not None and self._model.type != "marian-ssru":
+            system_prompt = gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT)
+            entry = self._prefix_cache.acquire(system_prompt, input_tokens, search_options)
+            if entry is not None:
+                trace.path = "prefix"
+                try:
+                    with trace.prefill():
+                        entry.generator.append_tokens(input_tokens[entry.prefix_length:])
+                    yield from self._decode_loop(entry.generator, stop_event, max_new_tokens, priority=priority)
+                finally:
+                    self._prefix_cache.release(entry)
+                return
 
-            # Gerar resposta exatamente como no model-qa.py
-            response = ""
-            while not generator.is_done():
-                generator.generate_next_token()
-                new_token = generator.get_next_tokens()[0]
-                token_text = self._tokenizer_stream.decode(new_token)
-                response += token_text
+        params = og.GeneratorParams(self._model)
+        params.set_search_options(**search_options)
 
+        # Sem guidance por padrão (simplificar)
+        generator = og.Generator(self._model, params)
+
+        try:
+            with trace.prefill():
+                generator.append_tokens(input_tokens)
+            yield from self._decode_loop(generator, stop_event, priority=priority)
+        finally:
             # Limpar recursos
             del generator
 
-            return response.strip()
+    def _iter_session_generate(self, prompt: str, conversation_id: str,
+                               stop_event: Optional[threading.Event],
+                               gen_kwargs: Dict[str, Any],
+                               trace: Optional[GenerationTrace] = None) -> Optional[Iterator[str]]:
+        """
+        Geração dentro da sessão da conversa: só os tokens do novo turno passam
+        por prefill. Retorna None se a sessão estiver ocupada (a chamada segue
+        pelo caminho normal, sem retenção).
+        """
+        search_options = self._build_search_options(gen_kwargs)
+        system_prompt = gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT)
+
+        session = self._sessions.acquire(conversation_id, system_prompt, search_options)
+        if session is None:
+            log.info(f"Sessão {conversation_id} ocupada - gerando sem retenção de KV")
+            return None
+
+        return self._run_session_turn(session, prompt, search_options, stop_event,
+                                      gen_kwargs.get('history') or [],
+                                      Priority.coerce(gen_kwargs.get('priority')),
+                                      gen_kwargs, trace)
+
+    def _run_session_turn(self, session: ConversationSession, prompt: str,
+                          search_options: Dict[str, Any], stop_event: Optional[threading.Event],
+                          history: List[Dict[str, str]],
+                          priority: Priority = Priority.STANDARD,
+                          gen_kwargs: Optional[Dict[str, Any]] = None,
+                          trace: Optional[GenerationTrace] = None) -> Iterator[str]:
+        gen_kwargs = gen_kwargs or {}
+        keep = False
+        try:
+            user_message = {"role": "user", "content": prompt}
+            delta_tokens = None
+            reused = False
+
+            if not session.is_empty:
+                messages = session.messages + [user_message]
+                full_text = self._apply_template(messages)
+                if full_text.startswith(session.templated_text):
+                    # Só o trecho novo do template (fim do turno anterior + nova mensagem)
+                    delta_tokens = self._encode_fragment(full_text[len(session.templated_text):])
+                    reused = True
+
+            # Mesmo orçamento de resposta do caminho normal (ver _new_tokens_budget)
+            prompt_tokens = len(delta_tokens) if delta_tokens is not None else 0
+            new_tokens = self._new_tokens_budget(search_options, prompt_tokens, gen_kwargs, trace)
+
+            if reused and session.length + prompt_tokens + new_tokens > self._sessions.max_length:
+                log.info(f"Sessão {session.conversation_id} cheia - reconstruindo")
+                reused = False
+
+            if not reused:
+                # Sessão nova (ou descartada): system + histórico recente + nova mensagem;
+                # se não couber, o histórico mais antigo sai primeiro
+                SessionStore.reset(session)
+                history = list(history)
+                while True:
+                    messages = [{"role": "system", "content": session.system_prompt}] + history + [user_message]
+                    delta_tokens = self._tokenizer.encode(self._apply_template(messages))
+                    new_tokens = self._new_tokens_budget(search_options, len(delta_tokens), gen_kwargs, trace)
+                    if len(delta_tokens) + new_tokens <= self._sessions.max_length:
+                        break
+                    if not history:
+                        # Nem a mensagem sozinha cabe: a sessão sai e o caminho normal atende
+                        self._sessions.end(session.conversation_id)
+                        raise _SessionOverflow("prompt maior que o tamanho máximo da sessão")
+                    del history[:2 if len(history) > 1 else 1]
+                session.generator = self._sessions.new_generator(search_options)
+
+            saved = session.length if reused else 0
+            self._sessions.record_turn(len(delta_tokens), saved, reused)
+
+            if trace is not None:
+                trace.path = "session"
+                trace.prompt_tokens = len(delta_tokens)
+                with trace.prefill():
+                    session.generator.append_tokens(delta_tokens)
+            else:
+                session.generator.append_tokens(delta_tokens)
+
+            chunks: List[str] = []
+            outcome: Dict[str, Any] = {}
+            for chunk in self._decode_loop(session.generator, stop_event, new_tokens, outcome, priority):
+                chunks.append(chunk)
+                yield chunk
+
+            # Sem EOS a sequência retida não fecha o turno do assistente: descartar
+            if outcome.get("eos"):
+                session.messages = messages + [{"role": "assistant", "content": "".join(chunks).strip()}]
+                session.templated_text = self._apply_template(session.messages, add_generation_prompt=False)
+                session.length = len(session.generator.get_sequence(0))
+                session.turns += 1
+                keep = True
+        finally:
+            self._sessions.release(session, keep=keep)
+
+    def _start_speculative(self, input_tokens, search_options: Dict[str, Any]):
+        """Prefill nos modelos principal e de rascunho; None se o runtime não permitir"""
+        try:
+            return self._speculative.start(self._model, input_tokens, search_options)
+        except SpeculativeUnavailable as e:
+            self._speculative.disable(str(e))
+        except Exception as e:
+            self._speculative.disable(f"erro no prefill ({e})")
+        return None
+
+    def _speculative_loop(self, run, max_new_tokens: int, stop_event: Optional[threading.Event],
+                          priority: Priority) -> Iterator[str]:
+        """Mesmo contrato de ``_decode_loop``, com rodadas de rascunho + verificação"""
+        tokenizer_stream = self._tokenizer.create_stream()
+
+        def _should_stop() -> bool:
+            if stop_event is not None and stop_event.is_set():
+                log.info(f"Geração interrompida ({getattr(stop_event, 'reason', None) or 'consumidor'})")
+                return True
+            return False
+
+        for token in run.tokens(max_new_tokens, _should_stop, lambda: self._priority_gate.wait_turn(priority)):
+            if token in self.eos_token_ids:
+                break
+            yield tokenizer_stream.decode(token)
+
+    def _decode_loop(self, generator, stop_event: Optional[threading.Event] = None,
+                     max_new_tokens: Optional[int] = None,
+                     outcome: Optional[Dict[str, Any]] = None,
+                     priority: Priority = Priority.STANDARD) -> Iterator[str]:
+        """
+        Loop token a token do model-qa.py.
+
+        Com ``max_new_tokens`` (generator compartilhado, cujo max_length não
+        corresponde a esta chamada), o orçamento e o EOS são controlados aqui.
+        ``outcome`` recebe ``eos`` (terminou por EOS) e ``generated``.
+        Antes de cada token, gerações de prioridade menor cedem a vez (PriorityGate).
+        """
+        # Stream de decodificação próprio por chamada: o stream guarda estado
+        # entre tokens e não pode ser compartilhado entre gerações concorrentes
+        tokenizer_stream = self._tokenizer.create_stream()
+        generated = 0
+
+        while not generator.is_done():
+            if stop_event is not None and stop_event.is_set():
+                log.info(f"Geração interrompida ({getattr(stop_event, 'reason', None) or 'consumidor'})")
+                break
+            self._priority_gate.wait_turn(priority)
+            generator.generate_next_token()
+            new_token = generator.get_next_tokens()[0]
+            if int(new_token) in self.eos_token_ids:
+                if outcome is not None:
+                    outcome["eos"] = True
+                if max_new_tokens is not None:
+                    break
+            generated += 1
+            if outcome is not None:
+                outcome["generated"] = generated
+            yield tokenizer_stream.decode(new_token)
+            if max_new_tokens is not None and generated >= max_new_tokens:
+                break
+
+    def generate_text(self, prompt: str, **gen_kwargs) -> str:
+        """
+        Geração de texto baseada exatamente no model-qa.py
+
+        Com ``cache=True`` a resposta é buscada/armazenada no cache de
+        respostas (correspondência exata de prompt, system prompt e opções).
+        ``priority`` (interactive, standard, background) define quem cede a
+        vez quando há gerações concorrentes.
+
+        ``cancel_token`` (ou o token do ``cancellation_scope`` corrente) e
+        ``timeout_s`` interrompem a decodificação entre tokens; a saída
+        parcial volta como ``GenerationResult`` com ``truncated=True``.
+        """
+        try:
+            priority = Priority.coerce(gen_kwargs.get('priority'))
+
+            cache_key = None
+            if gen_kwargs.get('cache') and settings.llm_response_cache_enabled:
+                cache_key = self._response_cache_key(prompt, gen_kwargs)
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    # Do disco volta uma str simples: mesmo tipo de retorno em todos os caminhos
+                    return GenerationResult(cached)
+
+            token = resolve_cancellation(gen_kwargs.pop('cancel_token', None), gen_kwargs.pop('timeout_s', None))
+            if token is not None and token.is_set():
+                log.info(f"Geração descartada antes de começar ({token.reason})")
+                return GenerationResult("", token.reason)
+
+            with self._priority_gate.track(priority):
+                if self._scheduler is not None and not gen_kwargs.get('conversation_id'):
+                    # Decodificação em lote com outras chamadas concorrentes
+                    response = self._scheduler.submit(prompt, stop_event=token, **gen_kwargs).result()
+                else:
+                    response = "".join(self._iter_generate(prompt, stop_event=token, **gen_kwargs))
+            result = self._finish(response, token)
+
+            if cache_key is not None and not result.truncated:
+                response_cache.put(cache_key, result)
+            return result
 
         except Exception as e:
             log.error(f"Erro na geração de texto: {e}")
             raise
 
+    def generate_chat(self, messages: List[Dict[str, str]], **gen_kwargs) -> str:
+        """
+        Geração a partir de uma lista de mensagens role/content.
+
+        Uma mensagem ``system`` inicial vira o ``system_prompt``; a última deve
+        ser do usuário. As intermediárias (instruções fixas, exemplos) têm a
+        tokenização memoizada entre chamadas.
+        """
+        system_prompt, fixed, prompt = self._split_messages(messages)
+        if system_prompt is not None:
+            gen_kwargs['system_prompt'] = system_prompt
+        return self.generate_text(prompt, messages=fixed, **gen_kwargs)
+
+    async def agenerate_chat(self, messages: List[Dict[str, str]], **gen_kwargs) -> str:
+        """Versão assíncrona de ``generate_chat``"""
+        system_prompt, fixed, prompt = self._split_messages(messages)
+        if system_prompt is not None:
+            gen_kwargs['system_prompt'] = system_prompt
+        return await self.agenerate(prompt, messages=fixed, **gen_kwargs)
+
+    @staticmethod
+    def _split_messages(messages: List[Dict[str, str]]):
+        if not messages or messages[-1].get("role") != "user":
+            raise ValueError("A última mensagem deve ser do usuário")
+        system_prompt = None
+        if messages[0].get("role") == "system":
+            system_prompt, messages = messages[0]["content"], messages[1:]
+        return system_prompt, list(messages[:-1]), messages[-1]["content"]
+
+    @staticmethod
+    def _finish(text: str, token: Optional[CancellationToken]) -> GenerationResult:
+        if token is not None and token.is_set():
+            return GenerationResult(text.strip(), token.reason)
+        # O scheduler já devolve o motivo do fim (sequência interrompida)
+        return GenerationResult(text.strip(), getattr(text, "finish_reason", "completed"))
+
+    async def _run_cancellable(self, priority: Priority, func, *args, **kwargs):
+        """
+        Executa ``func`` no executor de inferência com um token próprio
+        (filho do token do contexto): se a task for cancelada, só esta
+        geração para.
+        """
+        token = CancellationToken(
+            timeout_s=kwargs.pop('timeout_s', None),
+            parent=resolve_cancellation(kwargs.pop('cancel_token', None))
+        )
+        future = self._executor.submit(priority, func, *args, cancel_token=token, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            token.cancel("cancelled")
+            raise
+
+    def _response_cache_key(self, prompt: str, gen_kwargs: Dict[str, Any]) -> str:
+        options = self._build_search_options(gen_kwargs)
+        if gen_kwargs.get('max_new_tokens') is not None:
+            options['max_new_tokens'] = gen_kwargs['max_new_tokens']
+        if gen_kwargs.get('messages'):
+            # Mensagens fixas entram na chave junto com o prompt
+            prompt = json.dumps(self._build_messages(prompt, gen_kwargs)[1:], ensure_ascii=False)
+        return response_cache.make_key(
+            self.model_path,
+            prompt,
+            gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+            options
+        )
+
+    def generate_many(self, prompts: List[str],
+                      options: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+                      **gen_kwargs) -> List[str]:
+        """
+        Gera respostas para prompts independentes em uma única decodificação
+        em lote: o tempo total fica próximo ao do prompt mais longo, em vez da
+        soma das chamadas sequenciais.
+
+        Args:
+            prompts: Prompts que não dependem uns dos outros
+            options: Parâmetros de ``generate_text`` por prompt (lista, na mesma
+                ordem) ou comuns a todos (dict); sobrepõem ``gen_kwargs``
+
+        Returns:
+            Respostas na ordem dos prompts
+        """
+        if options is None:
+            per_prompt: List[Dict[str, Any]] = [{} for _ in prompts]
+        elif isinstance(options, dict):
+            per_prompt = [options for _ in prompts]
+        else:
+            per_prompt = list(options)
+            if len(per_prompt) != len(prompts):
+                raise ValueError("options deve ter um item por prompt")
+
+        token = resolve_cancellation(gen_kwargs.pop('cancel_token', None), gen_kwargs.pop('timeout_s', None))
+
+        try:
+            requests = [(prompt, {**gen_kwargs, **opts}) for prompt, opts in zip(prompts, per_prompt)]
+            results: List[Optional[str]] = [None] * len(requests)
+
+            cache_keys: Dict[int, str] = {}
+            pending: List[int] = []
+            for i, (prompt, kwargs) in enumerate(requests):
+                if kwargs.get('cache') and settings.llm_response_cache_enabled:
+                    cache_keys[i] = self._response_cache_key(prompt, kwargs)
+                    cached = response_cache.get(cache_keys[i])
+                    if cached is not None:
+                        results[i] = GenerationResult(cached)
+                        continue
+                pending.append(i)
+
+            texts: List[str] = []
+            if pending and token is not None and token.is_set():
+                log.info(f"Geração em lote descartada antes de começar ({token.reason})")
+                texts = ["" for _ in pending]
+            elif pending:
+                priority = min(Priority.coerce(requests[i][1].get('priority')) for i in pending)
+                with self._priority_gate.track(priority):
+                    texts = self._generate_batch([requests[i] for i in pending], stop_event=token)
+
+            for i, text in zip(pending, texts):
+                results[i] = self._finish(text, token)
+                if i in cache_keys and not results[i].truncated:
+                    response_cache.put(cache_keys[i], results[i])
+
+            return results
+
+        except Exception as e:
+            log.error(f"Erro na geração em lote: {e}")
+            raise
+
+    async def agenerate_many(self, prompts: List[str],
+                             options: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]] = None,
+                             **gen_kwargs) -> List[str]:
+        """Versão assíncrona de ``generate_many`` (um único pedido no executor de inferência)"""
+        per_prompt = options if isinstance(options, list) else [options or {}]
+        priority = min(Priority.coerce({**gen_kwargs, **opts}.get('priority')) for opts in per_prompt)
+        return await self._run_cancellable(priority, self.generate_many, prompts, options, **gen_kwargs)
+
+    def _generate_batch(self, requests: List[Tuple[str, Dict[str, Any]]],
+                        stop_event: Optional[CancellationToken] = None) -> List[str]:
+        """Decodifica os pedidos juntos; em sequência se o modelo não aceitar lote"""
+        def _sequential() -> List[str]:
+            return ["".join(self._iter_generate(prompt, stop_event=stop_event, **kwargs))
+                    for prompt, kwargs in requests]
+
+        if len(requests) == 1 or any(kwargs.get('conversation_id') for _, kwargs in requests):
+            return _sequential()
+
+        if self._scheduler is not None:
+            # Scheduler contínuo ativo: os pedidos entram juntos na mesma onda
+            futures = [self._scheduler.submit(prompt, stop_event=stop_event, **kwargs) for prompt, kwargs in requests]
+            return [future.result() for future in futures]
+
+        if self._batch_runner is None or not self._batch_generation_supported:
+            return _sequential()
+
+        try:
+            return self._batch_runner.run_batch(requests, stop_event=stop_event)
+        except Exception as e:
+            # Ex.: modelos QNN exportados com batch fixo em 1
+            log.warning(f"Decodificação em lote indisponível ({e}) - gerando em sequência")
+            self._batch_generation_supported = False
+            return _sequential()
+
+    async def agenerate(self, prompt: str, **gen_kwargs) -> str:
+        """
+        Versão assíncrona de ``generate_text``.
+
+        A geração roda no executor de inferência, sem bloquear o event loop.
+        Levanta ``InferenceQueueFull`` se a fila de inferência estiver cheia.
+        Se a task for cancelada, a decodificação para no próximo token.
+        """
+        priority = Priority.coerce(gen_kwargs.get('priority'))
+        return await self._run_cancellable(priority, self.generate_text, prompt, **gen_kwargs)
+
+    async def generate_stream(self, prompt: str, outcome: Optional[Dict[str, Any]] = None,
+                              **gen_kwargs) -> AsyncIterator[str]:
+        """
+        Geração em streaming: produz os trechos decodificados à medida que
+        cada token é gerado, sem esperar o fim da resposta.
+
+        O loop de decodificação roda em uma thread para não bloquear o event
+        loop. Se o consumidor abandonar o iterador (ou o prazo/token de
+        cancelamento disparar), a geração é interrompida.
+
+        ``outcome`` recebe, no fim do stream, ``finish_reason`` e
+        ``truncated`` (mesmo significado de ``GenerationResult``).
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop_event = CancellationToken(
+            timeout_s=gen_kwargs.pop('timeout_s', None),
+            parent=resolve_cancellation(gen_kwargs.pop('cancel_token', None))
+        )
+
+        def _emit(chunk: str):
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+        priority = Priority.coerce(gen_kwargs.get('priority'))
+
+        def _produce():
+            try:
+                with self._priority_gate.track(priority):
+                    if self._scheduler is not None and not gen_kwargs.get('conversation_id'):
+                        self._scheduler.submit(prompt, on_chunk=_emit, stop_event=stop_event, **gen_kwargs).result()
+                    else:
+                        for chunk in self._iter_generate(prompt, stop_event=stop_event, **gen_kwargs):
+                            _emit(chunk)
+            except Exception as e:
+                log.error(f"Erro na geração em streaming: {e}")
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+        self._executor.submit(priority, _produce)
+        started = False
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    if outcome is not None:
+                        outcome["finish_reason"] = stop_event.reason if stop_event.is_set() else "completed"
+                        outcome["truncated"] = stop_event.is_set()
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                # Mesmo comportamento do strip() de generate_text no início da resposta
+                if not started:
+                    item = item.lstrip()
+                    if not item:
+                        continue
+                    started = True
+                yield item
+        finally:
+            stop_event.set()
+
+    def generate_choice(self, prompt: str, choices: List[str], **gen_kwargs) -> Optional[str]:
+        """
+        Classificação com saída restrita a um conjunto fechado de rótulos.
+
+        Com guidance (regex com os rótulos), o modelo só consegue emitir um
+        deles e a geração para assim que o rótulo termina: poucos passos de
+        decodificação em vez de ``max_length``. Sem suporte a guidance, gera
+        uma resposta curta (greedy) e procura o rótulo no texto.
+
+        Aceita os mesmos ``system_prompt``, ``cache``, ``priority``,
+        ``cancel_token`` e ``timeout_s`` de ``generate_text``.
+
+        Returns:
+            O rótulo escolhido, ou None se a resposta não contiver nenhum
+            (ou a classificação for cancelada antes de fechar o rótulo)
+        """
+        if not choices:
+            raise ValueError("choices não pode ser vazio")
+
+        try:
+            priority = Priority.coerce(gen_kwargs.get('priority'))
+            gen_kwargs = {**gen_kwargs, 'do_sample': False}
+            token = resolve_cancellation(gen_kwargs.pop('cancel_token', None), gen_kwargs.pop('timeout_s', None))
+
+            cache_key = None
+            if gen_kwargs.get('cache') and settings.llm_response_cache_enabled:
+                search_options = self._build_search_options(gen_kwargs)
+                search_options['choices'] = list(choices)
+                cache_key = response_cache.make_key(
+                    self.model_path,
+                    prompt,
+                    gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+                    search_options
+                )
+                cached = response_cache.get(cache_key)
+                if cached in choices:
+                    return cached
+
+            if token is not None and token.is_set():
+                log.info(f"Classificação descartada antes de começar ({token.reason})")
+                return None
+
+            with self._priority_gate.track(priority):
+                label = self._choose(prompt, list(choices), priority, gen_kwargs, stop_event=token)
+
+            # Interrompida, o rótulo pode ser só o prefixo de outro: não vai para o cache
+            if cache_key is not None and label is not None and not (token is not None and token.is_set()):
+                response_cache.put(cache_key, label)
+            return label
+
+        except Exception as e:
+            log.error(f"Erro na classificação restrita: {e}")
+            raise
+
+    async def agenerate_choice(self, prompt: str, choices: List[str], **gen_kwargs) -> Optional[str]:
+        """Versão assíncrona de ``generate_choice`` (roda no executor de inferência)"""
+        priority = Priority.coerce(gen_kwargs.get('priority'))
+        return await self._run_cancellable(priority, self.generate_choice, prompt, choices, **gen_kwargs)
+
+    def _choose(self, prompt: str, choices: List[str], priority: Priority,
+                gen_kwargs: Dict[str, Any], stop_event: Optional[threading.Event] = None) -> Optional[str]:
+        input_tokens, search_options = self._prepare_generation(prompt, gen_kwargs)
+
+        # Orçamento: o rótulo mais longo (+ EOS); sem guidance, folga para aspas/pontuação
+        label_tokens = max(len(self._encode_fragment(choice)) for choice in choices)
+        guided = self._guidance_supported
+        budget = label_tokens + (2 if guided else 8)
+        search_options['max_length'] = len(input_tokens) + budget
+
+        params = og.GeneratorParams(self._model)
+        params.set_search_options(**search_options)
+        if guided:
+            try:
+                params.set_guidance("regex", "(" + "|".join(re.escape(choice) for choice in choices) + ")")
+            except Exception as e:
+                log.warning(f"Guidance indisponível, classificando pelo texto gerado: {e}")
+                self._guidance_supported = False
+                guided = False
+                budget = label_tokens + 8
+                search_options['max_length'] = len(input_tokens) + budget
+                params = og.GeneratorParams(self._model)
+                params.set_search_options(**search_options)
+
+        generator = og.Generator(self._model, params)
+        self._choice_stats["calls"] += 1
+        self._choice_stats["guided" if guided else "unguided"] += 1
+
+        try:
+            generator.append_tokens(input_tokens)
+
+            text = ""
+            label = None
+            for chunk in self._decode_loop(generator, stop_event=stop_event, max_new_tokens=budget,
+                                           priority=priority):
+                self._choice_stats["decode_steps"] += 1
+                text += chunk
+                label = self._match_choice(text, choices)
+                # Para assim que o rótulo fecha (e não é prefixo de outro rótulo)
+                if label is not None and not any(
+                    other != label and other.lower().startswith(label.lower()) for other in choices
+                ):
+                    break
+        finally:
+            del generator
+
+        if label is None:
+            self._choice_stats["unmatched"] += 1
+            log.info(f"Nenhum rótulo reconhecido na resposta: {text[:60]!r}")
+        return label
+
+    @staticmethod
+    def _match_choice(text: str, choices: List[str]) -> Optional[str]:
+        """Rótulo (o mais longo, em caso de sobreposição) contido no texto"""
+        lowered = text.lower()
+        found = [choice for choice in choices if choice.lower() in lowered]
+        return max(found, key=len) if found else None
+
+    def score_choices(self, prompt: str, choices: List[str], **gen_kwargs) -> Dict[str, Any]:
+        """
+        Classificação por logits, sem amostrar tokens.
+
+        Um único prefill do prompt fornece a distribuição do primeiro token da
+        resposta; cada rótulo recebe a log-probabilidade do seu primeiro token.
+        Rótulos que começam pelo mesmo token são desempatados avançando token a
+        token só até o ponto em que divergem (com ``rewind_to`` entre rótulos).
+        As probabilidades são renormalizadas entre os rótulos (softmax com a
+        temperatura de calibração ``llm_choice_temperature``).
+
+        Aceita os mesmos ``system_prompt``, ``cache``, ``priority``,
+        ``cancel_token`` e ``timeout_s`` de ``generate_text``.
+
+        Returns:
+            ``label`` (mais provável), ``probabilities`` por rótulo,
+            ``confidence`` (probabilidade do rótulo escolhido), ``margin``
+            (diferença para o segundo), ``label_mass`` (massa de probabilidade
+            que o modelo deu aos rótulos) e ``method`` ("logits";
+            "generation", quando os logits não estão disponíveis; ou
+            "cancelled", com ``label`` None)
+        """
+        if not choices:
+            raise ValueError("choices não pode ser vazio")
+
+        try:
+            priority = Priority.coerce(gen_kwargs.get('priority'))
+            gen_kwargs = dict(gen_kwargs)
+            token = resolve_cancellation(gen_kwargs.pop('cancel_token', None), gen_kwargs.pop('timeout_s', None))
+
+            cache_key = None
+            if gen_kwargs.get('cache') and settings.llm_response_cache_enabled:
+                search_options = self._build_search_options(gen_kwargs)
+                search_options['score_choices'] = list(choices)
+                cache_key = response_cache.make_key(
+                    self.model_path,
+                    prompt,
+                    gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+                    search_options
+                )
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    return json.loads(cached)
+
+            if token is not None and token.is_set():
+                log.info(f"Classificação descartada antes de começar ({token.reason})")
+                return self._unscored(choices, None, "cancelled")
+
+            with self._priority_gate.track(priority):
+                self._priority_gate.wait_turn(priority)
+                try:
+                    scores = self._score_labels(prompt, list(choices), gen_kwargs, stop_event=token)
+                except _ScoringCancelled:
+                    log.info(f"Classificação por logits interrompida ({token.reason})")
+                    return self._unscored(choices, None, "cancelled")
+                except _ScoringUnavailable as e:
+                    log.info(f"Classificação por logits indisponível ({e}), gerando o rótulo")
+                    self._scoring_stats["fallbacks"] += 1
+                    label = self._choose(prompt, list(choices), priority, {**gen_kwargs, 'do_sample': False},
+                                         stop_event=token)
+                    return self._unscored(choices, label, "generation")
+
+            result = self._calibrate(scores)
+            if cache_key is not None:
+                response_cache.put(cache_key, json.dumps(result, ensure_ascii=False))
+            return result
+
+        except Exception as e:
+            log.error(f"Erro na classificação por logits: {e}")
+            raise
+
+    @staticmethod
+    def _unscored(choices: List[str], label: Optional[str], method: str) -> Dict[str, Any]:
+        """Resultado de ``score_choices`` sem logits (rótulo gerado ou classificação cancelada)"""
+        return {
+            "label": label,
+            "probabilities": {choice: float(choice == label) for choice in choices},
+            "confidence": None,
+            "margin": None,
+            "label_mass": None,
+            "method": method,
+        }
+
+    async def ascore_choices(self, prompt: str, choices: List[str], **gen_kwargs) -> Dict[str, Any]:
+        """Versão assíncrona de ``score_choices`` (roda no executor de inferência)"""
+        priority = Priority.coerce(gen_kwargs.get('priority'))
+        return await self._run_cancellable(priority, self.score_choices, prompt, choices, **gen_kwargs)
+
+    async def aclassify(self, prompt: str, choices: List[str], mode: str = "constrained",
+                        **gen_kwargs) -> Optional[str]:
+        """
+        Escolhe um rótulo pelo modo configurado no ponto de chamada.
+
+        Args:
+            mode: "logits" (``score_choices``, sem decodificação) ou
+                "constrained" (``generate_choice``, geração restrita)
+        """
+        if mode == "logits":
+            result = await self.ascore_choices(prompt, choices, **gen_kwargs)
+            return result["label"]
+        return await self.agenerate_choice(prompt, choices, **gen_kwargs)
+
+    def sequence_confidence(self, prompt: str, response: str, **gen_kwargs) -> Optional[float]:
+        """
+        Probabilidade média (geométrica) que o modelo atribui aos tokens de
+        ``response`` dado o prompt: um único prefill, sem decodificação.
+
+        Aceita ``cancel_token`` e ``timeout_s`` como ``generate_text``.
+
+        Returns:
+            Valor em [0, 1], ou None se o runtime não expõe os logits de todas
+            as posições (ex.: modelos exportados só com a última) ou se a
+            chamada foi cancelada antes do prefill
+        """
+        if not self._model or not hasattr(og.Generator, "get_output"):
+            return None
+        gen_kwargs = dict(gen_kwargs)
+        token = resolve_cancellation(gen_kwargs.pop('cancel_token', None), gen_kwargs.pop('timeout_s', None))
+        if token is not None and token.is_set():
+            log.info(f"Confiança da sequência descartada antes de começar ({token.reason})")
+            return None
+        response_tokens = self._encode_fragment(response)
+        if not len(response_tokens):
+            return 0.0
+
+        try:
+            input_tokens, search_options = self._prepare_generation(prompt, gen_kwargs)
+            tokens = np.concatenate([np.asarray(input_tokens, dtype=np.int32),
+                                     np.asarray(response_tokens, dtype=np.int32)])
+            search_options['max_length'] = len(tokens) + 1
+
+            params = og.GeneratorParams(self._model)
+            params.set_search_options(**search_options)
+            generator = og.Generator(self._model, params)
+            try:
+                generator.append_tokens(tokens)
+                logits = np.asarray(generator.get_output("logits"), dtype=np.float32)
+            finally:
+                del generator
+        except Exception as e:
+            log.debug(f"Confiança da sequência indisponível: {e}")
+            return None
+
+        logits = logits.reshape(-1, logits.shape[-1])
+        n = len(response_tokens)
+        if logits.shape[0] < len(tokens):
+            return None
+
+        # A linha i prevê o token i + 1: as n linhas antes da última cobrem a resposta
+        rows = logits[-(n + 1):-1].astype(np.float64)
+        shifted = rows - rows.max(axis=1, keepdims=True)
+        logprobs = shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+        chosen = logprobs[np.arange(n), np.asarray(response_tokens, dtype=np.int64)]
+        return float(np.exp(chosen.mean()))
+
+    async def asequence_confidence(self, prompt: str, response: str, **gen_kwargs) -> Optional[float]:
+        """Versão assíncrona de ``sequence_confidence`` (roda no executor de inferência)"""
+        priority = Priority.coerce(gen_kwargs.get('priority'))
+        return await self._run_cancellable(priority, self.sequence_confidence, prompt, response, **gen_kwargs)
+
+    def _score_labels(self, prompt: str, choices: List[str], gen_kwargs: Dict[str, Any],
+                      stop_event: Optional[threading.Event] = None) -> Dict[str, float]:
+        """
+        Log-probabilidade de cada rótulo até o token que o distingue dos demais.
+
+        ``stop_event`` é conferido antes de cada passo extra de desempate
+        (levanta ``_ScoringCancelled``).
+        """
+        if not (hasattr(og.Generator, "get_logits") or hasattr(og.Generator, "get_output")):
+            raise _ScoringUnavailable("generator sem acesso aos logits")
+
+        label_tokens = {choice: [int(t) for t in self._encode_fragment(choice)] for choice in choices}
+        if any(not tokens for tokens in label_tokens.values()):
+            raise _ScoringUnavailable("rótulo vazio após tokenização")
+
+        needed = {choice: self._distinguishing_length(choice, label_tokens) for choice in choices}
+        if max(needed.values()) > 1 and not hasattr(og.Generator, "rewind_to"):
+            raise _ScoringUnavailable("rótulos com o mesmo primeiro token exigem rewind_to")
+
+        input_tokens, search_options = self._prepare_generation(prompt, gen_kwargs)
+        input_length = len(input_tokens)
+        search_options['max_length'] = max(
+            search_options['max_length'], input_length + max(needed.values()) + 1
+        )
+        self._scoring_stats["calls"] += 1
+
+        # Prefill: reaproveita o KV do system prompt quando ele estiver registrado
+        entry = None
+        if self._prefix_cache is not None and self._model.type != "marian-ssru":
+            system_prompt = gen_kwargs.get('system_prompt', DEFAULT_SYSTEM_PROMPT)
+            entry = self._prefix_cache.acquire(system_prompt, input_tokens, search_options)
+
+        if entry is not None:
+            generator = entry.generator
+            self._scoring_stats["prefix_cache_hits"] += 1
+        else:
+            params = og.GeneratorParams(self._model)
+            params.set_search_options(**search_options)
+            generator = og.Generator(self._model, params)
+
+        try:
+            if entry is not None:
+                generator.append_tokens(input_tokens[entry.prefix_length:])
+            else:
+                generator.append_tokens(input_tokens)
+
+            first_logprobs = self._last_logprobs(generator)
+            scores: Dict[str, float] = {}
+            for choice in choices:
+                tokens = label_tokens[choice]
+                score = float(first_logprobs[tokens[0]])
+                if needed[choice] > 1:
+                    # Avança pelo trecho comum com outros rótulos e volta ao fim do prompt
+                    for i in range(1, needed[choice]):
+                        if stop_event is not None and stop_event.is_set():
+                            generator.rewind_to(input_length)
+                            raise _ScoringCancelled(getattr(stop_event, 'reason', None) or 'consumidor')
+                        generator.append_tokens([tokens[i - 1]])
+                        score += float(self._last_logprobs(generator)[tokens[i]])
+                        self._scoring_stats["extra_steps"] += 1
+                    generator.rewind_to(input_length)
+                scores[choice] = score
+            return scores
+        except (_ScoringUnavailable, _ScoringCancelled):
+            raise
+        except (AttributeError, NotImplementedError) as e:
+            raise _ScoringUnavailable(str(e))
+        finally:
+            if entry is not None:
+                self._prefix_cache.release(entry)
+            else:
+                del generator
+
+    @staticmethod
+    def _distinguishing_length(choice: str, label_tokens: Dict[str, List[int]]) -> int:
+        """Quantos tokens do rótulo são necessários para separá-lo dos demais"""
+        tokens = label_tokens[choice]
+        others = [t for c, t in label_tokens.items() if c != choice]
+        for n in range(1, len(tokens) + 1):
+            if not any(other[:n] == tokens[:n] for other in others):
+                return n
+        return len(tokens)
+
+    @staticmethod
+    def _last_logprobs(generator) -> np.ndarray:
+        """Log-softmax dos logits da última posição processada"""
+        if hasattr(generator, "get_logits"):
+            logits = generator.get_logits()
+        else:
+            logits = generator.get_output("logits")
+        logits = np.asarray(logits, dtype=np.float32)
+        logits = logits.reshape(-1, logits.shape[-1])[-1]
+        shifted = logits - logits.max()
+        return shifted - np.log(np.exp(shifted).sum())
+
+    def _calibrate(self, scores: Dict[str, float]) -> Dict[str, Any]:
+        """Probabilidades renormalizadas entre os rótulos e confiança da escolha"""
+        labels = list(scores.keys())
+        values = np.array([scores[label] for label in labels], dtype=np.float64)
+
+        scaled = values / max(settings.llm_choice_temperature, 1e-6)
+        probabilities = np.exp(scaled - scaled.max())
+        probabilities /= probabilities.sum()
+
+        # Empate: vale a ordem em que os rótulos foram passados
+        order = np.argsort(-probabilities, kind="stable")
+        best = int(order[0])
+        second = float(probabilities[order[1]]) if len(order) > 1 else 0.0
+
+        return {
+            "label": labels[best],
+            "probabilities": {label: float(p) for label, p in zip(labels, probabilities)},
+            "confidence": float(probabilities[best]),
+            "margin": float(probabilities[best]) - second,
+            "label_mass": float(np.exp(values).sum()),
+            "method": "logits",
+        }
+
     def generate(self, prompt: str, **gen_kwargs) -> str:
         """Método de compatibilidade"""
         return self.generate_text(prompt, **gen_kwargs)
@@ -132,6 +1354,23 @@ class LLMEngine:
         """Verifica se o modelo está disponível"""
         return self._model is not None
 
+    def close(self):
+        """Para as threads e libera modelo, KV retido e tokenizer"""
+        if self._scheduler is not None:
+            self._scheduler.stop()
+            self._scheduler = None
+        if self._executor is not None:
+            self._executor.stop()
+            self._executor = None
+        self._batch_runner = None
+        self._prefix_cache = None
+        self._sessions = None
+        self._speculative = None
+        self._tokenizer_stream = None
+        self._tokenizer = None
+        self._model = None
+        log.info(f"LLM Engine liberado: {self.model_path}")
+
     def get_model_info(self) -> Dict[str, Any]:
         """Retorna informações sobre o modelo"""
         if not self._model:
@@ -142,5 +1381,38 @@ class LLMEngine:
             "model_path": self.model_path,
             "execution_provider": self.execution_provider,
             "type": getattr(self._model, 'type', 'unknown'),
-            "vocab_size": getattr(self._tokenizer, 'vocab_size', 'unknown') if self._tokenizer else 'unknown'
+            "vocab_size": getattr(self._tokenizer, 'vocab_size', 'unknown') if self._tokenizer else 'unknown',
+            **self.get_stats()
+        }
+
+    def _get_choice_stats(self) -> Dict[str, Any]:
+        stats = dict(self._choice_stats)
+        stats["avg_decode_steps"] = stats["decode_steps"] / stats["calls"] if stats["calls"] else 0.0
+        stats["guidance_supported"] = self._guidance_supported
+        return stats
+
+    def _get_tokenization_stats(self) -> Dict[str, Any]:
+        with self._segment_lock:
+            stats = dict(self._tokenization_stats)
+            stats["cached_segments"] = len(self._segment_cache)
+        lookups = stats["segment_hits"] + stats["segment_misses"]
+        stats["segment_hit_rate"] = stats["segment_hits"] / lookups if lookups else 0.0
+        return stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de batching e de reuso de prefixo"""
+        return {
+            "executor": self._executor.get_stats() if self._executor else {"enabled": False},
+            "priority": self._priority_gate.get_stats(),
+            "choice": self._get_choice_stats(),
+            "scoring": dict(self._scoring_stats),
+            "tokenization": self._get_tokenization_stats(),
+            "speculative": self._speculative.get_stats() if self._speculative else {"enabled": False},
+            "batching": self._scheduler.get_stats() if self._scheduler else {"enabled": False},
+            "generate_many": (
+                {**self._batch_runner.get_stats(), "batch_supported": self._batch_generation_supported}
+                if self._batch_runner else {"enabled": False}
+            ),
+            "prefix_cache": self._prefix_cache.get_stats() if self._prefix_cache else {"enabled": False},
+            "sessions": self._sessions.get_stats() if self._sessions else {"enabled": False}
         }
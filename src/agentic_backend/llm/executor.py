@@ -0,0 +1,214 @@
+"""
+Executor de inferência dedicado.
+
+As chamadas ao LLMEngine são síncronas e ocupam a thread por toda a geração.
+Chamá-las direto de funções ``async`` congela o event loop do FastAPI
+(``/health`` e todas as outras rotas) até a resposta terminar. O executor
+roda as gerações em threads próprias, atrás de uma fila limitada: quando a
+fila enche, o pedido é recusado com ``InferenceQueueFull`` em vez de
+acumular espera indefinidamente.
+
+A fila é ordenada por prioridade (``Priority``) e há threads reservadas para
+pedidos interativos: um resumo em segundo plano nunca ocupa a vaga do chat.
+"""
+from __future__ import annotations
+from concurrent.futures import Future
+from contextvars import Context, copy_context
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from .priority import Priority
+
+log = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(RuntimeError):
+    """Fila de inferência cheia: o pedido foi recusado"""
+
+
+@dataclass
+class _Job:
+    func: Callable[..., Any]
+    args: tuple
+    kwargs: Dict[str, Any]
+    future: Future
+    priority: Priority = Priority.STANDARD
+    enqueued_at: float = field(default_factory=time.time)
+    # Contexto de quem enfileirou (ex.: token de cancelamento do pedido HTTP)
+    context: Context = field(default_factory=copy_context)
+
+
+class InferenceExecutor:
+    """
+    Pool de threads de inferência com fila de prioridade limitada.
+
+    Args:
+        workers: Número de gerações não interativas executadas ao mesmo tempo
+        max_queue_size: Pedidos aguardando além dos que estão em execução
+        interactive_workers: Threads extras que só atendem pedidos interativos
+        name: Prefixo do nome das threads (logs/diagnóstico)
+    """
+
+    def __init__(self, workers: int = 1, max_queue_size: int = 32, interactive_workers: int = 1,
+                 name: str = "llm-inference"):
+        self.workers = max(1, workers)
+        self.interactive_workers = max(0, interactive_workers)
+        self.max_queue_size = max(1, max_queue_size)
+        self.name = name
+
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Condition()
+        self._running = False
+        self._busy = 0
+        self._busy_non_interactive = 0
+
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "submitted_by_priority": {p.name.lower(): 0 for p in Priority},
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    def start(self):
+        """Inicia as threads de inferência"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.workers + self.interactive_workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        log.info(
+            f"Executor de inferência iniciado (workers={self.workers}, "
+            f"interativos={self.interactive_workers}, fila={self.max_queue_size})"
+        )
+
+    def stop(self):
+        """Para as threads; pedidos ainda na fila recebem erro"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            pending = [job for _, _, job in self._heap]
+            self._heap = []
+            self._lock.notify_all()
+
+        for job in pending:
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(RuntimeError("Executor de inferência parado"))
+
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+
+    def submit(self, priority: Priority, func: Callable[..., Any], /, *args, **kwargs) -> Future:
+        """
+        Enfileira ``func(*args, **kwargs)`` para execução em uma thread de inferência.
+        Pedidos de prioridade maior saem da fila primeiro.
+
+        Raises:
+            InferenceQueueFull: Se a fila estiver cheia
+        """
+        if not self._running:
+            self.start()
+
+        job = _Job(func=func, args=args, kwargs=kwargs, future=Future(), priority=priority)
+        with self._lock:
+            if len(self._heap) >= self.max_queue_size:
+                self._stats["rejected"] += 1
+                raise InferenceQueueFull(
+                    f"Fila de inferência cheia ({self.max_queue_size} pedidos aguardando)"
+                )
+            heapq.heappush(self._heap, (int(priority), next(self._counter), job))
+            self._stats["submitted"] += 1
+            self._stats["submitted_by_priority"][priority.name.lower()] += 1
+            self._lock.notify_all()
+
+        return job.future
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, ocupação e tempo de espera"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["submitted_by_priority"] = dict(self._stats["submitted_by_priority"])
+            stats["running"] = self._busy
+            stats["queue_depth"] = len(self._heap)
+
+        stats["workers"] = self.workers
+        stats["interactive_workers"] = self.interactive_workers
+        stats["max_queue_size"] = self.max_queue_size
+
+        started = stats["completed"] + stats["failed"] + stats["running"]
+        stats["avg_wait_ms"] = stats["wait_seconds_total"] / started * 1000 if started else 0.0
+        stats["max_wait_ms"] = stats.pop("wait_seconds_max") * 1000
+        finished = stats["completed"] + stats["failed"]
+        stats["avg_run_ms"] = stats.pop("run_seconds_total") / finished * 1000 if finished else 0.0
+        stats.pop("wait_seconds_total")
+        return stats
+
+    def _next_job(self):
+        """Próximo pedido que esta thread pode executar (None ao parar)"""
+        with self._lock:
+            while True:
+                if not self._running:
+                    return None
+                if self._heap:
+                    job = self._heap[0][2]
+                    # Pedidos não interativos não ocupam as vagas reservadas ao chat
+                    if job.priority == Priority.INTERACTIVE or self._busy_non_interactive < self.workers:
+                        heapq.heappop(self._heap)
+                        self._busy += 1
+                        if job.priority != Priority.INTERACTIVE:
+                            self._busy_non_interactive += 1
+                        return job
+                self._lock.wait()
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+
+            started = time.time()
+            outcome = "cancelled"
+            try:
+                # Pedido cancelado enquanto esperava (ex.: cliente desconectou)
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+
+                wait = started - job.enqueued_at
+                with self._lock:
+                    self._stats["wait_seconds_total"] += wait
+                    self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+
+                try:
+                    result = job.context.run(job.func, *job.args, **job.kwargs)
+                except BaseException as e:
+                    job.future.set_exception(e)
+                    outcome = "failed"
+                else:
+                    job.future.set_result(result)
+                    outcome = "completed"
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    if job.priority != Priority.INTERACTIVE:
+                        self._busy_non_interactive -= 1
+                    if outcome != "cancelled":
+                        self._stats["run_seconds_total"] += time.time() - started
+                    self._stats[outcome] += 1
+                    self._lock.notify_all()
@@ -0,0 +1,283 @@
+"""
+Preditor do tamanho das respostas por agente e template de prompt.
+
+Os pontos de chamada passavam ``max_length`` fixos (50, 100, 300, 400, 500)
+que não correspondem ao que cada agente produz, e o ``_prepare_generation``
+ainda garantia ``llm_min_new_tokens`` acima do prompt: gerações descontroladas
+iam até o teto e seguravam o lote do scheduler. Aqui cada chave
+(chamador + ``length_key`` ou, sem ele, o system prompt) guarda os tamanhos
+observados e, com amostras suficientes, o orçamento de resposta passa a ser
+o quantil ``llm_length_predictor_quantile`` dos tamanhos vezes uma margem.
+
+- Gerações que terminam no orçamento (sem EOS) são truncadas: o tamanho real
+  era maior. Cada truncamento com orçamento previsto aumenta a margem da
+  chave; gerações completas a trazem de volta, devagar, até a margem base.
+- Gerações interrompidas (cancelamento, consumidor saiu) não entram no histórico.
+- O orçamento explícito (``max_new_tokens``) continua sendo o teto; sem
+  histórico vale o orçamento do ponto de chamada.
+- As observações ficam em SQLite em ``data_dir`` e sobrevivem a reinícios.
+
+Os registros chegam pela telemetria de geração (``GenerationTelemetry``).
+"""
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Tuple
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from ..settings import settings
+from .telemetry import generation_telemetry
+
+log = logging.getLogger(__name__)
+
+PREDICTED = "predicted"
+DEFAULT = "default"
+
+# Crescimento da margem a cada truncamento e retorno a cada geração completa
+_MARGIN_GROWTH = 1.2
+_MARGIN_DECAY = 0.98
+_MAX_MARGIN = 3.0
+
+
+@dataclass
+class _KeyHistory:
+    """Tamanhos observados de uma chave e contadores de acerto do orçamento"""
+    lengths: Deque[Tuple[int, bool]]
+    margin: float
+    loaded: bool = False
+    counters: Dict[str, Dict[str, float]] = field(default_factory=lambda: {
+        source: {"calls": 0, "truncated": 0, "overruns": 0, "slack_tokens": 0, "budget_tokens": 0}
+        for source in (PREDICTED, DEFAULT)
+    })
+
+
+class LengthPredictor:
+    """
+    Orçamento de tokens de resposta aprendido com o histórico.
+
+    Args:
+        db_path: Arquivo SQLite das observações (criado sob demanda)
+        window: Observações mantidas por chave
+        min_samples: Observações necessárias antes de prever
+        quantile: Quantil dos tamanhos usado como estimativa
+        margin: Margem base aplicada à estimativa
+        min_tokens: Menor orçamento previsto
+        max_tokens: Maior orçamento previsto
+        enabled: Desligado, o orçamento do ponto de chamada vale sempre
+    """
+
+    def __init__(self, db_path: Optional[str], window: int = 200, min_samples: int = 20,
+                 quantile: float = 0.9, margin: float = 1.25, min_tokens: int = 16,
+                 max_tokens: int = 512, enabled: bool = True):
+        self.db_path = db_path
+        self.window = max(1, window)
+        self.min_samples = max(1, min_samples)
+        self.quantile = min(max(quantile, 0.0), 1.0)
+        self.margin = max(1.0, margin)
+        self.min_tokens = max(1, min_tokens)
+        self.max_tokens = max(self.min_tokens, max_tokens)
+        self.enabled = enabled
+
+        self._history: Dict[str, _KeyHistory] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._errors = 0
+
+    @staticmethod
+    def make_key(caller: str, length_key: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        """Chave do agente + template (``length_key`` explícito ou digest do system prompt)"""
+        if length_key:
+            return f"{caller}/{length_key}"
+        digest = hashlib.sha1((system_prompt or "").encode("utf-8")).hexdigest()[:10]
+        return f"{caller}/system:{digest}"
+
+    def budget(self, key: str, default_tokens: int,
+               cap: Optional[int] = None) -> Tuple[int, str, Optional[int]]:
+        """
+        Orçamento de resposta para ``key``.
+
+        Args:
+            key: Chave de ``make_key``
+            default_tokens: Orçamento do ponto de chamada (usado sem histórico)
+            cap: Teto explícito (``max_new_tokens``)
+
+        Returns:
+            (orçamento, origem ``predicted``/``default``, estimativa do quantil ou None)
+        """
+        if not self.enabled:
+            return default_tokens, DEFAULT, None
+
+        with self._lock:
+            history = self._get_history(key)
+            if len(history.lengths) < self.min_samples:
+                return default_tokens, DEFAULT, None
+            estimate = self._estimate(history)
+            margin = history.margin
+
+        budget = min(max(math.ceil(estimate * margin), self.min_tokens), self.max_tokens)
+        if cap is not None and cap <= budget:
+            # O teto explícito é que limita: truncamentos não são do preditor
+            return cap, DEFAULT, estimate
+        return budget, PREDICTED, estimate
+
+    def observe(self, record: Dict[str, Any]):
+        """Registra uma geração (listener da telemetria)"""
+        key = record.get("length_key")
+        budget = record.get("budget")
+        if not self.enabled or not key or not budget or record.get("interrupted"):
+            return
+
+        generated = record["generated_tokens"]
+        source = record.get("budget_source") or DEFAULT
+        # Terminar exatamente no orçamento conta como truncamento (EOS incerto)
+        truncated = generated >= budget
+
+        with self._lock:
+            history = self._get_history(key)
+            estimate = self._estimate(history) if history.lengths else None
+
+            counters = history.counters[source]
+            counters["calls"] += 1
+            counters["budget_tokens"] += budget
+            counters["slack_tokens"] += max(budget - generated, 0)
+            if truncated:
+                counters["truncated"] += 1
+            elif estimate is not None and generated > estimate:
+                counters["overruns"] += 1
+
+            if source == PREDICTED:
+                if truncated:
+                    history.margin = min(history.margin * _MARGIN_GROWTH, _MAX_MARGIN)
+                else:
+                    history.margin = max(history.margin * _MARGIN_DECAY, self.margin)
+
+            history.lengths.append((generated, truncated))
+            self._persist(key, generated, truncated)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estimativa, margem e taxas de truncamento/estouro por chave"""
+        with self._lock:
+            snapshot = {
+                key: (self._estimate(h) if h.lengths else None, h.margin, len(h.lengths),
+                      {source: dict(c) for source, c in h.counters.items()})
+                for key, h in self._history.items()
+            }
+            errors = self._errors
+
+        keys = {}
+        totals = {source: {"calls": 0, "truncated": 0, "overruns": 0, "slack_tokens": 0, "budget_tokens": 0}
+                  for source in (PREDICTED, DEFAULT)}
+        for key, (estimate, margin, samples, counters) in snapshot.items():
+            entry: Dict[str, Any] = {
+                "samples": samples,
+                "estimate_tokens": estimate,
+                "margin": round(margin, 3),
+                "predicting": samples >= self.min_samples,
+            }
+            for source, c in counters.items():
+                entry[source] = _rates(c)
+                for name, value in c.items():
+                    totals[source][name] += value
+            keys[key] = entry
+
+        return {
+            "enabled": self.enabled,
+            "quantile": self.quantile,
+            "min_samples": self.min_samples,
+            "keys": keys,
+            PREDICTED: _rates(totals[PREDICTED]),
+            DEFAULT: _rates(totals[DEFAULT]),
+            "errors": errors,
+        }
+
+    def _estimate(self, history: _KeyHistory) -> int:
+        # Truncados entram com o tamanho atingido (limite inferior); a margem compensa
+        lengths = sorted(length for length, _ in history.lengths)
+        return lengths[min(len(lengths) - 1, int(self.quantile * len(lengths)))]
+
+    def _get_history(self, key: str) -> _KeyHistory:
+        history = self._history.get(key)
+        if history is None:
+            history = self._history[key] = _KeyHistory(lengths=deque(maxlen=self.window), margin=self.margin)
+        if not history.loaded:
+            history.loaded = True
+            for generated, truncated in self._load(key):
+                history.lengths.append((generated, truncated))
+        return history
+
+    def _load(self, key: str):
+        if not self.db_path:
+            return []
+        try:
+            rows = self._db().execute(
+                "SELECT generated, truncated FROM lengths WHERE key = ? ORDER BY created_at DESC LIMIT ?",
+                (key, self.window)
+            ).fetchall()
+        except Exception as e:
+            log.warning(f"Falha ao ler histórico de tamanhos: {e}")
+            self._errors += 1
+            return []
+        return [(generated, bool(truncated)) for generated, truncated in reversed(rows)]
+
+    def _persist(self, key: str, generated: int, truncated: bool):
+        if not self.db_path:
+            return
+        try:
+            conn = self._db()
+            conn.execute(
+                "INSERT INTO lengths (key, generated, truncated, created_at) VALUES (?, ?, ?, ?)",
+                (key, generated, int(truncated), time.time())
+            )
+            conn.execute(
+                "DELETE FROM lengths WHERE key = ? AND rowid NOT IN "
+                "(SELECT rowid FROM lengths WHERE key = ? ORDER BY created_at DESC LIMIT ?)",
+                (key, key, self.window)
+            )
+            conn.commit()
+        except Exception as e:
+            log.warning(f"Falha ao gravar histórico de tamanhos: {e}")
+            self._errors += 1
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lengths ("
+                "key TEXT NOT NULL, generated INTEGER NOT NULL, truncated INTEGER NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS lengths_key ON lengths (key, created_at)")
+            self._conn.commit()
+        return self._conn
+
+
+def _rates(counters: Dict[str, float]) -> Dict[str, Any]:
+    calls = counters["calls"]
+    return {
+        "calls": calls,
+        "truncation_rate": round(counters["truncated"] / calls, 4) if calls else None,
+        "overrun_rate": round(counters["overruns"] / calls, 4) if calls else None,
+        "mean_budget_tokens": round(counters["budget_tokens"] / calls, 1) if calls else None,
+        "mean_slack_tokens": round(counters["slack_tokens"] / calls, 1) if calls else None,
+    }
+
+
+# Instância global (compartilhada por todos os LLMEngines do processo)
+length_predictor = LengthPredictor(
+    db_path=os.path.join(settings.data_dir, "llm_cache", "lengths.sqlite3"),
+    window=settings.llm_length_predictor_window,
+    min_samples=settings.llm_length_predictor_min_samples,
+    quantile=settings.llm_length_predictor_quantile,
+    margin=settings.llm_length_predictor_margin,
+    min_tokens=settings.llm_length_predictor_min_tokens,
+    max_tokens=settings.llm_length_predictor_max_tokens,
+    enabled=settings.llm_length_predictor_enabled,
+)
+generation_telemetry.add_listener(length_predictor.observe)
@@ -0,0 +1,220 @@
+"""
+Cache de prefixo (KV) para system prompts estáticos.
+
+Para cada system prompt registrado, mantém um ``og.Generator`` com o prefixo
+(system prompt já passado pelo chat template) pré-processado. Uma geração que
+começa com esse prefixo só precisa fazer prefill do sufixo (mensagem do
+usuário); ao final, o generator é rebobinado (``rewind_to``) até o fim do
+prefixo e fica pronto para a próxima chamada.
+
+O KV de um generator não pode ser copiado no onnxruntime-genai, então cada
+entrada atende uma geração por vez: se estiver ocupada, a chamada segue pelo
+caminho normal (prefill completo) e conta como miss.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+import logging
+import threading
+
+try:
+    import onnxruntime_genai as og
+except Exception:
+    og = None
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefixEntry:
+    """Generator com o prefixo já pré-processado"""
+    system_prompt: str
+    prefix_tokens: Tuple[int, ...]
+    generator: Any
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def prefix_length(self) -> int:
+        return len(self.prefix_tokens)
+
+
+class PrefixCache:
+    """
+    Cache de prefixos pré-processados, indexado por system prompt e opções de
+    amostragem (as search options ficam fixas no generator).
+
+    Args:
+        engine: LLMEngine dono do modelo e do tokenizer
+        max_entries: Número máximo de generators mantidos (cada um reserva KV para max_length tokens)
+        max_length: Tamanho máximo de sequência (prefixo + sufixo + resposta) dos generators em cache
+    """
+
+    def __init__(self, engine, max_entries: int = 4, max_length: int = 2048):
+        self.engine = engine
+        self.max_entries = max_entries
+        self.max_length = max_length
+
+        self._registered: Dict[str, Optional[Tuple[int, ...]]] = {}
+        self._entries: "OrderedDict[Tuple[str, Tuple[Any, ...]], PrefixEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "busy": 0,
+            "prefill_tokens_saved": 0,
+            "prefill_tokens_total": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def is_supported() -> bool:
+        """O reuso de prefixo depende de Generator.rewind_to (onnxruntime-genai >= 0.6)"""
+        return og is not None and hasattr(og.Generator, "rewind_to")
+
+    def register(self, system_prompt: str):
+        """Registra um system prompt estático para reuso de prefixo"""
+        with self._lock:
+            self._registered.setdefault(system_prompt, None)
+
+    def is_registered(self, system_prompt: str) -> bool:
+        return system_prompt in self._registered
+
+    def acquire(self, system_prompt: str, input_tokens, search_options: Dict[str, Any]) -> Optional[PrefixEntry]:
+        """
+        Retorna uma entrada bloqueada cujo prefixo cobre ``input_tokens``, ou
+        None quando a chamada deve fazer prefill completo.
+
+        A entrada deve ser devolvida com ``release``.
+        """
+        if system_prompt not in self._registered:
+            return None
+
+        self._stats["lookups"] += 1
+        self._stats["prefill_tokens_total"] += len(input_tokens)
+
+        sampling = tuple(sorted(
+            (k, v) for k, v in search_options.items() if k not in ("max_length", "batch_size")
+        ))
+        if search_options["max_length"] > self.max_length:
+            self._stats["misses"] += 1
+            return None
+
+        prefix_tokens = self._prefix_tokens(system_prompt)
+        if not self._starts_with(input_tokens, prefix_tokens):
+            # O template pode mudar (ex.: data no system prompt do Llama 3.2)
+            prefix_tokens = self._prefix_tokens(system_prompt, refresh=True)
+            if not self._starts_with(input_tokens, prefix_tokens):
+                self._stats["misses"] += 1
+                return None
+
+        key = (system_prompt, sampling)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.prefix_tokens != prefix_tokens:
+                self._entries.pop(key)
+                entry = None
+            if entry is None:
+                try:
+                    entry = self._create_entry(system_prompt, prefix_tokens, search_options)
+                except Exception as e:
+                    log.warning(f"Falha ao criar generator de prefixo: {e}")
+                    self._stats["misses"] += 1
+                    return None
+                # Bloqueada antes de publicar: ninguém usa a entrada antes do prefill
+                entry.lock.acquire()
+                self._entries[key] = entry
+                self._evict()
+                new_entry = True
+            else:
+                self._entries.move_to_end(key)
+                new_entry = False
+
+        if not new_entry and not entry.lock.acquire(blocking=False):
+            self._stats["busy"] += 1
+            self._stats["misses"] += 1
+            return None
+
+        if new_entry:
+            # Prefill do prefixo feito uma única vez por entrada
+            try:
+                entry.generator.append_tokens(list(prefix_tokens))
+            except Exception as e:
+                log.warning(f"Falha no prefill do prefixo: {e}")
+                self._discard(entry)
+                entry.lock.release()
+                self._stats["misses"] += 1
+                return None
+            self._stats["misses"] += 1
+        else:
+            self._stats["hits"] += 1
+            self._stats["prefill_tokens_saved"] += entry.prefix_length
+
+        return entry
+
+    def release(self, entry: PrefixEntry):
+        """Rebobina o generator até o fim do prefixo e libera a entrada"""
+        try:
+            entry.generator.rewind_to(entry.prefix_length)
+        except Exception as e:
+            log.warning(f"Falha ao rebobinar prefixo em cache, descartando entrada: {e}")
+            self._discard(entry)
+        finally:
+            entry.lock.release()
+
+    def _discard(self, entry: PrefixEntry):
+        with self._lock:
+            for key, value in list(self._entries.items()):
+                if value is entry:
+                    self._entries.pop(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de reuso de prefixo"""
+        stats = dict(self._stats)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["prefill_saved_ratio"] = (
+            stats["prefill_tokens_saved"] / stats["prefill_tokens_total"]
+            if stats["prefill_tokens_total"] else 0.0
+        )
+        stats["registered_prefixes"] = len(self._registered)
+        stats["cached_generators"] = len(self._entries)
+        return stats
+
+    def _prefix_tokens(self, system_prompt: str, refresh: bool = False) -> Tuple[int, ...]:
+        tokens = self._registered.get(system_prompt)
+        if tokens is None or refresh:
+            tokens = tuple(int(t) for t in self.engine._encode_system_prefix(system_prompt))
+            self._registered[system_prompt] = tokens
+        return tokens
+
+    @staticmethod
+    def _starts_with(input_tokens, prefix_tokens: Tuple[int, ...]) -> bool:
+        n = len(prefix_tokens)
+        if n == 0 or len(input_tokens) <= n:
+            return False
+        return tuple(int(t) for t in input_tokens[:n]) == prefix_tokens
+
+    def _create_entry(self, system_prompt: str, prefix_tokens: Tuple[int, ...],
+                      search_options: Dict[str, Any]) -> PrefixEntry:
+        options = dict(search_options)
+        options["max_length"] = self.max_length
+        options["batch_size"] = 1
+
+        params = og.GeneratorParams(self.engine._model)
+        params.set_search_options(**options)
+        generator = og.Generator(self.engine._model, params)
+
+        return PrefixEntry(system_prompt=system_prompt, prefix_tokens=prefix_tokens, generator=generator)
+
+    def _evict(self):
+        """Remove as entradas menos usadas (que não estejam em uso) acima do limite"""
+        for key in list(self._entries.keys()):
+            if len(self._entries) <= self.max_entries:
+                break
+            entry = self._entries[key]
+            if entry.lock.locked():
+                continue
+            self._entries.pop(key)
+            self._stats["evictions"] += 1
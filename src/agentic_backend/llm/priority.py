@@ -0,0 +1,105 @@
+"""
+Classes de prioridade da inferência e preempção em fronteira de token.
+
+Gerações de prioridade menor (resumos do reporter, padrões de uso do
+onboarding, citações do researcher) cedem a vez à conversa interativa: antes
+de cada token elas consultam o ``PriorityGate`` e ficam pausadas enquanto
+houver geração de prioridade maior em andamento. Para não haver inanição, uma
+geração pausada por mais de ``max_pause_ms`` avança um token (time-slicing).
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional
+import threading
+import time
+
+
+class Priority(IntEnum):
+    """Classes de prioridade (valor menor = mais urgente)"""
+    INTERACTIVE = 0
+    STANDARD = 1
+    BACKGROUND = 2
+
+    @classmethod
+    def coerce(cls, value: Any) -> "Priority":
+        """Aceita Priority, int ou nome ("interactive", "background"...)"""
+        if value is None:
+            return cls.STANDARD
+        if isinstance(value, str):
+            return cls[value.upper()]
+        return cls(value)
+
+
+class PriorityGate:
+    """
+    Controle de vez entre gerações concorrentes de prioridades diferentes.
+
+    Args:
+        max_pause_ms: Pausa máxima contínua de uma geração antes de avançar um token
+    """
+
+    def __init__(self, max_pause_ms: float = 2000.0):
+        self.max_pause = max_pause_ms / 1000.0
+        self._active = {p: 0 for p in Priority}
+        self._cond = threading.Condition()
+
+        self._stats = {
+            "pauses": 0,
+            "paused_seconds": 0.0,
+            "time_slices": 0,
+        }
+
+    @contextmanager
+    def track(self, priority: Priority):
+        """Marca uma geração da prioridade dada como ativa durante o bloco"""
+        with self._cond:
+            self._active[priority] += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[priority] -= 1
+                self._cond.notify_all()
+
+    def notify(self):
+        """Acorda gerações pausadas para reavaliarem a vez (ex.: pedido novo na fila)"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait_turn(self, priority: Priority, interrupt: Optional[Callable[[], bool]] = None):
+        """
+        Bloqueia enquanto houver geração ativa de prioridade maior.
+
+        Args:
+            priority: Prioridade da geração que quer avançar um token
+            interrupt: Condição que encerra a espera antes da hora (ex.: preempção no scheduler)
+        """
+        with self._cond:
+            if not self._has_higher(priority):
+                return
+
+            self._stats["pauses"] += 1
+            started = time.time()
+            deadline = started + self.max_pause
+            try:
+                while self._has_higher(priority):
+                    if interrupt is not None and interrupt():
+                        return
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._stats["time_slices"] += 1
+                        return
+                    self._cond.wait(timeout=min(remaining, 0.05))
+            finally:
+                self._stats["paused_seconds"] += time.time() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Gerações ativas por prioridade e tempo em pausa"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["active"] = {p.name.lower(): n for p, n in self._active.items()}
+        return stats
+
+    def _has_higher(self, priority: Priority) -> bool:
+        return any(self._active[p] > 0 for p in Priority if p < priority)
@@ -0,0 +1,216 @@
+"""
+Montagem de prompts com orçamento de tokens.
+
+Os agentes colam no prompt documentos do RAG, trechos da web e histórico com
+cortes por caractere, sem saber quantos tokens isso custa no prefill. O
+``PromptBuilder`` conta tokens reais com o tokenizer do ``LLMEngine`` e
+preenche um orçamento fixo por prioridade (sistema, pergunta do usuário,
+trechos do RAG, histórico, web). O que não cabe é truncado em fronteira de
+token ou descartado, e o resultado informa o que entrou e o que ficou de fora.
+
+A ordem das seções no texto final é a ordem em que foram adicionadas; a
+prioridade decide apenas quem ocupa o orçamento primeiro. O custo mínimo das
+seções obrigatórias (a pergunta) fica reservado antes das opcionais; se nem
+isso couber, ``build`` levanta ``PromptBudgetExceeded`` em vez de montar um
+prompt sem a pergunta.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import logging
+
+log = logging.getLogger(__name__)
+
+# Prioridades padrão (valor menor = entra primeiro no orçamento)
+PRIORITY_QUESTION = 0
+PRIORITY_RAG = 1
+PRIORITY_HISTORY = 2
+PRIORITY_WEB = 3
+
+# Abaixo disso não vale a pena manter um trecho truncado
+MIN_TRUNCATED_TOKENS = 16
+
+
+class PromptBudgetExceeded(ValueError):
+    """Nem as seções obrigatórias cabem no orçamento do prompt"""
+
+
+@dataclass
+class PromptSection:
+    """
+    Bloco do prompt composto por itens de mesma natureza.
+
+    Args:
+        name: Nome da seção (aparece no relatório de descartes)
+        items: Itens já ordenados por relevância
+        priority: Ordem de preenchimento do orçamento
+        header: Texto antes dos itens (só entra se algum item couber)
+        template: Formato de cada item (``{}`` recebe o texto)
+        footer: Texto depois dos itens
+        keep: ``"head"`` mantém os primeiros itens; ``"tail"`` os últimos (histórico)
+        required: Seção que nunca é descartada, apenas truncada
+    """
+    name: str
+    items: List[str]
+    priority: int
+    header: str = ""
+    template: str = "{}"
+    footer: str = ""
+    keep: str = "head"
+    required: bool = False
+
+
+@dataclass
+class PackedPrompt:
+    """Prompt montado e o relatório do empacotamento"""
+    text: str
+    tokens: int
+    budget: int
+    system_tokens: int
+    sections: Dict[str, int] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+    truncated: Dict[str, int] = field(default_factory=dict)
+    # Itens que entraram no texto, por seção (truncados já cortados)
+    items: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def complete(self) -> bool:
+        """Se todo o contexto coube sem cortes"""
+        return not self.dropped and not self.truncated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.tokens,
+            "system_tokens": self.system_tokens,
+            "budget_tokens": self.budget,
+            "section_tokens": dict(self.sections),
+            "dropped_items": dict(self.dropped),
+            "truncated_items": dict(self.truncated),
+        }
+
+
+class PromptBuilder:
+    """
+    Empacota seções de contexto em um orçamento de tokens.
+
+    Args:
+        engine: LLMEngine cujo tokenizer faz a contagem
+        budget_tokens: Tokens de entrada permitidos (system prompt + template + prompt)
+        system_prompt: System prompt da geração (conta no orçamento)
+    """
+
+    def __init__(self, engine, budget_tokens: int, system_prompt: Optional[str] = None):
+        self.engine = engine
+        self.budget = budget_tokens
+        self.system_prompt = system_prompt
+        self._sections: List[PromptSection] = []
+
+    def add(self, name: str, items: List[str], priority: int, **options) -> "PromptBuilder":
+        """Adiciona uma seção (ver ``PromptSection``); itens vazios são ignorados"""
+        items = [item for item in items if item and item.strip()]
+        self._sections.append(PromptSection(name=name, items=items, priority=priority, **options))
+        return self
+
+    def build(self) -> PackedPrompt:
+        """Preenche o orçamento por prioridade e monta o texto final"""
+        system_tokens = self.engine.prompt_overhead_tokens(self.system_prompt)
+        remaining = self.budget - system_tokens
+
+        chosen: Dict[str, List[str]] = {}
+        sections_tokens: Dict[str, int] = {}
+        dropped: Dict[str, int] = {}
+        truncated: Dict[str, int] = {}
+
+        # Custo mínimo das obrigatórias ainda não preenchidas: as opcionais não o ocupam
+        reserved = {id(s): self._min_cost(s) for s in self._sections if s.required and s.items}
+        if sum(reserved.values()) > remaining:
+            raise PromptBudgetExceeded(
+                f"Orçamento de {self.budget} tokens insuficiente: system prompt usa {system_tokens} "
+                f"e as seções obrigatórias precisam de ao menos {sum(reserved.values())}"
+            )
+
+        for section in sorted(self._sections, key=lambda s: s.priority):
+            reserved.pop(id(section), None)
+            kept, used, n_dropped, n_truncated = self._fill(section, remaining - sum(reserved.values()))
+            remaining -= used
+            chosen[section.name] = kept
+            if kept:
+                sections_tokens[section.name] = used
+            if n_dropped:
+                dropped[section.name] = n_dropped
+            if n_truncated:
+                truncated[section.name] = n_truncated
+
+        text = "".join(self._render(section, chosen[section.name]) for section in self._sections)
+        packed = PackedPrompt(
+            text=text,
+            tokens=self.engine.count_tokens(text) + system_tokens,
+            budget=self.budget,
+            system_tokens=system_tokens,
+            sections=sections_tokens,
+            dropped=dropped,
+            truncated=truncated,
+            items={name: kept for name, kept in chosen.items() if kept},
+        )
+
+        if not packed.complete:
+            log.info(f"Prompt empacotado em {packed.tokens}/{self.budget} tokens "
+                     f"(descartados={dropped}, truncados={truncated})")
+        return packed
+
+    def _min_cost(self, section: PromptSection) -> int:
+        """Menor custo de uma seção obrigatória: moldura + primeiro item truncado"""
+        frame = section.header + section.footer
+        item = section.items[0] if section.keep == "head" else section.items[-1]
+        item_tokens = self.engine.count_tokens(item)
+        overhead = self.engine.count_tokens(section.template.format(item)) - item_tokens
+        return (self.engine.count_tokens(frame) if frame else 0) + overhead + min(item_tokens, MIN_TRUNCATED_TOKENS)
+
+    def _fill(self, section: PromptSection, remaining: int):
+        """Itens da seção que cabem em ``remaining`` tokens"""
+        if not section.items:
+            return [], 0, 0, 0
+
+        frame = section.header + section.footer
+        frame_tokens = self.engine.count_tokens(frame) if frame else 0
+        budget = remaining - frame_tokens
+        if budget <= 0 and not section.required:
+            return [], 0, len(section.items), 0
+
+        ordered = section.items if section.keep == "head" else list(reversed(section.items))
+        kept: List[str] = []
+        used = 0
+        n_truncated = 0
+
+        for item in ordered:
+            rendered = section.template.format(item)
+            cost = self.engine.count_tokens(rendered)
+            if used + cost <= budget:
+                kept.append(item)
+                used += cost
+                continue
+
+            # Não cabe inteiro: trunca o texto do item no que sobrou do orçamento
+            overhead = cost - self.engine.count_tokens(item)
+            room = budget - used - overhead
+            if section.required and not kept:
+                # Reservado em build: ao menos o começo do item cabe
+                room = max(room, min(self.engine.count_tokens(item), MIN_TRUNCATED_TOKENS))
+            if room >= MIN_TRUNCATED_TOKENS or (section.required and not kept):
+                cut = self.engine.truncate_tokens(item, room, from_end=section.keep == "tail")
+                if cut:
+                    kept.append(cut)
+                    used += self.engine.count_tokens(section.template.format(cut))
+                    n_truncated += 1
+            break
+
+        n_dropped = len(ordered) - len(kept)
+        if section.keep != "head":
+            kept.reverse()
+        return kept, used + (frame_tokens if kept else 0), n_dropped, n_truncated
+
+    @staticmethod
+    def _render(section: PromptSection, items: List[str]) -> str:
+        if not items:
+            return ""
+        return section.header + "".join(section.template.format(item) for item in items) + section.footer
@@ -0,0 +1,178 @@
+"""
+Cache de respostas do LLM por correspondência exata.
+
+Chave: prompt e system prompt normalizados (espaços colapsados) + search
+options + modelo. Duas camadas: LRU em memória e SQLite local em disco, para
+que respostas sobrevivam a reinícios do backend.
+
+Só é consultado quando a chamada pede ``cache=True`` — use apenas em pontos
+onde repetir a mesma saída para o mesmo prompt é aceitável (classificações,
+análises de risco, etc.).
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+class ResponseCache:
+    """
+    Cache LRU em memória com persistência em SQLite.
+
+    Args:
+        db_path: Arquivo SQLite (criado sob demanda)
+        max_memory_entries: Entradas mantidas na camada em memória
+        max_disk_entries: Entradas mantidas em disco (as mais antigas são removidas)
+        ttl_seconds: Validade de uma resposta em cache
+    """
+
+    def __init__(self, db_path: str, max_memory_entries: int = 512,
+                 max_disk_entries: int = 10000, ttl_seconds: float = 86400.0):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self._stats = {
+            "hits_memory": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "stores": 0,
+            "errors": 0,
+        }
+
+    @staticmethod
+    def make_key(model_path: str, prompt: str, system_prompt: str, search_options: Dict[str, Any]) -> str:
+        """Chave estável para prompt + system prompt + search options"""
+        payload = json.dumps({
+            "model": model_path,
+            "prompt": _normalize(prompt),
+            "system": _normalize(system_prompt),
+            "options": {k: v for k, v in sorted(search_options.items()) if k != "batch_size"},
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Retorna a resposta em cache (memória, depois disco) ou None"""
+        now = time.time()
+
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                response, created_at = item
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["hits_memory"] += 1
+                    return response
+                self._memory.pop(key)
+
+            try:
+                row = self._db().execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            except Exception as e:
+                log.warning(f"Falha ao ler cache de respostas: {e}")
+                self._stats["errors"] += 1
+                row = None
+
+            if row is not None and now - row[1] <= self.ttl_seconds:
+                self._remember(key, row[0], row[1])
+                self._stats["hits_disk"] += 1
+                return row[0]
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, response: str):
+        """Armazena a resposta nas duas camadas"""
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, response, now)
+            self._stats["stores"] += 1
+
+            try:
+                conn = self._db()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, now)
+                )
+                conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+                    (self.max_disk_entries,)
+                )
+                conn.commit()
+            except Exception as e:
+                log.warning(f"Falha ao gravar cache de respostas: {e}")
+                self._stats["errors"] += 1
+
+    def clear(self):
+        """Limpa as duas camadas"""
+        with self._lock:
+            self._memory.clear()
+            try:
+                conn = self._db()
+                conn.execute("DELETE FROM responses")
+                conn.commit()
+            except Exception as e:
+                log.warning(f"Falha ao limpar cache de respostas: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores de hit/miss do cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+
+        hits = stats["hits_memory"] + stats["hits_disk"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+
+# Instância global do cache (compartilhada por todos os LLMEngines do processo)
+response_cache = ResponseCache(
+    db_path=os.path.join(settings.data_dir, "llm_cache", "responses.sqlite3"),
+    max_memory_entries=settings.llm_response_cache_memory_entries,
+    max_disk_entries=settings.llm_response_cache_disk_entries,
+    ttl_seconds=settings.llm_response_cache_ttl_seconds
+)
@@ -0,0 +1,415 @@
+"""
+Scheduler de inferência com batching para o LLMEngine.
+
+Enfileira pedidos de geração vindos de vários chamadores (critic, researcher,
+reporter, chatbot...) e os decodifica juntos em um único ``og.Generator`` com
+``batch_size > 1``. Cada chamador recebe o próprio resultado (``Future``) ou
+stream de trechos.
+
+O onnxruntime-genai não permite inserir sequências novas em um generator já
+em andamento. Para aproximar continuous batching, o scheduler trabalha em
+"ondas": quando sequências terminam e há pedidos compatíveis esperando, a onda
+é encerrada e uma nova é montada com as sequências ainda ativas (prompt +
+tokens já gerados, re-prefill em lote) mais os pedidos novos.
+
+A mesma mecânica faz a preempção por prioridade: se chega um pedido mais
+urgente que todas as sequências da onda, a onda é encerrada na fronteira de
+token e a próxima começa pelos pedidos de maior prioridade.
+
+Sequências canceladas (``stop_event``) são encerradas antes de entrar em uma
+onda e antes de cada token; quando metade das linhas da onda já terminou, a
+onda é reaberta só com as ativas, para as linhas mortas não seguirem
+ocupando a NPU. O resultado é um ``GenerationResult`` com o motivo do fim.
+"""
+from __future__ import annotations
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+import numpy as np
+
+from .priority import Priority
+from .cancellation import GenerationResult
+from .telemetry import GenerationTrace, generation_telemetry
+
+try:
+    import onnxruntime_genai as og
+except Exception:
+    og = None
+
+log = logging.getLogger(__name__)
+
+# Opções de busca que precisam ser idênticas para dividir o mesmo generator
+_SAMPLING_KEYS = ("do_sample", "min_length", "top_p", "top_k", "temperature", "repetition_penalty")
+
+
+@dataclass
+class _Sequence:
+    """Pedido de geração enfileirado no scheduler"""
+    input_tokens: List[int]
+    max_new_tokens: int
+    sampling: Tuple[Any, ...]
+    search_options: Dict[str, Any]
+    future: Future
+    tokenizer_stream: Any
+    on_chunk: Optional[Callable[[str], None]] = None
+    stop_event: Optional[threading.Event] = None
+    priority: Priority = Priority.STANDARD
+    trace: Optional[GenerationTrace] = None
+    generated_tokens: List[int] = field(default_factory=list)
+    chunks: List[str] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.time)
+    finished: bool = False
+
+    @property
+    def remaining_tokens(self) -> int:
+        return self.max_new_tokens - len(self.generated_tokens)
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+
+class BatchScheduler:
+    """
+    Fila de pedidos + thread de decodificação em lote.
+
+    Args:
+        engine: LLMEngine já inicializado (fornece modelo, tokenizer e tokens especiais)
+        max_batch_size: Número máximo de sequências decodificadas juntas
+        batch_window_ms: Tempo de espera para agrupar pedidos que chegam juntos
+    """
+
+    def __init__(self, engine, max_batch_size: int = 4, batch_window_ms: float = 10.0):
+        self.engine = engine
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = batch_window_ms / 1000.0
+
+        self._pending: List[_Sequence] = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._stats = {
+            "requests": 0,
+            "waves": 0,
+            "refills": 0,
+            "preemptions": 0,
+            "shrinks": 0,
+            "sequences_decoded": 0,
+            "tokens_generated": 0,
+            "decode_seconds": 0.0,
+        }
+
+    def start(self):
+        """Inicia a thread de decodificação"""
+        if self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._worker_loop, name="llm-batch-scheduler", daemon=True)
+        self._thread.start()
+        log.info(f"Scheduler de batching iniciado (max_batch_size={self.max_batch_size})")
+
+    def stop(self):
+        """Para a thread de decodificação; pedidos pendentes recebem erro"""
+        with self._cond:
+            self._running = False
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+
+        for seq in pending:
+            seq.future.set_exception(RuntimeError("Scheduler de inferência parado"))
+
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def submit(self, prompt: str, on_chunk: Optional[Callable[[str], None]] = None,
+               stop_event: Optional[threading.Event] = None, **gen_kwargs) -> Future:
+        """
+        Enfileira um pedido de geração.
+
+        Args:
+            prompt: Prompt do usuário (o chat template é aplicado pelo engine)
+            on_chunk: Callback chamado com cada trecho decodificado (streaming)
+            stop_event: Evento que interrompe a geração desta sequência
+            **gen_kwargs: Mesmos parâmetros de ``LLMEngine.generate_text``
+
+        Returns:
+            Future resolvido com o texto completo gerado
+        """
+        seq = self._make_sequence(prompt, gen_kwargs, on_chunk, stop_event)
+
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Scheduler de inferência não iniciado")
+            self._pending.append(seq)
+            self._stats["requests"] += 1
+            self._cond.notify()
+
+        # Onda em pausa por prioridade precisa reavaliar (pode ser preempção)
+        self.engine._priority_gate.notify()
+        return seq.future
+
+    def run_batch(self, requests: List[Tuple[str, Dict[str, Any]]],
+                  stop_event: Optional[threading.Event] = None) -> List[str]:
+        """
+        Decodifica pedidos independentes em lote na thread atual, sem fila.
+
+        Pedidos com as mesmas opções de amostragem dividem o mesmo generator
+        (até ``max_batch_size`` por vez). Usado por ``LLMEngine.generate_many``
+        quando o scheduler contínuo não está ativo.
+
+        Args:
+            requests: Pares (prompt, parâmetros de ``generate_text``)
+            stop_event: Evento que interrompe todas as sequências do lote
+
+        Returns:
+            Textos gerados, na ordem dos pedidos
+        """
+        sequences = [self._make_sequence(prompt, gen_kwargs, stop_event=stop_event) for prompt, gen_kwargs in requests]
+        self._stats["requests"] += len(sequences)
+
+        remaining = list(sequences)
+        while remaining:
+            sampling = remaining[0].sampling
+            batch = [seq for seq in remaining if seq.sampling == sampling][:self.max_batch_size]
+            remaining = [seq for seq in remaining if not any(seq is b for b in batch)]
+
+            carried = self._run_wave(batch)
+            while carried:
+                carried = self._run_wave(carried)
+
+        return [seq.future.result() for seq in sequences]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas de throughput do scheduler"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending)
+
+        stats["max_batch_size"] = self.max_batch_size
+        stats["avg_batch_size"] = (
+            stats["sequences_decoded"] / stats["waves"] if stats["waves"] else 0.0
+        )
+        stats["tokens_per_second"] = (
+            stats["tokens_generated"] / stats["decode_seconds"] if stats["decode_seconds"] else 0.0
+        )
+        return stats
+
+    def _make_sequence(self, prompt: str, gen_kwargs: Dict[str, Any],
+                       on_chunk: Optional[Callable[[str], None]] = None,
+                       stop_event: Optional[threading.Event] = None) -> _Sequence:
+        # Criado na thread do chamador: herda o caller_scope e conta a espera na fila
+        trace = generation_telemetry.trace(gen_kwargs.get("caller"), self.engine._model_name, "batch")
+        input_tokens, search_options = self.engine._prepare_generation(prompt, gen_kwargs, trace)
+        input_tokens = [int(t) for t in input_tokens]
+        trace.prompt_tokens = len(input_tokens)
+
+        return _Sequence(
+            input_tokens=input_tokens,
+            max_new_tokens=search_options["max_length"] - len(input_tokens),
+            sampling=tuple(search_options.get(k) for k in _SAMPLING_KEYS),
+            search_options=search_options,
+            future=Future(),
+            tokenizer_stream=self.engine._tokenizer.create_stream(),
+            on_chunk=on_chunk,
+            stop_event=stop_event,
+            priority=Priority.coerce(gen_kwargs.get("priority")),
+            trace=trace,
+        )
+
+    # ------------------------------------------------------------------
+    # Thread de decodificação
+    # ------------------------------------------------------------------
+
+    def _worker_loop(self):
+        """Monta ondas de sequências compatíveis e as decodifica em lote"""
+        carried: List[_Sequence] = []
+
+        while True:
+            with self._cond:
+                while self._running and not self._pending and not carried:
+                    self._cond.wait()
+                if not self._running:
+                    break
+
+            # Janela curta para agrupar pedidos que chegam quase juntos
+            if not carried and self.batch_window > 0:
+                time.sleep(self.batch_window)
+
+            batch = self._take_batch(carried)
+            carried = []
+            if not batch:
+                continue
+
+            try:
+                carried = self._run_wave(batch)
+            except Exception as e:
+                log.error(f"Erro na decodificação em lote: {e}")
+                for seq in batch:
+                    if not seq.future.done():
+                        seq.future.set_exception(e)
+
+        for seq in carried:
+            if not seq.future.done():
+                seq.future.set_exception(RuntimeError("Scheduler de inferência parado"))
+
+    def _take_batch(self, carried: List[_Sequence]) -> List[_Sequence]:
+        """
+        Seleciona até max_batch_size sequências com as mesmas opções de
+        amostragem, começando pela de maior prioridade (ordem de chegada no empate)
+        """
+        with self._cond:
+            candidates = sorted(carried + self._pending, key=lambda seq: seq.priority)
+            # Canceladas ainda na fila não ocupam vaga nem passam por prefill
+            stopped = [seq for seq in candidates if seq.stopped]
+            candidates = [seq for seq in candidates if not seq.stopped]
+            sampling = candidates[0].sampling if candidates else None
+
+            batch = []
+            remaining = []
+            for seq in candidates:
+                if len(batch) < self.max_batch_size and seq.sampling == sampling:
+                    batch.append(seq)
+                else:
+                    remaining.append(seq)
+            # Sequências interrompidas voltam para a fila com o que já geraram
+            self._pending = sorted(remaining, key=lambda seq: seq.enqueued_at)
+
+        for seq in stopped:
+            self._finish(seq)
+        return batch
+
+    def _has_compatible_pending(self, sampling: Tuple[Any, ...]) -> bool:
+        with self._cond:
+            return any(seq.sampling == sampling for seq in self._pending)
+
+    def _has_higher_priority_pending(self, priority: Priority) -> bool:
+        with self._cond:
+            return any(seq.priority < priority for seq in self._pending)
+
+    def _run_wave(self, batch: List[_Sequence]) -> List[_Sequence]:
+        """
+        Decodifica um lote até todas as sequências terminarem ou até valer a
+        pena reabrir a onda para admitir pedidos novos.
+
+        Returns:
+            Sequências ainda ativas que devem continuar na próxima onda
+        """
+        for seq in batch:
+            if seq.stopped:
+                self._finish(seq)
+        batch = [seq for seq in batch if not seq.finished]
+        if not batch:
+            return []
+
+        pad_token_id = self.engine.pad_token_id
+        eos_token_ids = self.engine.eos_token_ids
+
+        # Prompt + tokens já gerados (sequências vindas da onda anterior)
+        contexts = [seq.input_tokens + seq.generated_tokens for seq in batch]
+        padded_length = max(len(c) for c in contexts)
+        input_ids = np.full((len(batch), padded_length), pad_token_id, dtype=np.int32)
+        for row, context in enumerate(contexts):
+            # Padding à esquerda para alinhar o próximo token de todas as sequências
+            input_ids[row, padded_length - len(context):] = context
+
+        search_options = dict(batch[0].search_options)
+        search_options["batch_size"] = len(batch)
+        search_options["max_length"] = padded_length + max(seq.remaining_tokens for seq in batch)
+
+        params = og.GeneratorParams(self.engine._model)
+        params.set_search_options(**search_options)
+        generator = og.Generator(self.engine._model, params)
+
+        self._stats["waves"] += 1
+        self._stats["sequences_decoded"] += len(batch)
+        started = time.time()
+        tokens = 0
+
+        try:
+            prefill_started = time.perf_counter()
+            generator.append_tokens(input_ids)
+            # Prefill em lote: o tempo todo conta para cada sequência da onda
+            prefill_seconds = time.perf_counter() - prefill_started
+            for seq in batch:
+                seq.trace.prefill_seconds += prefill_seconds
+
+            while not generator.is_done():
+                # Canceladas durante a espera (ou a preempção) não geram mais tokens
+                for seq in batch:
+                    if not seq.finished and seq.stopped:
+                        self._finish(seq)
+                active = [seq for seq in batch if not seq.finished]
+                if not active:
+                    break
+
+                # Prioridade da onda = sequência ativa mais urgente
+                wave_priority = min(seq.priority for seq in active)
+                if self._has_higher_priority_pending(wave_priority):
+                    self._stats["preemptions"] += 1
+                    return active
+                self.engine._priority_gate.wait_turn(
+                    wave_priority, interrupt=lambda: self._has_higher_priority_pending(wave_priority)
+                )
+                if any(seq.stopped for seq in active):
+                    continue
+
+                generator.generate_next_token()
+                next_tokens = generator.get_next_tokens()
+
+                for row, seq in enumerate(batch):
+                    if seq.finished:
+                        continue
+                    token = int(next_tokens[row])
+                    if token in eos_token_ids:
+                        self._finish(seq)
+                        continue
+
+                    seq.generated_tokens.append(token)
+                    seq.trace.token()
+                    tokens += 1
+                    chunk = seq.tokenizer_stream.decode(token)
+                    seq.chunks.append(chunk)
+                    if seq.on_chunk is not None:
+                        seq.on_chunk(chunk)
+
+                    if seq.remaining_tokens <= 0 or seq.stopped:
+                        self._finish(seq)
+
+                active = [seq for seq in batch if not seq.finished]
+                if not active:
+                    break
+
+                # Admitir pedidos novos quando metade das vagas liberou
+                free_slots = self.max_batch_size - len(active)
+                if free_slots >= max(1, self.max_batch_size // 2) and self._has_compatible_pending(batch[0].sampling):
+                    self._stats["refills"] += 1
+                    return active
+
+                # Metade das linhas já terminou: reabre a onda só com as ativas
+                if len(batch) > 1 and len(active) <= len(batch) // 2:
+                    self._stats["shrinks"] += 1
+                    return active
+
+            for seq in batch:
+                if not seq.finished:
+                    self._finish(seq)
+            return []
+
+        finally:
+            self._stats["tokens_generated"] += tokens
+            self._stats["decode_seconds"] += time.time() - started
+            del generator
+
+    def _finish(self, seq: _Sequence):
+        seq.finished = True
+        seq.trace.interrupted = seq.stopped
+        seq.trace.finish()
+        if not seq.future.done():
+            reason = (getattr(seq.stop_event, "reason", None) or "cancelled") if seq.stopped else "completed"
+            seq.future.set_result(GenerationResult("".join(seq.chunks), reason))
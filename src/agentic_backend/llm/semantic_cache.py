@@ -0,0 +1,159 @@
+"""
+Cache semântico de respostas do chatbot.
+
+Perguntas parafraseadas ("limite do cartão", "qual o limite do meu cartão?")
+caem na mesma resposta: a mensagem é embutida com o ``ONNXEmbedder`` e
+comparada (similaridade do cosseno) com um índice NumPy dedicado às
+perguntas já respondidas. Acima do limiar, a resposta em cache é devolvida
+sem passar pelo RAG nem pelo LLM.
+
+As entradas expiram por TTL e o cache inteiro é invalidado quando a versão
+do corpus do RAG (``LocalFaiss.version``) muda.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import logging
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Índice em memória de (embedding da pergunta -> resposta).
+
+    Args:
+        threshold: Similaridade mínima (cosseno) para considerar um hit
+        ttl_seconds: Validade de uma resposta em cache
+        max_entries: Número máximo de respostas mantidas (as mais antigas saem)
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl_seconds: float = 3600.0, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._corpus_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "expired": 0,
+            "invalidations": 0,
+        }
+
+    def lookup(self, embedding: np.ndarray, scope: str, corpus_version: int) -> Optional[Dict[str, Any]]:
+        """
+        Procura uma pergunta semelhante já respondida.
+
+        Args:
+            embedding: Embedding da mensagem (dimensão do embedder)
+            scope: Contexto que altera a resposta (ex.: perfil do usuário); só casa com o mesmo escopo
+            corpus_version: Versão atual do corpus do RAG
+
+        Returns:
+            Entrada em cache (``response``, ``question``, ``similarity``...) ou None
+        """
+        query = self._normalize(embedding)
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._sync_corpus_version(corpus_version)
+            self._purge_expired()
+
+            if self._vectors is None or len(self._entries) == 0:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = self._vectors @ query
+            for idx in np.argsort(similarities)[::-1]:
+                similarity = float(similarities[idx])
+                if similarity < self.threshold:
+                    break
+                entry = self._entries[idx]
+                if entry["scope"] == scope:
+                    self._stats["hits"] += 1
+                    return {**entry, "similarity": similarity}
+
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, embedding: np.ndarray, question: str, response: str, scope: str, corpus_version: int):
+        """Armazena a resposta de uma pergunta"""
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._sync_corpus_version(corpus_version)
+
+            entry = {
+                "question": question,
+                "response": response,
+                "scope": scope,
+                "created_at": time.time(),
+            }
+            if self._vectors is None:
+                self._vectors = vector.reshape(1, -1)
+            else:
+                self._vectors = np.vstack([self._vectors, vector])
+            self._entries.append(entry)
+            self._stats["stores"] += 1
+
+            if len(self._entries) > self.max_entries:
+                overflow = len(self._entries) - self.max_entries
+                self._keep(list(range(overflow, len(self._entries))))
+
+    def invalidate(self):
+        """Descarta todas as respostas em cache"""
+        with self._lock:
+            self._clear()
+            self._stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores de hit/miss do cache semântico"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+
+        stats["threshold"] = self.threshold
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+    def _sync_corpus_version(self, corpus_version: int):
+        if self._corpus_version != corpus_version:
+            if self._entries:
+                log.info("Corpus do RAG mudou, invalidando cache semântico")
+                self._stats["invalidations"] += 1
+            self._clear()
+            self._corpus_version = corpus_version
+
+    def _purge_expired(self):
+        now = time.time()
+        alive = [i for i, e in enumerate(self._entries) if now - e["created_at"] <= self.ttl_seconds]
+        if len(alive) != len(self._entries):
+            self._stats["expired"] += len(self._entries) - len(alive)
+            self._keep(alive)
+
+    def _keep(self, indices: List[int]):
+        if not indices:
+            self._clear()
+            return
+        self._vectors = self._vectors[indices]
+        self._entries = [self._entries[i] for i in indices]
+
+    def _clear(self):
+        self._vectors = None
+        self._entries = []
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,201 @@
+"""
+Sessões de geração por conversa (retenção de KV entre turnos).
+
+Cada ``conversation_id`` mantém um ``og.Generator`` vivo com todo o histórico
+da conversa já processado (system prompt, turnos anteriores e respostas
+geradas). Um novo turno só faz prefill dos tokens da nova mensagem do
+usuário, em vez de re-tokenizar e re-processar a transcrição inteira.
+
+Cada generator reserva KV para ``max_length`` tokens, então o store limita o
+número de sessões, o tempo de inatividade (TTL) e a memória estimada.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+try:
+    import onnxruntime_genai as og
+except Exception:
+    og = None
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ConversationSession:
+    """Estado de geração retido para uma conversa"""
+    conversation_id: str
+    system_prompt: str
+    sampling: Tuple[Any, ...]
+    generator: Any = None
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    templated_text: str = ""
+    length: int = 0
+    turns: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.generator is None
+
+
+class SessionStore:
+    """
+    Sessões de conversa com despejo LRU/TTL e limite de memória.
+
+    Args:
+        engine: LLMEngine dono do modelo
+        max_sessions: Número máximo de sessões vivas
+        ttl_seconds: Tempo de inatividade após o qual a sessão é descartada
+        max_length: Tamanho máximo (tokens) da sequência de cada sessão
+        max_memory_mb: Teto de memória estimada de KV somando todas as sessões
+    """
+
+    def __init__(self, engine, max_sessions: int = 8, ttl_seconds: float = 900.0,
+                 max_length: int = 4096, max_memory_mb: float = 2048.0):
+        self.engine = engine
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_length = max_length
+        self.max_memory_mb = max_memory_mb
+
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "turns": 0,
+            "session_turns": 0,
+            "rebuilds": 0,
+            "busy": 0,
+            "evictions_lru": 0,
+            "evictions_ttl": 0,
+            "evictions_memory": 0,
+            "prefill_tokens": 0,
+            "prefill_tokens_saved": 0,
+        }
+
+    @property
+    def session_memory_mb(self) -> float:
+        """KV reservado por sessão (o generator aloca max_length tokens de uma vez)"""
+        return self.max_length * self.engine.kv_bytes_per_token / (1024 * 1024)
+
+    def acquire(self, conversation_id: str, system_prompt: str,
+                search_options: Dict[str, Any]) -> Optional[ConversationSession]:
+        """
+        Retorna a sessão (bloqueada) da conversa, criando-a se necessário.
+
+        Retorna None se a sessão já estiver atendendo outro turno.
+        A sessão deve ser devolvida com ``release``.
+        """
+        sampling = tuple(sorted(
+            (k, v) for k, v in search_options.items() if k not in ("max_length", "batch_size")
+        ))
+
+        with self._lock:
+            self._purge_expired()
+
+            session = self._sessions.get(conversation_id)
+            if session is not None:
+                self._sessions.move_to_end(conversation_id)
+            else:
+                self._make_room()
+                session = ConversationSession(conversation_id, system_prompt, sampling)
+                self._sessions[conversation_id] = session
+
+        if not session.lock.acquire(blocking=False):
+            self._stats["busy"] += 1
+            return None
+
+        # System prompt ou opções de amostragem diferentes: o KV retido não serve
+        if session.system_prompt != system_prompt or session.sampling != sampling:
+            self.reset(session)
+            session.system_prompt = system_prompt
+            session.sampling = sampling
+
+        session.last_used = time.time()
+        return session
+
+    def release(self, session: ConversationSession, keep: bool = True):
+        """Libera a sessão; com ``keep=False`` o estado retido é descartado"""
+        if not keep:
+            self.reset(session)
+        session.last_used = time.time()
+        session.lock.release()
+
+    def new_generator(self, search_options: Dict[str, Any]):
+        """Cria o generator de uma sessão (max_length da sessão, batch 1)"""
+        options = dict(search_options)
+        options["max_length"] = self.max_length
+        options["batch_size"] = 1
+
+        params = og.GeneratorParams(self.engine._model)
+        params.set_search_options(**options)
+        return og.Generator(self.engine._model, params)
+
+    @staticmethod
+    def reset(session: ConversationSession):
+        """Descarta o KV retido; o próximo turno reconstrói a sessão"""
+        session.generator = None
+        session.messages = []
+        session.templated_text = ""
+        session.length = 0
+
+    def end(self, conversation_id: str):
+        """Encerra a sessão de uma conversa (ex.: histórico limpo)"""
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def record_turn(self, prefill_tokens: int, saved_tokens: int, reused: bool):
+        self._stats["turns"] += 1
+        self._stats["prefill_tokens"] += prefill_tokens
+        self._stats["prefill_tokens_saved"] += saved_tokens
+        if reused:
+            self._stats["session_turns"] += 1
+        else:
+            self._stats["rebuilds"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de retenção de sessões"""
+        with self._lock:
+            active = len(self._sessions)
+            live = sum(1 for s in self._sessions.values() if not s.is_empty)
+
+        stats = dict(self._stats)
+        stats["active_sessions"] = active
+        stats["live_generators"] = live
+        stats["estimated_memory_mb"] = round(live * self.session_memory_mb, 1)
+        stats["reuse_rate"] = stats["session_turns"] / stats["turns"] if stats["turns"] else 0.0
+        return stats
+
+    def _purge_expired(self):
+        now = time.time()
+        for conversation_id, session in list(self._sessions.items()):
+            if now - session.last_used > self.ttl_seconds and not session.lock.locked():
+                self._sessions.pop(conversation_id)
+                self._stats["evictions_ttl"] += 1
+
+    def _make_room(self):
+        """Despeja sessões menos recentes até caber uma nova (contagem e memória)"""
+        def over_limit() -> bool:
+            if len(self._sessions) >= self.max_sessions:
+                return True
+            if self.session_memory_mb > 0:
+                live = sum(1 for s in self._sessions.values() if not s.is_empty)
+                return (live + 1) * self.session_memory_mb > self.max_memory_mb
+            return False
+
+        for conversation_id in list(self._sessions.keys()):
+            if not over_limit():
+                break
+            session = self._sessions[conversation_id]
+            if session.lock.locked():
+                continue
+            reason = "evictions_lru" if len(self._sessions) >= self.max_sessions else "evictions_memory"
+            self._sessions.pop(conversation_id)
+            self._stats[reason] += 1
@@ -0,0 +1,291 @@
+"""
+Decodificação especulativa com modelo de rascunho.
+
+Um modelo ONNX pequeno da mesma família (mesmo vocabulário, ex.: Llama 3.2 1B
+para o 3B) propõe ``num_tokens`` tokens; o modelo principal verifica todos em
+um único forward (``append_tokens`` com os k+1 tokens) e aceita o maior
+prefixo compatível. Cada rodada produz de 1 a k+1 tokens por forward do
+modelo principal.
+
+A verificação segue o speculative sampling (aceita o token do rascunho com
+probabilidade ``min(1, p/q)`` e, na rejeição, amostra do resíduo
+``max(0, p - q)``), então a distribuição da saída é a mesma da decodificação
+normal com temperature/top_k/top_p. Em greedy (``do_sample=False``) isso se
+reduz a aceitar enquanto o argmax do modelo principal coincidir.
+
+Requer que o runtime exponha os logits de todas as posições do último
+forward (``get_output("logits")``) e ``rewind_to``. Quando não expõe (ex.:
+modelos QNN exportados só com os logits da última posição), o modo é
+desativado e o engine segue com a decodificação normal.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import logging
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+try:
+    import onnxruntime_genai as og
+except Exception:
+    og = None
+
+
+class SpeculativeUnavailable(RuntimeError):
+    """O runtime/modelo não permite verificar tokens do rascunho"""
+
+
+class SpeculativeDecoder:
+    """
+    Gera tokens com rascunho + verificação.
+
+    Args:
+        draft_model_path: Diretório do modelo de rascunho (onnxruntime-genai)
+        num_tokens: Tokens propostos pelo rascunho por rodada
+        eos_token_ids: Tokens de fim de sequência do modelo principal
+        execution_provider: Provider do rascunho (``follow_config``, ``cpu``...)
+    """
+
+    def __init__(self, draft_model_path: str, num_tokens: int = 4, eos_token_ids=(),
+                 execution_provider: str = "follow_config"):
+        if og is None:
+            raise SpeculativeUnavailable("onnxruntime-genai não disponível")
+
+        config = og.Config(draft_model_path)
+        if execution_provider != "follow_config":
+            config.clear_providers()
+            if execution_provider != "cpu":
+                config.append_provider(execution_provider)
+
+        self.draft_model_path = draft_model_path
+        self.draft_model = og.Model(config)
+        self.num_tokens = max(1, num_tokens)
+        self.eos_token_ids = set(eos_token_ids)
+        self.enabled = True
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "generations": 0,
+            "rounds": 0,
+            "drafted": 0,
+            "accepted": 0,
+            "tokens_generated": 0,
+            "fallbacks": 0,
+        }
+
+    def supports(self, search_options: Dict[str, Any]) -> bool:
+        """Se a geração pode seguir pelo caminho especulativo"""
+        return (
+            self.enabled
+            and search_options.get("batch_size", 1) == 1
+            # Penalidade de repetição depende do histórico de cada amostra: não replicada aqui
+            and search_options.get("repetition_penalty", 1.0) == 1.0
+        )
+
+    def disable(self, reason: str):
+        """Desliga o modo especulativo (capacidade ausente no runtime)"""
+        if self.enabled:
+            log.warning(f"Decodificação especulativa desativada: {reason}")
+        self.enabled = False
+        with self._lock:
+            self._stats["fallbacks"] += 1
+
+    def start(self, target_model, input_tokens, search_options: Dict[str, Any]) -> "_SpeculativeRun":
+        """
+        Faz o prefill do prompt nos dois modelos e devolve a geração pronta.
+
+        Raises:
+            SpeculativeUnavailable: Se o runtime não permitir a verificação
+        """
+        prompt = [int(t) for t in input_tokens]
+        # Espaço extra para os tokens verificados e descartados em cada rodada
+        options = dict(search_options)
+        options["max_length"] = search_options["max_length"] + self.num_tokens + 1
+
+        target = _new_generator(target_model, options)
+        if not hasattr(target, "rewind_to"):
+            raise SpeculativeUnavailable("Generator sem rewind_to")
+
+        target.append_tokens(prompt)
+        logits = _all_logits(target)
+        if len(prompt) > 1 and logits.shape[0] != len(prompt):
+            raise SpeculativeUnavailable("o modelo só expõe os logits da última posição")
+
+        draft = _new_generator(self.draft_model, options)
+        draft.append_tokens(prompt)
+        draft_logits = _all_logits(draft)
+        if draft_logits.shape[-1] != logits.shape[-1]:
+            raise SpeculativeUnavailable(
+                f"vocabulário do rascunho ({draft_logits.shape[-1]}) difere do principal ({logits.shape[-1]})"
+            )
+
+        with self._lock:
+            self._stats["generations"] += 1
+        return _SpeculativeRun(self, target, draft, len(prompt), logits[-1], search_options)
+
+    def record_round(self, drafted: int, accepted: int, emitted: int):
+        with self._lock:
+            self._stats["rounds"] += 1
+            self._stats["drafted"] += drafted
+            self._stats["accepted"] += accepted
+            self._stats["tokens_generated"] += emitted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Taxa de aceitação e tokens por forward do modelo principal"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["draft_model"] = self.draft_model_path
+        stats["num_tokens"] = self.num_tokens
+        stats["acceptance_rate"] = stats["accepted"] / stats["drafted"] if stats["drafted"] else 0.0
+        stats["tokens_per_target_forward"] = (
+            stats["tokens_generated"] / stats["rounds"] if stats["rounds"] else 0.0
+        )
+        return stats
+
+    def sample(self, probabilities: np.ndarray) -> int:
+        return int(self._rng.choice(len(probabilities), p=probabilities))
+
+    def accept(self, p: float, q: float) -> bool:
+        if q <= 0.0:
+            return False
+        return p >= q or self._rng.random() < p / q
+
+
+class _SpeculativeRun:
+    """Estado de uma geração especulativa (prompt já processado)"""
+
+    def __init__(self, decoder: SpeculativeDecoder, target, draft, prompt_length: int,
+                 next_logits: np.ndarray, search_options: Dict[str, Any]):
+        self.decoder = decoder
+        self.target = target
+        self.draft = draft
+        self.length = prompt_length
+        self.search_options = search_options
+        # Token já decidido, ainda fora do KV dos dois modelos
+        self.pending = decoder.sample(_distribution(next_logits, search_options))
+        self.draft_pending: List[int] = []
+
+    def tokens(self, max_new_tokens: int, should_stop: Callable[[], bool],
+               before_round: Optional[Callable[[], None]] = None) -> Iterator[int]:
+        """Produz os tokens aceitos até EOS, ``max_new_tokens`` ou ``should_stop``"""
+        decoder = self.decoder
+        eos = decoder.eos_token_ids
+        generated = 0
+
+        try:
+            while generated < max_new_tokens:
+                if should_stop():
+                    return
+                if before_round is not None:
+                    before_round()
+
+                token = self.pending
+                generated += 1
+                yield token
+                if token in eos or generated >= max_new_tokens:
+                    return
+
+                k = min(decoder.num_tokens, max_new_tokens - generated)
+                proposals, q_dists = self._draft(token, k)
+
+                # Verificação: um forward do modelo principal com c + rascunho
+                self.target.append_tokens([token] + proposals)
+                p_dists = [_distribution(row, self.search_options) for row in _all_logits(self.target)]
+                if len(p_dists) != k + 1:
+                    raise SpeculativeUnavailable("logits de verificação incompletos")
+
+                accepted = 0
+                for i, proposal in enumerate(proposals):
+                    if not decoder.accept(p_dists[i][proposal], q_dists[i][proposal]):
+                        break
+                    accepted += 1
+
+                if accepted < k:
+                    residual = np.maximum(p_dists[accepted] - q_dists[accepted], 0.0)
+                    total = residual.sum()
+                    next_token = decoder.sample(residual / total if total > 0 else p_dists[accepted])
+                else:
+                    next_token = decoder.sample(p_dists[k])
+
+                # Descarta do KV o que não foi aceito
+                base = self.length + 1
+                self.target.rewind_to(base + accepted)
+                if accepted < k:
+                    self.draft.rewind_to(base + accepted)
+                    self.draft_pending = []
+                else:
+                    # O último token do rascunho não chegou a entrar no KV dele
+                    self.draft_pending = [proposals[-1]]
+                self.length = base + accepted
+                self.pending = next_token
+
+                decoder.record_round(k, accepted, 1 + accepted)
+                for proposal in proposals[:accepted]:
+                    generated += 1
+                    yield proposal
+                    if proposal in eos:
+                        return
+        finally:
+            del self.target
+            del self.draft
+
+    def _draft(self, token: int, k: int):
+        """k propostas do rascunho a partir de ``token`` e as distribuições usadas"""
+        proposals: List[int] = []
+        q_dists: List[np.ndarray] = []
+
+        feed = self.draft_pending + [token]
+        for _ in range(k):
+            self.draft.append_tokens(feed)
+            q = _distribution(_all_logits(self.draft)[-1], self.search_options)
+            proposal = self.decoder.sample(q)
+            proposals.append(proposal)
+            q_dists.append(q)
+            feed = [proposal]
+        return proposals, q_dists
+
+
+def _new_generator(model, search_options: Dict[str, Any]):
+    params = og.GeneratorParams(model)
+    params.set_search_options(**search_options)
+    return og.Generator(model, params)
+
+
+def _all_logits(generator) -> np.ndarray:
+    """Logits de todas as posições do último forward, shape (posições, vocab)"""
+    logits = np.asarray(generator.get_output("logits"), dtype=np.float32)
+    return logits.reshape(-1, logits.shape[-1])
+
+
+def _distribution(logits: np.ndarray, search_options: Dict[str, Any]) -> np.ndarray:
+    """Distribuição de amostragem equivalente às search options (one-hot em greedy)"""
+    vocab = logits.shape[-1]
+    if not search_options.get("do_sample", False):
+        probabilities = np.zeros(vocab, dtype=np.float64)
+        probabilities[int(np.argmax(logits))] = 1.0
+        return probabilities
+
+    scaled = logits.astype(np.float64) / max(search_options.get("temperature", 1.0), 1e-6)
+
+    top_k = search_options.get("top_k") or 0
+    if 0 < top_k < vocab:
+        cutoff = np.partition(scaled, -top_k)[-top_k]
+        scaled = np.where(scaled < cutoff, -np.inf, scaled)
+
+    probabilities = np.exp(scaled - scaled.max())
+    probabilities /= probabilities.sum()
+
+    top_p = search_options.get("top_p", 1.0)
+    if 0.0 < top_p < 1.0:
+        order = np.argsort(-probabilities, kind="stable")
+        cumulative = np.cumsum(probabilities[order])
+        keep = order[:int(np.searchsorted(cumulative, top_p)) + 1]
+        filtered = np.zeros_like(probabilities)
+        filtered[keep] = probabilities[keep]
+        probabilities = filtered / filtered.sum()
+
+    return probabilities
@@ -0,0 +1,256 @@
+"""
+Telemetria das gerações: TTFT, TPOT e tokens/s por ponto de chamada.
+
+O ``model-qa.py --timings`` mede tempo até o primeiro token e tokens/s de
+prompt e decodificação, mas o ``LLMEngine`` não registrava nada disso. Cada
+geração agora produz um ``GenerationTrace`` com tokens de prompt, tokens
+gerados, tempo de prefill, TTFT e latência por token, marcado com o
+chamador (critic, reporter, chatbot...). Os registros alimentam janelas
+móveis por chamador, com percentis e histogramas expostos nas métricas.
+
+O chamador vem do argumento ``caller`` da geração ou do ``caller_scope``
+corrente (``ContextVar`` copiada para as threads do executor de inferência).
+TTFT conta a partir do início da geração: no scheduler de batching inclui a
+espera na fila, no caminho direto começa quando o executor pega o pedido.
+Outros componentes (ex.: o preditor de tamanho de resposta) recebem cada
+registro com ``add_listener``.
+"""
+from __future__ import annotations
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional
+import logging
+import threading
+import time
+
+from ..settings import settings
+
+log = logging.getLogger(__name__)
+
+UNKNOWN_CALLER = "unknown"
+
+# Limites superiores (ms) dos buckets dos histogramas
+_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+current_caller: ContextVar[Optional[str]] = ContextVar("current_caller", default=None)
+
+
+@contextmanager
+def caller_scope(name: str):
+    """Marca as gerações feitas dentro do bloco com o chamador ``name``"""
+    reset = current_caller.set(name)
+    try:
+        yield name
+    finally:
+        current_caller.reset(reset)
+
+
+def resolve_caller(caller: Optional[str] = None) -> str:
+    """Chamador explícito, o do contexto ou ``unknown``"""
+    return caller or current_caller.get() or UNKNOWN_CALLER
+
+
+class GenerationTrace:
+    """
+    Tempos de uma geração (uma sequência).
+
+    Args:
+        telemetry: Agregador que recebe o registro em ``finish``
+        caller: Ponto de chamada
+        model: Modelo que gerou
+        path: Caminho de decodificação (direct, prefix, session, speculative, batch)
+    """
+
+    def __init__(self, telemetry: "GenerationTelemetry", caller: str, model: str, path: str = "direct"):
+        self.telemetry = telemetry
+        self.caller = caller
+        self.model = model
+        self.path = path
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self.prefill_seconds = 0.0
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        # Orçamento de resposta (preditor de tamanho) e se a geração foi interrompida
+        self.length_key: Optional[str] = None
+        self.budget: Optional[int] = None
+        self.budget_source: Optional[str] = None
+        self.interrupted = False
+        self._finished = False
+
+    @contextmanager
+    def prefill(self):
+        """Mede um prefill (``append_tokens`` do prompt)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.prefill_seconds += time.perf_counter() - started
+
+    def token(self):
+        """Registra um token gerado"""
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.generated_tokens += 1
+
+    def finish(self):
+        """Fecha a medição e envia o registro (uma vez)"""
+        if self._finished:
+            return
+        self._finished = True
+        self.telemetry.record(self.to_record())
+
+    def to_record(self) -> Dict[str, Any]:
+        ended = self.last_token_at or time.perf_counter()
+        ttft = self.first_token_at - self.started if self.first_token_at is not None else None
+        decode = ended - self.first_token_at if self.first_token_at is not None else 0.0
+        tpot = decode / (self.generated_tokens - 1) if self.generated_tokens > 1 else None
+        return {
+            "caller": self.caller,
+            "model": self.model,
+            "path": self.path,
+            "prompt_tokens": self.prompt_tokens,
+            "generated_tokens": self.generated_tokens,
+            "prefill_ms": self.prefill_seconds * 1000,
+            "ttft_ms": ttft * 1000 if ttft is not None else None,
+            "tpot_ms": tpot * 1000 if tpot is not None else None,
+            "total_ms": (ended - self.started) * 1000,
+            "prompt_tokens_per_s": (
+                self.prompt_tokens / self.prefill_seconds if self.prefill_seconds > 0 else None
+            ),
+            "decode_tokens_per_s": (self.generated_tokens - 1) / decode if decode > 0 else None,
+            "length_key": self.length_key,
+            "budget": self.budget,
+            "budget_source": self.budget_source,
+            "interrupted": self.interrupted,
+            "timestamp": time.time(),
+        }
+
+
+class GenerationTelemetry:
+    """
+    Janelas móveis dos registros de geração por chamador.
+
+    Args:
+        window: Registros mantidos por chamador
+    """
+
+    _METRICS = ("ttft_ms", "tpot_ms", "prefill_ms", "total_ms", "prompt_tokens_per_s", "decode_tokens_per_s")
+    _HISTOGRAMS = ("ttft_ms", "tpot_ms")
+
+    def __init__(self, window: int = 500):
+        self.window = max(1, window)
+        self._records: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def trace(self, caller: Optional[str], model: str, path: str = "direct") -> GenerationTrace:
+        """Nova medição para uma geração"""
+        return GenerationTrace(self, resolve_caller(caller), model, path)
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """Chama ``listener`` com cada registro (fora do lock; erros só são logados)"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def record(self, record: Dict[str, Any]):
+        caller = record["caller"]
+        with self._lock:
+            records = self._records.get(caller)
+            if records is None:
+                records = self._records[caller] = deque(maxlen=self.window)
+                self._totals[caller] = {"calls": 0, "prompt_tokens": 0, "generated_tokens": 0}
+            records.append(record)
+            totals = self._totals[caller]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += record["prompt_tokens"]
+            totals["generated_tokens"] += record["generated_tokens"]
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                log.warning(f"Erro no listener de telemetria: {e}")
+
+    def recent_tpot_ms(self, window_seconds: float = 60.0) -> Optional[float]:
+        """Latência média por token nas gerações dos últimos ``window_seconds``"""
+        cutoff = time.time() - window_seconds
+        with self._lock:
+            values = [
+                r["tpot_ms"] for records in self._records.values() for r in records
+                if r["timestamp"] >= cutoff and r["tpot_ms"] is not None
+            ]
+        return sum(values) / len(values) if values else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Percentis e histogramas por chamador, por modelo e no total"""
+        with self._lock:
+            by_caller = {caller: list(records) for caller, records in self._records.items()}
+            totals = {caller: dict(t) for caller, t in self._totals.items()}
+
+        everything = [r for records in by_caller.values() for r in records]
+        by_model: Dict[str, List[Dict[str, Any]]] = {}
+        for record in everything:
+            by_model.setdefault(record["model"], []).append(record)
+
+        callers = {}
+        for caller, records in by_caller.items():
+            callers[caller] = {**totals[caller], **self._summarize(records)}
+
+        return {
+            "window": self.window,
+            "overall": self._summarize(everything),
+            "callers": callers,
+            "models": {model: self._summarize(records) for model, records in by_model.items()},
+        }
+
+    def _summarize(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {"window_calls": len(records)}
+        for metric in self._METRICS:
+            values = sorted(r[metric] for r in records if r[metric] is not None)
+            summary[metric] = _percentiles(values)
+        for metric in self._HISTOGRAMS:
+            summary[f"{metric}_histogram"] = _histogram([r[metric] for r in records if r[metric] is not None])
+        paths: Dict[str, int] = {}
+        for record in records:
+            paths[record["path"]] = paths.get(record["path"], 0) + 1
+        summary["paths"] = paths
+        return summary
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"mean": None, "p50": None, "p90": None, "p99": None}
+
+    def _at(q: float) -> float:
+        return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+    return {
+        "mean": round(sum(values) / len(values), 2),
+        "p50": _at(0.50),
+        "p90": _at(0.90),
+        "p99": _at(0.99),
+    }
+
+
+def _histogram(values: List[float]) -> Dict[str, int]:
+    """Contagem por bucket (``le_<ms>``: acima do limite anterior até este; ``inf``: o resto)"""
+    buckets = {f"le_{bound}": 0 for bound in _LATENCY_BUCKETS_MS}
+    buckets["inf"] = 0
+    for value in values:
+        for bound in _LATENCY_BUCKETS_MS:
+            if value <= bound:
+                buckets[f"le_{bound}"] += 1
+                break
+        else:
+            buckets["inf"] += 1
+    return buckets
+
+
+generation_telemetry = GenerationTelemetry(window=settings.llm_telemetry_window)
@@ -0,0 +1,305 @@
+"""
+Registro único de modelos e recursos do processo.
+
+O graph, o chatbot e o onboarding carregavam cada um o seu ``LLMEngine``,
+``ONNXEmbedder`` e ``LocalFaiss``: o mesmo modelo ficava na memória duas ou
+três vezes. Aqui cada recurso é identificado por uma chave (tipo + caminho),
+carregado na primeira aquisição e compartilhado por todos os componentes.
+
+- ``acquire``/``release`` contam referências; ``lease`` é o atalho para uso
+  pontual dentro de um bloco.
+- Recursos sem referência e sem uso há ``model_idle_unload_seconds`` são
+  descarregados por uma thread de limpeza (e recarregados na próxima
+  aquisição). Recursos ``pinned`` (ex.: vector stores, cujos textos só existem
+  em memória) nunca são descarregados.
+- A memória de cada recurso é medida pela variação do RSS durante o
+  carregamento (com psutil) e pelo tamanho em disco dos arquivos do modelo.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import os
+import threading
+import time
+
+from .settings import settings
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class _Resource:
+    """Entrada do registro (carregada ou não)"""
+    key: str
+    factory: Callable[[], Any]
+    close: Optional[Callable[[Any], None]] = None
+    path: Optional[str] = None
+    pinned: bool = False
+    value: Any = None
+    refs: int = 0
+    loads: int = 0
+    load_seconds: float = 0.0
+    memory_mb: Optional[float] = None
+    last_used: float = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self.value is not None
+
+
+class ModelRegistry:
+    """
+    Recursos compartilhados com carregamento sob demanda e descarte por ociosidade.
+
+    Args:
+        idle_unload_seconds: Ociosidade (sem referências) antes do descarte (0 = nunca)
+    """
+
+    def __init__(self, idle_unload_seconds: float = 0.0):
+        self.idle_unload_seconds = idle_unload_seconds
+        self._resources: Dict[str, _Resource] = {}
+        self._lock = threading.Lock()
+        # Carregamentos em série: a variação de RSS fica atribuída a um recurso só
+        self._load_lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._unloads = 0
+
+    def acquire(self, key: str, factory: Callable[[], Any], close: Optional[Callable[[Any], None]] = None,
+                path: Optional[str] = None, pinned: bool = False) -> Any:
+        """
+        Retorna o recurso ``key``, carregando com ``factory`` se necessário.
+
+        Cada ``acquire`` deve ter um ``release`` correspondente quando o
+        componente deixar de usar o recurso.
+
+        Args:
+            key: Identificador único (ex.: ``llm:/caminho/do/modelo``)
+            factory: Cria o recurso (chamada uma vez por carregamento)
+            close: Libera o recurso no descarte (além de soltar a referência)
+            path: Arquivo/diretório do modelo (para o tamanho em disco)
+            pinned: Nunca descarregar por ociosidade
+        """
+        with self._lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = _Resource(key=key, factory=factory, close=close, path=path, pinned=pinned)
+                self._resources[key] = resource
+            resource.refs += 1
+            resource.last_used = time.time()
+
+        try:
+            self._ensure_loaded(resource)
+        except Exception:
+            with self._lock:
+                resource.refs -= 1
+            raise
+
+        self._start_reaper()
+        return resource.value
+
+    def release(self, key: str):
+        """Devolve uma referência obtida com ``acquire``"""
+        with self._lock:
+            resource = self._resources.get(key)
+            if resource is None or resource.refs == 0:
+                log.warning(f"release sem acquire correspondente: {key}")
+                return
+            resource.refs -= 1
+            resource.last_used = time.time()
+
+    @contextmanager
+    def lease(self, key: str, factory: Callable[[], Any], **options):
+        """``acquire`` durante o bloco"""
+        value = self.acquire(key, factory, **options)
+        try:
+            yield value
+        finally:
+            self.release(key)
+
+    def unload(self, key: str, force: bool = False) -> bool:
+        """Descarrega ``key`` se não houver referências (ou sempre, com ``force``)"""
+        with self._lock:
+            resource = self._resources.get(key)
+            if resource is None or not resource.loaded or (resource.refs and not force):
+                return False
+            value, resource.value = resource.value, None
+            self._unloads += 1
+
+        if resource.close is not None:
+            try:
+                resource.close(value)
+            except Exception as e:
+                log.warning(f"Erro ao liberar {key}: {e}")
+        log.info(f"Recurso descarregado: {key}")
+        return True
+
+    def unload_idle(self, idle_seconds: Optional[float] = None) -> List[str]:
+        """Descarrega recursos sem referências ociosos há ``idle_seconds``"""
+        idle_seconds = self.idle_unload_seconds if idle_seconds is None else idle_seconds
+        now = time.time()
+        with self._lock:
+            candidates = [
+                r.key for r in self._resources.values()
+                if r.loaded and not r.refs and not r.pinned and now - r.last_used >= idle_seconds
+            ]
+        return [key for key in candidates if self.unload(key)]
+
+    def close(self):
+        """Para a limpeza e descarrega tudo (encerramento do processo)"""
+        self._stop.set()
+        for key in list(self._resources):
+            self.unload(key, force=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado, referências e memória de cada recurso"""
+        with self._lock:
+            resources = list(self._resources.values())
+            unloads = self._unloads
+
+        entries = {}
+        for r in resources:
+            entries[r.key] = {
+                "loaded": r.loaded,
+                "refs": r.refs,
+                "pinned": r.pinned,
+                "loads": r.loads,
+                "last_load_seconds": round(r.load_seconds, 3),
+                "memory_mb": r.memory_mb,
+                "disk_mb": _disk_mb(r.path),
+                "idle_seconds": round(time.time() - r.last_used, 1),
+            }
+
+        loaded = [e for e in entries.values() if e["loaded"]]
+        return {
+            "resources": entries,
+            "loaded": len(loaded),
+            "memory_mb": round(sum(e["memory_mb"] or 0.0 for e in loaded), 1),
+            "disk_mb": round(sum(e["disk_mb"] or 0.0 for e in loaded), 1),
+            "unloads": unloads,
+            "idle_unload_seconds": self.idle_unload_seconds,
+            "memory_measured": psutil is not None,
+        }
+
+    def _ensure_loaded(self, resource: _Resource):
+        if resource.loaded:
+            return
+        with self._load_lock:
+            if resource.loaded:
+                return
+
+            log.info(f"Carregando recurso: {resource.key}")
+            rss_before = _rss_mb()
+            started = time.time()
+            value = resource.factory()
+            resource.load_seconds = time.time() - started
+            rss_after = _rss_mb()
+            if rss_before is not None and rss_after is not None:
+                resource.memory_mb = round(max(rss_after - rss_before, 0.0), 1)
+
+            with self._lock:
+                resource.value = value
+                resource.loads += 1
+                resource.last_used = time.time()
+
+    def _start_reaper(self):
+        if self.idle_unload_seconds <= 0 or self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reaper_loop, name="model-registry-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reaper_loop(self):
+        interval = min(60.0, max(self.idle_unload_seconds / 4, 1.0))
+        while not self._stop.wait(interval):
+            try:
+                self.unload_idle()
+            except Exception as e:
+                log.warning(f"Erro na limpeza de recursos ociosos: {e}")
+
+
+def _rss_mb() -> Optional[float]:
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _disk_mb(path: Optional[str]) -> Optional[float]:
+    """Tamanho em disco de um arquivo ou diretório de modelo"""
+    if not path or not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        return round(os.path.getsize(path) / (1024 * 1024), 1)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return round(total / (1024 * 1024), 1)
+
+
+model_registry = ModelRegistry(idle_unload_seconds=settings.model_idle_unload_seconds)
+
+
+# ----------------------------------------------------------------------
+# Recursos padrão da aplicação
+# ----------------------------------------------------------------------
+
+def default_embedder_path() -> str:
+    """Arquivo ONNX do embedder (``embed_model_path`` pode ser o diretório do modelo)"""
+    path = settings.embed_model_path
+    if os.path.isdir(path):
+        return os.path.join(path, "model.onnx")
+    return path
+
+
+def llm_key(model_path: Optional[str] = None) -> str:
+    return f"llm:{os.path.abspath(model_path or settings.llm_model_path)}"
+
+
+def embedder_key(model_path: Optional[str] = None) -> str:
+    return f"embedder:{os.path.abspath(model_path or default_embedder_path())}"
+
+
+def vector_store_key(index_dir: Optional[str] = None, dim: int = 768) -> str:
+    return f"faiss:{os.path.abspath(index_dir or settings.index_dir)}:{dim}"
+
+
+def acquire_llm(model_path: Optional[str] = None):
+    """``LLMEngine`` compartilhado do modelo (padrão: ``llm_model_path``)"""
+    from .llm.engine import LLMEngine
+
+    model_path = model_path or settings.llm_model_path
+    return model_registry.acquire(
+        llm_key(model_path), lambda: LLMEngine(model_path), close=LLMEngine.close, path=model_path
+    )
+
+
+def acquire_embedder(model_path: Optional[str] = None):
+    """``ONNXEmbedder`` compartilhado (padrão: ``embed_model_path``)"""
+    from .embeddings.embedding import ONNXEmbedder
+
+    model_path = model_path or default_embedder_path()
+    return model_registry.acquire(embedder_key(model_path), lambda: ONNXEmbedder(model_path), path=model_path)
+
+
+def acquire_vector_store(index_dir: Optional[str] = None, dim: int = 768):
+    """``LocalFaiss`` compartilhado do diretório (os textos só existem em memória: fixo)"""
+    from .vectorstore.faiss_store import LocalFaiss
+
+    index_dir = index_dir or settings.index_dir
+    return model_registry.acquire(
+        vector_store_key(index_dir, dim), lambda: LocalFaiss(dim=dim, index_dir=index_dir),
+        path=index_dir, pinned=True
+    )
@@ -19,9 +19,16 @@ except ImportError:
     psutil = None
     logging.getLogger(__name__).warning("psutil não disponível. Monitor de NPU com funcionalidade limitada.")
 
+from .llm.telemetry import generation_telemetry
+
 logger = logging.getLogger(__name__)
 
 
+def _measured_inference_time_ms(window_seconds: float = 60.0) -> Optional[float]:
+    """Latência média por token (TPOT) medida pelo LLMEngine na janela (None sem gerações)"""
+    return generation_telemetry.recent_tpot_ms(window_seconds)
+
+
 @dataclass
 class NPUMetrics:
     """Métricas de uso da NPU"""
@@ -29,7 +36,7 @@ class NPUMetrics:
     memory_used_mb: float
     temperature_celsius: float
     power_consumption_watts: float
-    inference_time_ms: float
+    inference_time_ms: Optional[float]  # None sem gerações medidas na janela
     timestamp: float
 
 
@@ -110,7 +117,7 @@ class NPUMonitor:
                     memory_used_mb=memory_used_mb,
                     temperature_celsius=temp_celsius,
                     power_consumption_watts=power_watts,
-                    inference_time_ms=50.0,  # Tempo médio de inferência
+                    inference_time_ms=_measured_inference_time_ms(),  # TPOT medido nas gerações
                     timestamp=time.time()
                 )
             else:
@@ -121,7 +128,7 @@ class NPUMonitor:
                     memory_used_mb=random.uniform(100, 500),    # Memória simulada
                     temperature_celsius=random.uniform(35, 55),  # Temperatura simulada
                     power_consumption_watts=random.uniform(2, 8), # Energia simulada
-                    inference_time_ms=random.uniform(40, 60),    # Tempo simulado
+                    inference_time_ms=_measured_inference_time_ms(),  # TPOT medido nas gerações
                     timestamp=time.time()
                 )
 
@@ -133,7 +140,7 @@ class NPUMonitor:
                 memory_used_mb=0.0,
                 temperature_celsius=25.0,
                 power_consumption_watts=0.0,
-                inference_time_ms=0.0,
+                inference_time_ms=None,
                 timestamp=time.time()
             )
 
@@ -141,7 +148,7 @@ class NPUMonitor:
         """Retorna métricas atuais da NPU"""
         return self._collect_metrics()
 
-    def get_average_metrics(self, window_seconds: float = 60.0) -> Dict[str, float]:
+    def get_average_metrics(self, window_seconds: float = 60.0) -> Dict[str, Optional[float]]:
         """Retorna métricas médias em uma janela de tempo"""
         current_time = time.time()
         cutoff_time = current_time - window_seconds
@@ -158,15 +165,16 @@ class NPUMonitor:
                 "avg_memory_used_mb": 0.0,
                 "avg_temperature_celsius": 25.0,
                 "avg_power_consumption_watts": 0.0,
-                "avg_inference_time_ms": 50.0
+                "avg_inference_time_ms": _measured_inference_time_ms(window_seconds)
             }
 
+        inference_times = [m.inference_time_ms for m in recent_metrics if m.inference_time_ms is not None]
         return {
             "avg_utilization_percent": sum(m.utilization_percent for m in recent_metrics) / len(recent_metrics),
             "avg_memory_used_mb": sum(m.memory_used_mb for m in recent_metrics) / len(recent_metrics),
             "avg_temperature_celsius": sum(m.temperature_celsius for m in recent_metrics) / len(recent_metrics),
             "avg_power_consumption_watts": sum(m.power_consumption_watts for m in recent_metrics) / len(recent_metrics),
-            "avg_inference_time_ms": sum(m.inference_time_ms for m in recent_metrics) / len(recent_metrics)
+            "avg_inference_time_ms": sum(inference_times) / len(inference_times) if inference_times else None
         }
 
     def get_performance_report(self) -> Dict[str, Any]:
@@ -188,16 +196,20 @@ class NPUMonitor:
             "timestamp": time.time()
         }
 
-    def _calculate_performance_score(self, current: NPUMetrics, averages: Dict[str, float]) -> float:
+    def _calculate_performance_score(self, current: NPUMetrics, averages: Dict[str, Optional[float]]) -> float:
         """Calcula score de performance da NPU (0-100)"""
         # Score baseado em eficiência energética e tempo de resposta
-        utilization_score = min(current.utilization_percent / 80.0, 1.0) * 100
-        power_efficiency = max(0, 100 - (current.power_consumption_watts * 10))
-        response_time_score = max(0, 100 - (current.inference_time_ms - 40))
+        scores = [
+            min(current.utilization_percent / 80.0, 1.0) * 100,
+            max(0, 100 - (current.power_consumption_watts * 10)),
+        ]
+        # Sem gerações medidas o tempo de resposta fica fora da média (não vale 100)
+        if current.inference_time_ms is not None:
+            scores.append(min(100, max(0, 100 - (current.inference_time_ms - 40))))
 
-        return (utilization_score + power_efficiency + response_time_score) / 3
+        return sum(scores) / len(scores)
 
-    def _get_optimization_suggestions(self, current: NPUMetrics, averages: Dict[str, float]) -> list[str]:
+    def _get_optimization_suggestions(self, current: NPUMetrics, averages: Dict[str, Optional[float]]) -> list[str]:
         """Gera sugestões de otimização baseadas nas métricas"""
         suggestions = []
 
@@ -210,7 +222,7 @@ class NPUMonitor:
         if current.power_consumption_watts > 15:
             suggestions.append("Alto consumo energético - considere otimização de modelo")
 
-        if current.inference_time_ms > 100:
+        if current.inference_time_ms is not None and current.inference_time_ms > 100:
             suggestions.append("Tempo de inferência alto - considere quantização ou cache")
 
         if not suggestions:
@@ -6,6 +6,7 @@ Define background, goal, task e prompts específicos para cada agente.
 
 from typing import Dict, Any
 from enum import Enum
+import textwrap
 
 
 # Constantes globais para prompts
@@ -892,6 +893,17 @@ def get_all_agent_backgrounds() -> Dict[str, str]:
     }
 
 
+def get_agent_system_prompt(agent_role: AgentRole) -> str:
+    """
+    Retorna o system prompt estático de um agente (SYSTEM_BASE + background).
+
+    O texto é fixo por agente, o que permite ao LLMEngine reaproveitar o
+    prefill desse prefixo entre chamadas (ver LLMEngine.register_prefix).
+    """
+    background = textwrap.dedent(get_agent_prompt(agent_role)["background"]).strip()
+    return f"{SYSTEM_BASE.strip()}\n\n{background}"
+
+
 def get_all_agent_goals() -> Dict[str, str]:
     """Retorna os goals de todos os agentes"""
     return {
@@ -0,0 +1,126 @@
+"""
+Estado de prontidão dos componentes (carregamento + aquecimento).
+
+O servidor sobe, carrega os modelos em segundo plano e roda gerações e
+embeddings de aquecimento antes de aceitar tráfego. Cada componente passa por
+``pending`` -> ``loading`` -> ``warming`` -> ``ready`` (ou ``failed``) e
+guarda o tempo de cada fase; ``/ready`` expõe esse estado para o balanceador.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import threading
+import time
+
+PENDING = "pending"
+LOADING = "loading"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class ComponentStatus:
+    """Estado de um componente e a duração de cada fase"""
+    name: str
+    state: str = PENDING
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "timings_seconds": {phase: round(seconds, 3) for phase, seconds in self.timings.items()},
+            "error": self.error,
+        }
+
+
+class Readiness:
+    """Acompanha o carregamento e o aquecimento dos componentes do servidor"""
+
+    def __init__(self):
+        self._components: Dict[str, ComponentStatus] = {}
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def begin(self, *names: str):
+        """Inicia o aquecimento com os componentes esperados"""
+        with self._lock:
+            self._components = {name: ComponentStatus(name) for name in names}
+            self._started_at = time.time()
+            self._finished_at = None
+
+    def finish(self):
+        with self._lock:
+            self._finished_at = time.time()
+
+    @contextmanager
+    def phase(self, name: str, state: str):
+        """Marca ``name`` em ``state`` durante o bloco e registra a duração (falha -> ``failed``)"""
+        component = self._component(name)
+        with self._lock:
+            component.state = state
+        started = time.time()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                component.state = FAILED
+                component.error = str(e)
+            raise
+        finally:
+            with self._lock:
+                component.timings[state] = component.timings.get(state, 0.0) + time.time() - started
+
+    def mark_ready(self, name: str):
+        with self._lock:
+            self._component(name).state = READY
+
+    def mark_failed(self, name: str, error: str):
+        with self._lock:
+            component = self._component(name)
+            component.state = FAILED
+            component.error = error
+
+    def is_ready(self, name: Optional[str] = None) -> bool:
+        """Se ``name`` (ou todos os componentes) terminou o aquecimento"""
+        with self._lock:
+            if name is not None:
+                component = self._components.get(name)
+                return component is not None and component.state == READY
+            return bool(self._components) and all(c.state == READY for c in self._components.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado geral e por componente (corpo do ``/ready``)"""
+        with self._lock:
+            components = {name: c.to_dict() for name, c in self._components.items()}
+            started, finished = self._started_at, self._finished_at
+
+        states = {c["state"] for c in components.values()}
+        if components and states == {READY}:
+            status = READY
+        elif FAILED in states and finished is not None:
+            status = FAILED
+        elif started is None:
+            status = PENDING
+        else:
+            status = WARMING
+
+        end = finished if finished is not None else time.time()
+        return {
+            "ready": status == READY,
+            "status": status,
+            "components": components,
+            "warmup_seconds": round(end - started, 3) if started is not None else None,
+        }
+
+    def _component(self, name: str) -> ComponentStatus:
+        component = self._components.get(name)
+        if component is None:
+            component = self._components[name] = ComponentStatus(name)
+        return component
+
+
+readiness = Readiness()
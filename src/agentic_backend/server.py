@@ -1,29 +1,65 @@
 from __future__ import annotations
 import asyncio
-from fastapi import FastAPI, Body, HTTPException
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, Body, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 from .settings import settings
 from .utils.logging import setup_logging
 from .utils.ids import new_job_id
-from .graph.graph import build_graph
-from .tools.mcp_client import MCPClient
-from .audit.evidence import EvidencePack
-from .graph.nodes.chatbot import ChatbotAgent
-from .llm.engine import LLMEngine
-from .embeddings.embedding import ONNXEmbedder
-from .vectorstore.faiss_store import LocalFaiss
+from .graph.graph import AIGraph, build_graph
+from .graph.nodes.chatbot import ChatbotAgent, CHATBOT_SYSTEM_PROMPT
+from .llm.response_cache import response_cache
+from .llm.telemetry import generation_telemetry
+from .llm.length_predictor import length_predictor
+from .llm.executor import InferenceQueueFull
+from .llm.cancellation import CancellationToken, cancellation_scope
+from .model_registry import (
+    model_registry, acquire_llm, acquire_embedder, acquire_vector_store,
+    llm_key, embedder_key, vector_store_key
+)
+from .readiness import readiness, LOADING, WARMING
+from .jobs import job_manager, JobQueueFull
+from .graph.checkpoints import checkpoint_store, SUCCEEDED
+from .graph.deferred_reports import deferred_reports
 from .npu_monitor import npu_monitor
 
-app = FastAPI(title="Agentic Browser Backend")
+log = logging.getLogger(__name__)
+
+# Construído pelo aquecimento (lifespan); None até os modelos carregarem
+_graph: Optional[AIGraph] = None
+_warmup_task: Optional[asyncio.Task] = None
+
+WARMUP_PROMPT = "Olá! Em uma frase, como você pode me ajudar?"
+# Folga do /chat/stream depois do prazo para a geração interrompida emitir o próprio done
+STREAM_DEADLINE_GRACE_S = 2.0
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Carrega e aquece os modelos em segundo plano; o servidor já responde /health e /ready"""
+    global _warmup_task
+    _warmup_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+    job_manager.start(_run_graph_job)
+    yield
+    await job_manager.stop()
+    await deferred_reports.stop()
+    model_registry.close()
+
+app = FastAPI(title="Agentic Browser Backend", lifespan=lifespan)
 setup_logging()
-_graph = build_graph()
 
 class JobRequest(BaseModel):
     query: str | None = None
     form_spec: dict | None = None
     automation_spec: dict | None = None
     overlay_mode: bool = False
+    # None = graph_reporter_mode
+    defer_report: bool | None = None
 
 class ChatMessage(BaseModel):
     message: str
@@ -38,6 +74,8 @@ class ChatResponse(BaseModel):
     npu_metrics: Dict[str, Any]
     rag_context_used: bool
     web_search_performed: bool
+    semantic_cache_hit: bool = False
+    truncated: bool = False
     timestamp: str
 
 class ConversationSummary(BaseModel):
@@ -53,53 +91,302 @@ class NPUMetricsResponse(BaseModel):
     performance_score: float
     optimization_suggestions: List[str]
     timestamp: str
+    llm_metrics: Dict[str, Any] = {}
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-@app.post("/run")
-async def run_job(payload: JobRequest = Body(...)):
-    job_id = new_job_id()
-    ev = EvidencePack(job_id)
-    mcp = MCPClient(settings.mcp_ws_url)
+@app.get("/ready")
+def ready():
+    """
+    Prontidão para tráfego: 200 após o aquecimento de todos os componentes,
+    503 enquanto carregam (ou se algum falhou). Inclui o estado e os tempos
+    de carregamento/aquecimento de cada componente.
+    """
+    snapshot = readiness.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+def _run_phase(name: str, state: str, func):
+    """Executa uma fase do aquecimento; falhas ficam registradas no /ready"""
+    try:
+        with readiness.phase(name, state):
+            return func()
+    except Exception as e:
+        log.error(f"Aquecimento: {name} falhou em {state}: {e}")
+        return None
+
+def _load_component(name: str, load, warm=None):
+    """Carrega (e aquece, se ativado) um componente; None se falhar"""
+    value = _run_phase(name, LOADING, load)
+    if value is None:
+        return None
+    if warm is not None and settings.warmup_enabled:
+        if _run_phase(name, WARMING, lambda: warm(value)) is None:
+            return value
+    readiness.mark_ready(name)
+    return value
+
+def _warm_up_llm(engine) -> str:
+    # Prefixo do chatbot já com KV pronto + alocações da primeira decodificação
+    engine.register_prefix(CHATBOT_SYSTEM_PROMPT)
+    return engine.generate_text(
+        WARMUP_PROMPT, system_prompt=CHATBOT_SYSTEM_PROMPT,
+        max_new_tokens=settings.warmup_generation_tokens, cache=False
+    )
+
+def _warm_up():
+    """
+    Carrega modelos e índice pelo registro, roda uma geração e um embedding
+    de aquecimento (otimização das sessões ONNX e alocações da primeira
+    inferência ficam fora do primeiro pedido) e monta o graph e o chatbot.
+    """
+    global _graph
+    small_path = settings.llm_small_model_path
+    components = ["llm"] + (["llm_small"] if small_path else []) + ["embedder", "vector_store", "graph", "chatbot"]
+    readiness.begin(*components)
+    log.info("Aquecimento iniciado")
+
+    # Referências do próprio aquecimento (o graph e o chatbot adquirem as suas)
+    held: List[str] = []
+
+    def _acquire(key: str, acquire):
+        value = acquire()
+        held.append(key)
+        return value
+
+    def _acquire_llm(path: Optional[str] = None):
+        engine = _acquire(llm_key(path), lambda: acquire_llm(path))
+        if not engine.is_available():
+            raise RuntimeError(f"modelo não carregado: {engine.model_path}")
+        return engine
+
+    warm_llm = _warm_up_llm if settings.warmup_generation_tokens > 0 else None
+    _load_component("llm", _acquire_llm, warm_llm)
+    if small_path:
+        _load_component("llm_small", lambda: _acquire_llm(small_path), warm_llm)
+
+    warm_vectors: Dict[str, Any] = {}
+
+    def _warm_embedder(embedder):
+        warm_vectors["query"] = embedder.embed([WARMUP_PROMPT])
+        return warm_vectors["query"]
+
+    def _warm_vector_store(store):
+        vector = warm_vectors.get("query")
+        return store.search(vector, k=1) if vector is not None else []
+
+    _load_component("embedder", lambda: _acquire(embedder_key(), acquire_embedder), _warm_embedder)
+    _load_component("vector_store", lambda: _acquire(vector_store_key(), acquire_vector_store), _warm_vector_store)
+
+    # Modelos já no registro: graph e chatbot só montam os agentes
+    _graph = _load_component("graph", build_graph)
+    _load_component("chatbot", _ensure_chatbot_agent)
+
+    for key in held:
+        model_registry.release(key)
+
+    readiness.finish()
+    snapshot = readiness.snapshot()
+    log.info(f"Aquecimento concluído: {snapshot['status']} em {snapshot['warmup_seconds']}s")
+
+@asynccontextmanager
+async def _request_cancellation(request: Request, timeout_s: float):
+    """
+    Token de cancelamento do pedido: dispara quando o cliente desconecta ou
+    o prazo vence, e interrompe as gerações do LLM feitas dentro do bloco.
+    """
+    token = CancellationToken(timeout_s=timeout_s or None)
+
+    async def _watch_disconnect():
+        while not token.is_set():
+            if await request.is_disconnected():
+                token.cancel("disconnected")
+                return
+            await asyncio.sleep(0.25)
+
+    watcher = asyncio.create_task(_watch_disconnect())
+    try:
+        with cancellation_scope(token):
+            yield token
+    finally:
+        watcher.cancel()
 
-    # Estado inicial
-    state = {
+def _initial_state(job_id: str, payload: JobRequest) -> Dict[str, Any]:
+    return {
         "job_id": job_id,
         "query": payload.query,
         "form_spec": payload.form_spec,
         "automation_spec": payload.automation_spec,
         "overlay_mode": payload.overlay_mode,
+        "defer_report": payload.defer_report,
     }
 
+def _require_graph() -> AIGraph:
+    if _graph is None:
+        raise HTTPException(status_code=503, detail="Modelos em carregamento - consulte /ready")
+    return _graph
+
+async def _run_graph_job(state: Dict[str, Any], on_event, resume: bool) -> Dict[str, Any]:
+    """Executor dos jobs da fila (o graph existe: POST /jobs exige o aquecimento)"""
+    return await _require_graph().invoke(state, on_event, resume=resume)
+
+@app.post("/run")
+async def run_job(request: Request, payload: JobRequest = Body(...)):
+    """
+    Executa o graph e responde só no fim (a conexão fica aberta durante o job).
+    Para jobs longos use ``POST /jobs``.
+
+    Com o Reporter em segundo plano a resposta sai quando o agente termina,
+    com ``report_status = "pending"``; resumo e evidências em ``report_url``.
+    """
+    job_id = new_job_id()
+    state = _initial_state(job_id, payload)
+    _require_graph()
+
     # Usar nossa implementação SimpleGraph diretamente
     try:
-        result = await _graph.invoke(state)
-        return {"job_id": job_id, "state": result}
+        async with _request_cancellation(request, settings.llm_run_timeout_seconds):
+            result = await _graph.invoke(state)
+        response = {"job_id": job_id, "state": result}
+        if result.get("report_status") == "pending":
+            response["report_url"] = f"/reports/{job_id}"
+        return response
     except Exception as e:
         return {"job_id": job_id, "error": str(e), "state": state}
 
-# Instância global do chatbot (inicializada sob demanda)
+@app.post("/jobs", status_code=202)
+async def submit_job(payload: JobRequest = Body(...)):
+    """
+    Enfileira o graph e devolve o ``job_id`` na hora.
+
+    Status e estado parcial em ``GET /jobs/{id}``; progresso por nó em
+    ``GET /jobs/{id}/events`` (SSE). Fila cheia: 429.
+    """
+    _require_graph()
+    job_id = new_job_id()
+    return _submit(job_id, _initial_state(job_id, payload))
+
+@app.post("/jobs/{job_id}/resume", status_code=202)
+async def resume_job(job_id: str):
+    """
+    Retoma um job interrompido (reinício do backend, falha, cancelamento)
+    a partir dos checkpoints: os nós já concluídos não são executados de novo.
+    Jobs retomáveis em ``GET /checkpoints``.
+    """
+    _require_graph()
+    checkpoint = checkpoint_store.get(job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"Sem checkpoint para o job {job_id}")
+    if checkpoint["status"] == SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} já concluído")
+    job = job_manager.get(job_id)
+    if job is not None and not job.finished:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} ainda em andamento")
+    response = _submit(job_id, {"job_id": job_id}, resume=True)
+    response["completed_nodes"] = checkpoint["completed_nodes"]
+    return response
+
+@app.get("/reports/{job_id}")
+async def get_report(job_id: str, wait: float = 0.0):
+    """
+    Relatório do Reporter em segundo plano: resumo executivo, relatório
+    técnico e caminho das evidências.
+
+    ``wait``: segundos para esperar o relatório ficar pronto (``status``
+    ``pending`` enquanto não fica). Relatórios antigos vêm dos checkpoints.
+    """
+    report = await deferred_reports.wait(job_id, min(max(wait, 0.0), 60.0))
+    if report is not None:
+        return report.to_dict()
+    outputs = checkpoint_store.load_node(job_id, "reporter")
+    if outputs is None:
+        raise HTTPException(status_code=404, detail=f"Relatório do job {job_id} não encontrado")
+    return {"job_id": job_id, "status": "done", **outputs}
+
+@app.get("/checkpoints")
+async def list_checkpoints():
+    """Jobs com checkpoint que não concluíram (interrompidos, com falha ou cancelados)"""
+    return {"jobs": checkpoint_store.interrupted()}
+
+def _submit(job_id: str, state: Dict[str, Any], resume: bool = False) -> Dict[str, Any]:
+    try:
+        job = job_manager.submit(job_id, state, resume=resume)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {
+        "job_id": job_id,
+        "status": job.status,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+    }
+
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, tempos, progresso por nó e estado (parcial enquanto executa)"""
+    return _get_job(job_id).to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancela o job (na fila: não executa; em execução: nenhum nó novo começa e as gerações param)"""
+    _get_job(job_id)
+    return job_manager.cancel(job_id).to_dict(include_state=False)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Progresso do job em Server-Sent Events.
+
+    Repete os eventos já emitidos e segue até o evento ``finished``: ``status``
+    (queued/running), ``node`` (estado e tempos de cada nó) e ``finished``.
+    Comentários de keep-alive a cada 15s sem eventos.
+    """
+    _get_job(job_id)
+
+    async def _events():
+        async for event in job_manager.subscribe(job_id, heartbeat_s=15.0):
+            if event["type"] == "heartbeat":
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event['type']}\nid: {event['seq']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Instância global do chatbot (criada no aquecimento ou sob demanda)
 _chatbot_agent: Optional[ChatbotAgent] = None
+_chatbot_lock = threading.Lock()
 
-async def get_chatbot_agent() -> ChatbotAgent:
-    """Obtém ou inicializa o agente chatbot"""
+def _ensure_chatbot_agent() -> ChatbotAgent:
     global _chatbot_agent
-    if _chatbot_agent is None:
-        # Inicializar componentes (em produção, usar injeção de dependência)
-        llm_engine = LLMEngine()
-        embedding_service = ONNXEmbedder(model_path="./models/nomic-embed-text.onnx/model.onnx")
-        vector_store = LocalFaiss(dim=768, index_dir="./data/indexes")
-        _chatbot_agent = ChatbotAgent(llm_engine, embedding_service, vector_store)
+    with _chatbot_lock:
+        if _chatbot_agent is None:
+            # Mesmos modelos e índice do graph (carregados uma vez pelo registro)
+            _chatbot_agent = ChatbotAgent(acquire_llm(), acquire_embedder(), acquire_vector_store())
 
-        # Iniciar monitoramento NPU
-        npu_monitor.start_monitoring()
+            # Iniciar monitoramento NPU
+            npu_monitor.start_monitoring()
 
     return _chatbot_agent
 
+async def get_chatbot_agent() -> ChatbotAgent:
+    """Obtém ou inicializa o agente chatbot"""
+    if _chatbot_agent is None:
+        # Carregamento bloqueante (ou à espera do aquecimento) fora do event loop
+        return await asyncio.to_thread(_ensure_chatbot_agent)
+    return _chatbot_agent
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_with_agent(message: ChatMessage = Body(...)):
+async def chat_with_agent(request: Request, message: ChatMessage = Body(...)):
     """
     Endpoint para conversação com o agente chatbot.
 
@@ -116,16 +403,183 @@ async def chat_with_agent(message: ChatMessage = Body(...)):
         # Verificar se é primeiro acesso
         first_access = getattr(message, 'first_access', False)
 
-        result = await agent.chat(
-            message=message.message,
-            user_context=message.user_context,
-            enable_web_search=message.enable_web_search,
-            first_access=first_access
+        # Gerar ID da conversa se não fornecido (só para a resposta: sem ID do
+        # cliente a conversa não tem histórico próprio nem sessão de KV)
+        conversation_id = message.conversation_id or new_job_id()
+
+        async with _request_cancellation(request, settings.llm_chat_timeout_seconds):
+            result = await agent.chat(
+                message=message.message,
+                user_context=message.user_context,
+                enable_web_search=message.enable_web_search,
+                first_access=first_access,
+                conversation_id=message.conversation_id
+            )
+
+        return ChatResponse(
+            response=result["response"],
+            conversation_id=conversation_id,
+            processing_time_seconds=result["processing_time_seconds"],
+            npu_metrics=result["npu_metrics"],
+            rag_context_used=result["rag_context_used"],
+            web_search_performed=result["web_search_performed"],
+            semantic_cache_hit=result.get("semantic_cache_hit", False),
+            truncated=result.get("truncated", False),
+            timestamp=result["timestamp"]
         )
 
-        # Gerar ID da conversa se não fornecido
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"LLM ocupado: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro no chatbot: {str(e)}")
+
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: Request, message: ChatMessage = Body(...)):
+    """
+    Versão em streaming (Server-Sent Events) do endpoint /chat.
+
+    Emite eventos ``token`` com cada trecho gerado pelo LLM e um evento final
+    ``done`` com os mesmos campos de ``ChatResponse``. Em caso de falha, emite
+    um evento ``error``. Sob o mesmo prazo do /chat: vencido o prazo, o
+    ``done`` sai com o texto parcial e ``truncated=True``.
+    """
+    agent = await get_chatbot_agent()
+
+    # Gerar ID da conversa se não fornecido (só para a resposta, como no /chat)
+    conversation_id = message.conversation_id or new_job_id()
+    first_access = getattr(message, 'first_access', False)
+
+    def _sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def _events():
+        start_time = asyncio.get_event_loop().time()
+        chunks: List[str] = []
+        finished = False
+        try:
+            async with _request_cancellation(request, settings.llm_chat_timeout_seconds) as token:
+                stream = agent.chat_stream(
+                    message=message.message,
+                    user_context=message.user_context,
+                    enable_web_search=message.enable_web_search,
+                    first_access=first_access,
+                    conversation_id=message.conversation_id
+                )
+                try:
+                    while True:
+                        # O prazo também vale fora da geração (RAG, busca web); a folga
+                        # deixa a geração interrompida fechar com o próprio ``done``
+                        remaining = token.remaining()
+                        timeout = None if remaining is None else remaining + STREAM_DEADLINE_GRACE_S
+                        try:
+                            event = await asyncio.wait_for(stream.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            token.cancel("deadline")
+                            break
+
+                        if event["type"] == "token":
+                            chunks.append(event["content"])
+                            yield _sse("token", {"content": event["content"]})
+                        elif event["type"] == "done":
+                            finished = True
+                            final = ChatResponse(
+                                response=event["response"],
+                                conversation_id=conversation_id,
+                                processing_time_seconds=event["processing_time_seconds"],
+                                npu_metrics=event["npu_metrics"],
+                                rag_context_used=event["rag_context_used"],
+                                web_search_performed=event["web_search_performed"],
+                                semantic_cache_hit=event.get("semantic_cache_hit", False),
+                                truncated=event.get("truncated", False) or token.is_set(),
+                                timestamp=event["timestamp"]
+                            )
+                            yield _sse("done", final.model_dump())
+                        else:
+                            finished = True
+                            yield _sse("error", {"detail": f"Erro no chatbot: {event.get('error', '')}",
+                                                 "conversation_id": conversation_id})
+                finally:
+                    await stream.aclose()
+
+                if not finished and token.is_set():
+                    # Prazo vencido (ou cliente saiu) antes do ``done``: fecha com o parcial
+                    final = ChatResponse(
+                        response="".join(chunks).strip(),
+                        conversation_id=conversation_id,
+                        processing_time_seconds=asyncio.get_event_loop().time() - start_time,
+                        npu_metrics={},
+                        rag_context_used=False,
+                        web_search_performed=False,
+                        truncated=True,
+                        timestamp=datetime.now().isoformat()
+                    )
+                    yield _sse("done", final.model_dump())
+        except Exception as e:
+            yield _sse("error", {"detail": f"Erro no chatbot: {str(e)}",
+                                 "conversation_id": conversation_id})
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Instância global do chatbot (criada no aquecimento ou sob demanda)
+_chatbot_agent: Optional[ChatbotAgent] = None
+_chatbot_lock = threading.Lock()
+
+def _ensure_chatbot_agent() -> ChatbotAgent:
+    global _chatbot_agent
+    with _chatbot_lock:
+        if _chatbot_agent is None:
+            # Mesmos modelos e índice do graph (carregados uma vez pelo registro)
+            _chatbot_agent = ChatbotAgent(acquire_llm(), acquire_embedder(), acquire_vector_store())
+
+            # Iniciar monitoramento NPU
+            npu_monitor.start_monitoring()
+
+    return _chatbot_agent
+
+async def get_chatbot_agent() -> ChatbotAgent:
+    """Obtém ou inicializa o agente chatbot"""
+    if _chatbot_agent is None:
+        # Carregamento bloqueante (ou à espera do aquecimento) fora do event loop
+        return await asyncio.to_thread(_ensure_chatbot_agent)
+    return _chatbot_agent
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_with_agent(request: Request, message: ChatMessage = Body(...)):
+    """
+    Endpoint para conversação com o agente chatbot.
+
+    - **message**: Mensagem do usuário
+    - **user_context**: Contexto do usuário (opcional)
+    - **enable_web_search**: Habilitar busca na internet (padrão: True)
+    - **conversation_id**: ID da conversa para continuidade (opcional)
+
+    Retorna resposta do chatbot com métricas de performance.
+    """
+    try:
+        agent = await get_chatbot_agent()
+
+        # Verificar se é primeiro acesso
+        first_access = getattr(message, 'first_access', False)
+
+        # Gerar ID da conversa se não fornecido (só para a resposta: sem ID do
+        # cliente a conversa não tem histórico próprio nem sessão de KV)
         conversation_id = message.conversation_id or new_job_id()
 
+        async with _request_cancellation(request, settings.llm_chat_timeout_seconds):
+            result = await agent.chat(
+                message=message.message,
+                user_context=message.user_context,
+                enable_web_search=message.enable_web_search,
+                first_access=first_access,
+                conversation_id=message.conversation_id
+            )
+
         return ChatResponse(
             response=result["response"],
             conversation_id=conversation_id,
@@ -133,12 +587,72 @@ async def chat_with_agent(message: ChatMessage = Body(...)):
             npu_metrics=result["npu_metrics"],
             rag_context_used=result["rag_context_used"],
             web_search_performed=result["web_search_performed"],
+            semantic_cache_hit=result.get("semantic_cache_hit", False),
+            truncated=result.get("truncated", False),
             timestamp=result["timestamp"]
         )
 
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"LLM ocupado: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro no chatbot: {str(e)}")
 
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: Request, message: ChatMessage = Body(...)):
+    """
+    Versão em streaming (Server-Sent Events) do endpoint /chat.
+
+    Emite eventos ``token`` com cada trecho gerado pelo LLM e um evento final
+    ``done`` com os mesmos campos de ``ChatResponse``. Em caso de falha, emite
+    um evento ``error``. Sob o mesmo prazo do /chat: vencido o prazo, o
+    ``done`` sai com o texto parcial e ``truncated=True``.
+    """
+    agent = await get_chatbot_agent()
+
+    # Gerar ID da conversa se não fornecido (só para a resposta, como no /chat)
+    conversation_id = message.conversation_id or new_job_id()
+    first_access = getattr(message, 'first_access', False)
+
+    def _sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def _events():
+        try:
+            async for event in agent.chat_stream(
+                message=message.message,
+                user_context=message.user_context,
+                enable_web_search=message.enable_web_search,
+                first_access=first_access,
+                conversation_id=message.conversation_id
+            ):
+                if event["type"] == "token":
+                    yield _sse("token", {"content": event["content"]})
+                elif event["type"] == "done":
+                    final = ChatResponse(
+                        response=event["response"],
+                        conversation_id=conversation_id,
+                        processing_time_seconds=event["processing_time_seconds"],
+                        npu_metrics=event["npu_metrics"],
+                        rag_context_used=event["rag_context_used"],
+                        web_search_performed=event["web_search_performed"],
+                        semantic_cache_hit=event.get("semantic_cache_hit", False),
+                        truncated=event.get("truncated", False),
+                        timestamp=event["timestamp"]
+                    )
+                    yield _sse("done", final.model_dump())
+                else:
+                    yield _sse("error", {"detail": f"Erro no chatbot: {event.get('error', '')}",
+                                         "conversation_id": conversation_id})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Erro no chatbot: {str(e)}",
+                                 "conversation_id": conversation_id})
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/chat/summary/{conversation_id}", response_model=ConversationSummary)
 async def get_conversation_summary(conversation_id: str):
     """
@@ -148,7 +662,7 @@ async def get_conversation_summary(conversation_id: str):
     """
     try:
         agent = await get_chatbot_agent()
-        summary = agent.get_conversation_summary()
+        summary = agent.get_conversation_summary(conversation_id)
 
         return ConversationSummary(
             conversation_id=conversation_id,
@@ -170,13 +684,34 @@ async def clear_conversation(conversation_id: str):
     """
     try:
         agent = await get_chatbot_agent()
-        agent.clear_conversation_history()
+        agent.clear_conversation_history(conversation_id)
 
         return {"status": "success", "message": f"Conversa {conversation_id} limpa com sucesso"}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao limpar conversa: {str(e)}")
 
+def _collect_llm_metrics() -> Dict[str, Any]:
+    """Estatísticas dos LLMEngines ativos (batching, caches, sessões)"""
+    metrics: Dict[str, Any] = {
+        "response_cache": response_cache.get_stats(),
+        "generation": generation_telemetry.get_stats(),
+        "length_predictor": length_predictor.get_stats(),
+        "models": model_registry.get_stats(),
+        "jobs": job_manager.get_stats(),
+        "checkpoints": checkpoint_store.get_stats(),
+        "deferred_reports": deferred_reports.get_stats(),
+    }
+    if _graph is not None and _graph.llm_engine is not None:
+        metrics["graph"] = _graph.llm_engine.get_stats()
+    if _graph is not None:
+        metrics["graph_nodes"] = _graph.get_runtime_stats()
+    if _chatbot_agent is not None:
+        metrics["chatbot"] = _chatbot_agent.llm.get_stats()
+        if _chatbot_agent.semantic_cache is not None:
+            metrics["semantic_cache"] = _chatbot_agent.semantic_cache.get_stats()
+    return metrics
+
 @app.get("/npu/metrics", response_model=NPUMetricsResponse)
 async def get_npu_metrics():
     """
@@ -192,7 +727,8 @@ async def get_npu_metrics():
             average_metrics_1min=report["average_metrics_1min"],
             performance_score=report["performance_score"],
             optimization_suggestions=report["optimization_suggestions"],
-            timestamp=report["timestamp"]
+            timestamp=datetime.fromtimestamp(report["timestamp"]).isoformat(),
+            llm_metrics=_collect_llm_metrics()
         )
 
     except Exception as e:
@@ -31,6 +31,13 @@ class Settings(BaseSettings):
             return []
         return [domain.strip() for domain in self.deny_domains_str.split(",") if domain.strip()]
 
+    @property
+    def llm_cascade_small_tasks(self) -> List[str]:
+        """Converte string separada por vírgula em lista."""
+        if not self.llm_cascade_small_tasks_str:
+            return []
+        return [task.strip() for task in self.llm_cascade_small_tasks_str.split(",") if task.strip()]
+
     data_dir: str = "./data"
     evidence_dir: str = "./data/evidence"
     index_dir: str = "./data/indexes"
@@ -38,6 +45,118 @@ class Settings(BaseSettings):
     llm_model_path: str = "./models/llama-3.2-3b-qnn"
     embed_model_path: str = "./models/nomic-embed-text.onnx"
 
+    # Registro de modelos: recurso sem uso por este tempo é descarregado (0 = nunca)
+    model_idle_unload_seconds: float = 1800.0
+
+    # Aquecimento na inicialização (geração curta + embedding antes do /ready)
+    warmup_enabled: bool = True
+    warmup_generation_tokens: int = 8
+
+    # Decodificação especulativa: modelo de rascunho da mesma família ("" = desativada)
+    llm_draft_model_path: str = ""
+    llm_draft_execution_provider: str = "follow_config"
+    llm_speculative_tokens: int = 4
+
+    # Cascata: modelo pequeno para tarefas fáceis ("" = tudo no modelo principal)
+    llm_small_model_path: str = ""
+    llm_cascade_small_tasks_str: str = "greeting,onboarding_question,short_summary"
+    llm_cascade_difficulty_threshold: float = 0.35
+    llm_cascade_min_confidence: float = 0.5
+
+    # Executor de inferência (threads dedicadas + fila limitada para chamadas async)
+    llm_executor_workers: int = 1
+    llm_executor_max_queue: int = 32
+    llm_executor_interactive_workers: int = 1
+
+    # Prioridades: gerações de prioridade menor pausam (no máximo este tempo
+    # seguido) enquanto houver geração interativa em andamento
+    llm_priority_max_pause_ms: float = 2000.0
+
+    # Batching de inferência (1 = desativado; modelos QNN costumam ter batch fixo em 1)
+    llm_max_batch_size: int = 1
+    llm_batch_window_ms: float = 10.0
+    # Lote de generate_many (prompts independentes de um mesmo job)
+    llm_generate_many_max_batch: int = 4
+
+    # Orçamento de tokens do prompt (PromptBuilder) e mínimo reservado à resposta
+    llm_prompt_budget_tokens: int = 1536
+    llm_min_new_tokens: int = 100
+
+    # Prazo das gerações por pedido HTTP (0 = sem prazo); desconexão sempre cancela
+    llm_chat_timeout_seconds: float = 120.0
+    llm_run_timeout_seconds: float = 600.0
+
+    # Fila de jobs do graph (POST /jobs): jobs simultâneos, fila além deles,
+    # retenção dos terminados e prazo de cada job (0 = sem prazo)
+    jobs_workers: int = 2
+    jobs_max_queue: int = 16
+    jobs_ttl_seconds: float = 3600.0
+    jobs_timeout_seconds: float = 1800.0
+
+    # Telemetria de geração (TTFT, TPOT, tokens/s): registros mantidos por chamador
+    llm_telemetry_window: int = 500
+
+    # Preditor de tamanho de resposta: com llm_length_predictor_min_samples
+    # gerações de um agente + template, o orçamento de resposta passa a ser o
+    # quantil dos tamanhos observados vezes a margem (limitado a min/max tokens)
+    llm_length_predictor_enabled: bool = True
+    llm_length_predictor_window: int = 200
+    llm_length_predictor_min_samples: int = 20
+    llm_length_predictor_quantile: float = 0.9
+    llm_length_predictor_margin: float = 1.25
+    llm_length_predictor_min_tokens: int = 16
+    llm_length_predictor_max_tokens: int = 512
+
+    # Cache de prefixo (KV pré-processado dos system prompts registrados)
+    llm_prefix_cache_enabled: bool = True
+    llm_prefix_cache_max_entries: int = 4
+    llm_prefix_cache_max_length: int = 2048
+
+    # Sessões por conversa (KV retido entre turnos do chat)
+    llm_sessions_enabled: bool = True
+    llm_session_max_sessions: int = 8
+    llm_session_ttl_seconds: float = 900.0
+    llm_session_max_length: int = 4096
+    llm_session_max_memory_mb: float = 2048.0
+
+    # Cache de respostas (correspondência exata, memória + SQLite em data_dir)
+    llm_response_cache_enabled: bool = True
+    llm_response_cache_memory_entries: int = 512
+    llm_response_cache_disk_entries: int = 10000
+    llm_response_cache_ttl_seconds: float = 86400.0
+
+    # Cache semântico do chatbot (perguntas parafraseadas -> resposta já gerada)
+    llm_semantic_cache_enabled: bool = True
+    llm_semantic_cache_threshold: float = 0.92
+    llm_semantic_cache_ttl_seconds: float = 3600.0
+    llm_semantic_cache_max_entries: int = 1000
+
+    # Classificação de rótulos: "logits" (score_choices, só prefill) ou
+    # "constrained" (generate_choice, geração restrita) por ponto de chamada
+    llm_choice_temperature: float = 1.0
+    llm_classifier_critic: str = "logits"
+    llm_classifier_intent: str = "logits"
+    llm_classifier_question_type: str = "logits"
+
+    # Critic do graph: "optimistic" (em paralelo com o agente; ações com efeito
+    # colateral esperam o veredito) ou "sequential" (agente só após o critic)
+    graph_critic_mode: str = "optimistic"
+    # Prazo por tentativa do Critic (0 = sem prazo) e novas tentativas
+    graph_critic_timeout_seconds: float = 30.0
+    graph_critic_retries: int = 1
+    # Reporter: "deferred" (resultado do agente volta na hora; resumo e
+    # evidências em segundo plano) ou "inline" (no fim do graph)
+    graph_reporter_mode: str = "deferred"
+    graph_reporter_concurrency: int = 1
+    graph_reporter_timeout_seconds: float = 300.0
+    graph_reporter_ttl_seconds: float = 3600.0
+
+    # Checkpoints do graph por nó (SQLite em data_dir) para retomar jobs:
+    # valores maiores que inline_bytes (JSON) são guardados por referência
+    graph_checkpoints_enabled: bool = True
+    graph_checkpoint_inline_bytes: int = 4096
+    graph_checkpoint_ttl_seconds: float = 604800.0
+
     mcp_ws_url: str = "ws://127.0.0.1:17872"
 
 settings = Settings()
@@ -14,11 +14,14 @@ class LocalFaiss:
         else:
             self.index = faiss.IndexFlatIP(dim)
         self.docs: List[str] = []
+        # Incrementada a cada alteração do corpus (invalida caches derivados)
+        self.version = 0
 
     def add(self, vectors: np.ndarray, texts: List[str]):
         faiss.normalize_L2(vectors)
         self.index.add(vectors)
         self.docs.extend(texts)
+        self.version += 1
         faiss.write_index(self.index, self.index_path)
 
     def search(self, query_vec: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_genai  # noqa: E402
+from agentic_backend.settings import settings  # noqa: E402
+from agentic_backend.llm import engine as engine_module, scheduler, speculative  # noqa: E402
+from agentic_backend.llm.length_predictor import length_predictor  # noqa: E402
+
+
+@pytest.fixture
+def fake_runtime(monkeypatch):
+    """Troca o onnxruntime-genai pelo runtime determinístico de ``fake_genai``"""
+    monkeypatch.setattr(engine_module, "og", fake_genai)
+    monkeypatch.setattr(engine_module, "_HAS_GENAI", True)
+    monkeypatch.setattr(speculative, "og", fake_genai)
+    monkeypatch.setattr(scheduler, "og", fake_genai)
+    monkeypatch.setattr(fake_genai.Generator, "full_logits", True)
+    monkeypatch.setattr(length_predictor, "enabled", False)
+    # Só o caminho normal e o especulativo: sem cache, lote, sessão ou prefixo
+    for name, value in {
+        "llm_prefix_cache_enabled": False,
+        "llm_sessions_enabled": False,
+        "llm_response_cache_enabled": False,
+        "llm_max_batch_size": 1,
+        "llm_generate_many_max_batch": 1,
+        "llm_speculative_tokens": 3,
+        "llm_draft_model_path": "",
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    return fake_genai
+
+
+@pytest.fixture
+def make_engine(fake_runtime, tmp_path):
+    """``make_engine(draft=True)`` -> LLMEngine sobre o runtime falso (fechado no fim do teste)"""
+    engines = []
+
+    def _make(draft: bool = False):
+        model_path = fake_genai.write_model(tmp_path / "model")
+        draft_path = fake_genai.write_model(tmp_path / "model-draft") if draft else ""
+        engine = engine_module.LLMEngine(model_path, execution_provider="cpu", draft_model_path=draft_path)
+        engines.append(engine)
+        return engine
+
+    yield _make
+    for engine in engines:
+        engine.close()
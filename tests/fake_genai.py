@@ -0,0 +1,156 @@
+"""
+Runtime ``onnxruntime_genai`` determinístico para os testes (sem modelo).
+
+O "modelo" prevê o próximo token por uma regra sobre a sequência inteira, então
+qualquer erro de contabilidade no KV (``rewind_to``, tokens pendentes, linhas
+do lote) muda a saída. Um diretório terminado em ``draft`` vira o modelo de rascunho, que
+discorda do principal em parte das posições (força rejeições e rewinds).
+"""
+from __future__ import annotations
+import json
+from typing import List
+
+import numpy as np
+
+VOCAB = 64
+EOS = 0
+
+
+def next_token(seq: List[int], draft: bool = False) -> int:
+    """Token mais provável depois de ``seq`` (o padding com EOS não conta, como com máscara de atenção)"""
+    context = [t for t in seq if t != EOS]
+    last = context[-1] if context else 0
+    token = (sum(context) * 7 + last * 3 + len(context)) % (VOCAB - 1) + 1
+    if draft and len(context) % 3 == 0:
+        token = alternative(token)
+    return token
+
+
+def alternative(token: int) -> int:
+    """Segundo token mais provável (dá massa à amostragem)"""
+    return (token + 5) % (VOCAB - 1) + 1
+
+
+def logits_for(seq: List[int], draft: bool = False) -> np.ndarray:
+    token = next_token(seq, draft)
+    row = np.full(VOCAB, -4.0, dtype=np.float32)
+    row[token] = 4.0
+    row[alternative(token)] = 2.0
+    return row
+
+
+class Config:
+    def __init__(self, path: str):
+        self.path = path
+
+    def clear_providers(self):
+        pass
+
+    def append_provider(self, provider: str):
+        pass
+
+
+class Model:
+    def __init__(self, config: Config):
+        self.type = "llama"
+        self.device_type = "cpu"
+        self.draft = config.path.rstrip("/").endswith("draft")
+        self.generators: List["Generator"] = []
+
+
+class GeneratorParams:
+    def __init__(self, model: Model):
+        self.options = {}
+
+    def set_search_options(self, **options):
+        self.options.update(options)
+
+
+class Generator:
+    # False simula runtimes que só expõem os logits da última posição
+    full_logits = True
+
+    def __init__(self, model: Model, params: GeneratorParams):
+        self.model = model
+        self.max_length = params.options.get("max_length", 512)
+        self.batch_size = params.options.get("batch_size", 1)
+        self.seqs: List[List[int]] = [[] for _ in range(self.batch_size)]
+        self.rows = np.zeros((self.batch_size, 0, VOCAB), dtype=np.float32)
+        self.forwards = 0
+        # Linhas x passos de decodificação (custo de uma onda em lote)
+        self.row_steps = 0
+        model.generators.append(self)
+
+    @property
+    def seq(self) -> List[int]:
+        return self.seqs[0]
+
+    def append_tokens(self, tokens):
+        tokens = np.asarray(tokens).reshape(self.batch_size, -1)
+        rows = []
+        for seq, row_tokens in zip(self.seqs, tokens):
+            row = []
+            for token in row_tokens:
+                seq.append(int(token))
+                row.append(logits_for(seq, self.model.draft))
+            rows.append(row)
+        self.rows = np.array(rows, dtype=np.float32)
+        self.forwards += 1
+
+    def generate_next_token(self):
+        self.append_tokens([[int(np.argmax(rows[-1]))] for rows in self.rows])
+        self.row_steps += self.batch_size
+
+    def get_next_tokens(self):
+        return np.array([seq[-1] for seq in self.seqs], dtype=np.int32)
+
+    def is_done(self) -> bool:
+        return bool(self.seq) and (
+            all(seq[-1] == EOS for seq in self.seqs) or len(self.seq) >= self.max_length
+        )
+
+    def get_sequence(self, index: int):
+        return np.array(self.seqs[index], dtype=np.int32)
+
+    def get_logits(self):
+        return self.rows[:, -1:]
+
+    def get_output(self, name: str):
+        return self.rows if self.full_logits else self.rows[:, -1:]
+
+    def rewind_to(self, length: int):
+        for seq in self.seqs:
+            del seq[length:]
+        self.rows = np.array([[logits_for(seq, self.model.draft)] for seq in self.seqs], dtype=np.float32)
+
+
+class TokenizerStream:
+    def decode(self, token) -> str:
+        return "" if int(token) == EOS else chr(ord("0") + int(token))
+
+
+class Tokenizer:
+    def __init__(self, model: Model):
+        pass
+
+    def encode(self, text: str):
+        return np.array([ord(c) % (VOCAB - 1) + 1 for c in text], dtype=np.int32)
+
+    def decode(self, tokens) -> str:
+        return "".join(TokenizerStream().decode(t) for t in tokens)
+
+    def create_stream(self) -> TokenizerStream:
+        return TokenizerStream()
+
+    def apply_chat_template(self, messages: str, add_generation_prompt: bool = True) -> str:
+        text = "".join(f"<{m['role']}>{m['content']}" for m in json.loads(messages))
+        return text + ("<assistant>" if add_generation_prompt else "")
+
+
+def write_model(path, eos_token_id: int = EOS) -> str:
+    """Diretório de modelo com o ``genai_config.json`` que o engine lê"""
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "genai_config.json").write_text(json.dumps({
+        "model": {"eos_token_id": [eos_token_id], "pad_token_id": EOS}
+    }))
+    return str(path)
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from agentic_backend import server
+from agentic_backend.settings import settings
+
+
+class StalledAgent:
+    """Emite um trecho e trava antes do ``done``"""
+
+    async def chat_stream(self, **kwargs):
+        yield {"type": "token", "content": "olá "}
+        await asyncio.sleep(30)
+        yield {"type": "token", "content": "nunca"}
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_stalled_stream_closes_with_truncated_done(monkeypatch):
+    async def _agent():
+        return StalledAgent()
+
+    monkeypatch.setattr(server, "get_chatbot_agent", _agent)
+    monkeypatch.setattr(server, "STREAM_DEADLINE_GRACE_S", 0.05)
+    monkeypatch.setattr(settings, "llm_chat_timeout_seconds", 0.2)
+
+    response = TestClient(server.app).post("/chat/stream", json={"message": "oi"})
+    events = _events(response.text)
+
+    assert [name for name, _ in events] == ["token", "done"]
+    done = events[-1][1]
+    assert done["truncated"] is True and done["response"] == "olá"
+    assert done["processing_time_seconds"] < 5
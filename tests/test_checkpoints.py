@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from agentic_backend.graph.checkpoints import CheckpointStore, RUNNING, SUCCEEDED, FAILED
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints" / "graph.sqlite3"), inline_bytes=64)
+
+
+def test_load_rebuilds_initial_state_and_node_outputs(store):
+    store.begin("job", {"query": "saldo", "history": []})
+    store.save_node("job", "router", {"route": "researcher"})
+    store.save_node("job", "researcher", {"findings": ["a", "b"]})
+
+    state, completed = store.load("job")
+
+    assert state == {"query": "saldo", "history": []}
+    assert completed == {"router": {"route": "researcher"}, "researcher": {"findings": ["a", "b"]}}
+    assert list(completed) == ["router", "researcher"]
+
+
+def test_large_values_are_stored_once_by_reference(store):
+    findings = ["x" * 100 for _ in range(3)]
+    store.begin("job", {"query": "q"})
+    store.save_node("job", "researcher", {"findings": findings})
+    store.save_node("job", "analyst", {"findings": findings, "summary": "ok"})
+
+    stats = store.get_stats()
+    assert stats["blobs"] == 1
+    assert store.load_node("job", "analyst") == {"findings": findings, "summary": "ok"}
+
+
+def test_begin_discards_previous_checkpoints_of_the_job(store):
+    store.begin("job", {"query": "antiga"})
+    store.save_node("job", "router", {"route": "x"})
+    store.begin("job", {"query": "nova"})
+
+    assert store.load("job") == ({"query": "nova"}, {})
+
+
+def test_status_and_interrupted_runs(store):
+    store.begin("ok", {"query": "a"})
+    store.finish("ok", SUCCEEDED)
+    store.begin("crashed", {"query": "b"})
+    store.save_node("crashed", "router", {"route": "x"})
+    store.begin("failed", {"query": "c"})
+    store.finish("failed", FAILED, "reporter: boom")
+
+    assert store.get("ok")["status"] == SUCCEEDED
+    interrupted = {run["job_id"]: run for run in store.interrupted()}
+    assert set(interrupted) == {"crashed", "failed"}
+    assert interrupted["crashed"]["status"] == RUNNING
+    assert interrupted["crashed"]["completed_nodes"] == ["router"]
+    assert interrupted["failed"]["error"] == "reporter: boom"
+
+
+def test_finished_runs_expire_after_ttl(tmp_path):
+    store = CheckpointStore(str(tmp_path / "graph.sqlite3"), ttl_seconds=0.01)
+    store.begin("done", {"query": "a"})
+    store.finish("done", SUCCEEDED)
+    store.begin("running", {"query": "b"})
+    time.sleep(0.05)
+    store.begin("new", {"query": "c"})
+
+    assert store.get("done") is None
+    assert store.get("running") is not None
+
+
+def test_non_json_values_are_stored_as_text(store):
+    store.begin("job", {"error": ValueError("boom")})
+    state, _ = store.load("job")
+    assert state["error"] == "boom"
+
+
+def test_disabled_store_records_nothing(tmp_path):
+    store = CheckpointStore(str(tmp_path / "graph.sqlite3"), enabled=False)
+    store.begin("job", {"query": "q"})
+    store.save_node("job", "router", {"route": "x"})
+
+    assert store.load("job") is None
+    assert store.interrupted() == []
+    assert not (tmp_path / "graph.sqlite3").exists()
@@ -0,0 +1,27 @@
+import time
+
+import pytest
+
+from agentic_backend import npu_monitor as monitor_module
+from agentic_backend.npu_monitor import NPUMetrics, NPUMonitor
+
+
+def metrics(inference_time_ms):
+    return NPUMetrics(utilization_percent=40.0, memory_used_mb=100.0, temperature_celsius=40.0,
+                      power_consumption_watts=2.0, inference_time_ms=inference_time_ms, timestamp=time.time())
+
+
+def test_without_generations_response_time_is_left_out(monkeypatch):
+    monkeypatch.setattr(monitor_module.generation_telemetry, "recent_tpot_ms", lambda window: None)
+    monitor = NPUMonitor()
+
+    assert monitor.get_average_metrics()["avg_inference_time_ms"] is None
+    # Média só de utilização (50) e eficiência energética (80), sem um 100 de tempo de resposta
+    assert monitor._calculate_performance_score(metrics(None), {}) == pytest.approx(65.0)
+    assert "Tempo de inferência alto" not in " ".join(monitor._get_optimization_suggestions(metrics(None), {}))
+
+
+def test_measured_response_time_enters_the_score():
+    monitor = NPUMonitor()
+
+    assert monitor._calculate_performance_score(metrics(90.0), {}) == pytest.approx((50 + 80 + 50) / 3)
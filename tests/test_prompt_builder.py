@@ -0,0 +1,125 @@
+import pytest
+
+from agentic_backend.llm.prompt_builder import (
+    PromptBuilder, PromptBudgetExceeded, MIN_TRUNCATED_TOKENS,
+    PRIORITY_QUESTION, PRIORITY_RAG, PRIORITY_HISTORY,
+)
+
+
+class WordEngine:
+    """Tokenizer de palavras: um token por palavra"""
+
+    def __init__(self, system_tokens: int = 0):
+        self.system_tokens = system_tokens
+
+    def prompt_overhead_tokens(self, system_prompt=None) -> int:
+        return self.system_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+    def truncate_tokens(self, text: str, max_tokens: int, from_end: bool = False) -> str:
+        if max_tokens <= 0:
+            return ""
+        words = text.split()
+        return " ".join(words[-max_tokens:] if from_end else words[:max_tokens])
+
+
+def words(n: int, tag: str = "w") -> str:
+    return " ".join(f"{tag}{i}" for i in range(n))
+
+
+def test_everything_fits():
+    packed = (PromptBuilder(WordEngine(system_tokens=5), budget_tokens=100)
+              .add("question", ["qual o saldo"], PRIORITY_QUESTION, template="{}\n", required=True)
+              .add("rag", ["doc um", "doc dois"], PRIORITY_RAG, template="{}\n")
+              .build())
+
+    assert packed.complete
+    assert packed.text == "qual o saldo\ndoc um\ndoc dois\n"
+    assert packed.tokens == 5 + 7
+    assert packed.sections == {"question": 3, "rag": 4}
+
+
+def test_lower_priority_sections_are_dropped_first():
+    packed = (PromptBuilder(WordEngine(), budget_tokens=30)
+              .add("rag", [words(10, "r"), words(10, "s")], PRIORITY_RAG)
+              .add("history", [words(10, "h")], PRIORITY_HISTORY)
+              .add("question", [words(5, "q")], PRIORITY_QUESTION, required=True)
+              .build())
+
+    assert packed.dropped == {"history": 1}
+    assert "h0" not in packed.text
+    # A ordem do texto é a de inserção, não a de prioridade
+    assert packed.text.index("r0") < packed.text.index("q0")
+
+
+def test_item_that_does_not_fit_is_truncated_at_token_boundary():
+    packed = (PromptBuilder(WordEngine(), budget_tokens=40)
+              .add("rag", [words(10, "a"), words(50, "b")], PRIORITY_RAG)
+              .build())
+
+    assert packed.truncated == {"rag": 1}
+    assert packed.tokens <= 40
+    assert "b29" in packed.text and "b30" not in packed.text
+
+
+def test_items_report_what_entered_each_section():
+    history = [words(10, f"m{i}_") for i in range(3)]
+    packed = (PromptBuilder(WordEngine(), budget_tokens=40)
+              .add("rag", [words(10, "a"), words(50, "b"), words(5, "c")], PRIORITY_RAG)
+              .add("history", history, PRIORITY_HISTORY, keep="tail")
+              .build())
+
+    # O item truncado entra cortado, como foi para o texto; o descartado fica de fora
+    assert packed.items["rag"] == [words(10, "a"), words(30, "b")]
+    assert "history" not in packed.items
+    assert "".join(packed.items["rag"]) == packed.text
+
+
+def test_small_remainders_are_dropped_instead_of_truncated():
+    packed = (PromptBuilder(WordEngine(), budget_tokens=20 + MIN_TRUNCATED_TOKENS - 1)
+              .add("rag", [words(20, "a"), words(50, "b")], PRIORITY_RAG)
+              .build())
+
+    assert packed.dropped == {"rag": 1}
+    assert not packed.truncated
+
+
+def test_tail_sections_keep_the_most_recent_items():
+    history = [words(10, f"m{i}_") for i in range(5)]
+    packed = (PromptBuilder(WordEngine(), budget_tokens=20)
+              .add("history", history, PRIORITY_HISTORY, keep="tail")
+              .build())
+
+    assert "m3_0" in packed.text and "m4_0" in packed.text
+    assert "m2_0" not in packed.text
+    assert packed.text.index("m3_0") < packed.text.index("m4_0")
+
+
+def test_required_section_keeps_room_reserved_from_higher_priorities():
+    # RAG tem prioridade sobre a pergunta, mas não pode ocupar o mínimo dela
+    packed = (PromptBuilder(WordEngine(), budget_tokens=60)
+              .add("rag", [words(100, "r")], PRIORITY_QUESTION)
+              .add("question", [words(40, "q")], PRIORITY_RAG, required=True)
+              .build())
+
+    assert "q0" in packed.text
+    assert packed.tokens <= 60
+
+
+def test_header_only_enters_with_items():
+    packed = (PromptBuilder(WordEngine(), budget_tokens=10)
+              .add("question", ["oi"], PRIORITY_QUESTION, required=True)
+              .add("rag", [words(30)], PRIORITY_RAG, header="Contexto:\n", footer="\n")
+              .build())
+
+    assert "Contexto" not in packed.text
+    assert packed.dropped == {"rag": 1}
+
+
+def test_required_sections_that_cannot_fit_raise():
+    builder = (PromptBuilder(WordEngine(system_tokens=50), budget_tokens=55)
+               .add("question", [words(40)], PRIORITY_QUESTION, required=True))
+    with pytest.raises(PromptBudgetExceeded):
+        builder.build()
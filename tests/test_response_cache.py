@@ -0,0 +1,40 @@
+import pytest
+
+from agentic_backend.llm import engine as engine_module
+from agentic_backend.llm.cancellation import GenerationResult
+from agentic_backend.llm.response_cache import ResponseCache
+from agentic_backend.settings import settings
+
+PROMPT = "Qual é a capital do Brasil?"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(engine_module, "response_cache", cache)
+    monkeypatch.setattr(settings, "llm_response_cache_enabled", True)
+    return cache
+
+
+def test_put_get_and_disk_persistence(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    key = ResponseCache.make_key("model", "  Oi  ", "sys", {"max_length": 10, "batch_size": 4})
+
+    cache.put(key, "olá")
+    assert cache.get(key) == "olá"
+    # Espaços nas pontas e batch_size não mudam a chave
+    assert key == ResponseCache.make_key("model", "Oi", "sys", {"max_length": 10, "batch_size": 1})
+    assert ResponseCache(str(tmp_path / "responses.sqlite3")).get(key) == "olá"
+
+
+@pytest.mark.parametrize("from_disk", [False, True])
+def test_cache_hit_returns_generation_result(make_engine, cache, from_disk):
+    engine = make_engine()
+    generated = engine.generate_text(PROMPT, do_sample=False, max_new_tokens=8, cache=True)
+    if from_disk:
+        cache._memory.clear()
+
+    hit = engine.generate_text(PROMPT, do_sample=False, max_new_tokens=8, cache=True)
+
+    assert isinstance(hit, GenerationResult)
+    assert hit == generated and not hit.truncated
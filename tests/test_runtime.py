@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+
+from agentic_backend.graph.action_gate import gated
+from agentic_backend.graph.runtime import GraphRuntime, Node, NodeFailed
+
+
+def run(runtime: GraphRuntime, state=None, **kwargs):
+    return asyncio.run(runtime.run(state if state is not None else {}, **kwargs))
+
+
+def output(key, value, delay=0.0, log=None, name=None):
+    """Nó que espera ``delay`` e escreve ``key``"""
+    async def _func(state):
+        if log is not None:
+            log.append(("start", name or key))
+        await asyncio.sleep(delay)
+        if log is not None:
+            log.append(("end", name or key))
+        return {key: value}
+    return _func
+
+
+def test_dependencies_come_from_inputs_and_after():
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", output("x", 1), outputs=("x",)))
+    runtime.add_node(Node("b", output("y", 2), inputs=("x",), outputs=("y",)))
+    runtime.add_node(Node("c", output("z", 3), after=("a",), outputs=("z",)))
+
+    assert runtime.dependencies() == {"a": set(), "b": {"a"}, "c": {"a"}}
+
+
+def test_invalid_graphs_are_rejected():
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", output("x", 1), inputs=("y",), outputs=("x",)))
+    runtime.add_node(Node("b", output("y", 2), inputs=("x",), outputs=("y",)))
+    with pytest.raises(ValueError, match="Ciclo"):
+        runtime.dependencies()
+
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", output("x", 1), after=("missing",)))
+    with pytest.raises(ValueError, match="inexistentes"):
+        runtime.dependencies()
+
+    with pytest.raises(ValueError, match="duplicado"):
+        runtime.add_node(Node("a", output("x", 1)))
+
+
+def test_independent_nodes_run_concurrently_and_merge_only_outputs():
+    log = []
+    runtime = GraphRuntime()
+
+    async def noisy(state):
+        await asyncio.sleep(0.05)
+        return {"left": "L", "undeclared": "ignorado"}
+
+    runtime.add_node(Node("left", noisy, outputs=("left",)))
+    runtime.add_node(Node("right", output("right", "R", 0.05, log), outputs=("right",)))
+    runtime.add_node(Node("join", output("joined", True, log=log), inputs=("left", "right"), outputs=("joined",)))
+
+    state = run(runtime, {"query": "q"})
+
+    assert state["left"] == "L" and state["right"] == "R" and state["joined"] is True
+    assert "undeclared" not in state
+    assert state["node_timings"]["right"]["start_offset_seconds"] < 0.05
+    assert log.index(("start", "joined")) > log.index(("end", "right"))
+
+
+def test_when_false_skips_the_node():
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", output("x", 1), outputs=("x",), when=lambda state: False))
+    runtime.add_node(Node("b", output("y", 2), after=("a",), outputs=("y",)))
+
+    state = run(runtime)
+
+    assert "x" not in state and state["y"] == 2
+    assert state["node_timings"]["a"]["status"] == "skipped"
+
+
+def test_retries_then_required_failure_raises():
+    attempts = []
+
+    async def flaky(state):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("instável")
+        return {"x": len(attempts)}
+
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", flaky, outputs=("x",), retries=2, retry_backoff_s=0))
+    assert run(runtime)["x"] == 3
+
+    async def broken(state):
+        raise RuntimeError("quebrado")
+
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", broken, outputs=("x",), retries=1, retry_backoff_s=0))
+    with pytest.raises(NodeFailed) as failure:
+        run(runtime)
+    assert failure.value.node == "a"
+
+
+def test_optional_failure_and_timeout_do_not_stop_the_graph():
+    async def broken(state):
+        raise RuntimeError("quebrado")
+
+    runtime = GraphRuntime()
+    runtime.add_node(Node("slow", output("x", 1, delay=1), outputs=("x",), timeout_s=0.05, required=False))
+    runtime.add_node(Node("broken", broken, outputs=("y",), required=False))
+    runtime.add_node(Node("last", output("z", 3), after=("slow", "broken"), outputs=("z",)))
+
+    state = run(runtime)
+
+    assert state["z"] == 3
+    assert state["node_timings"]["slow"]["status"] == "failed"
+    assert "prazo" in state["node_timings"]["slow"]["error"]
+    assert runtime.get_stats()["nodes"]["slow"]["timeouts"] == 1
+
+
+def _guarded_graph(verdict, optimistic=True, effects=None):
+    runtime = GraphRuntime(optimistic=optimistic)
+
+    async def critic(state):
+        await asyncio.sleep(0.05)
+        return {"warnings": [] if verdict is None else [verdict]}
+
+    async def agent(state):
+        await gated("open_tab")
+        effects.append("open_tab")
+        return {"result": "feito"}
+
+    runtime.add_node(Node("critic", critic, outputs=("warnings",),
+                          verdict=lambda state: state["warnings"][0] if state["warnings"] else None))
+    runtime.add_node(Node("agent", agent, outputs=("result",), guarded_by="critic"))
+    return runtime
+
+
+@pytest.mark.parametrize("optimistic", [True, False])
+def test_approved_guard_releases_held_actions(optimistic):
+    effects = []
+    events = []
+    state = run(_guarded_graph(None, optimistic, effects), on_event=events.append)
+
+    assert state["result"] == "feito" and effects == ["open_tab"]
+    statuses = [(e["node"], e["status"]) for e in events]
+    assert ("agent", "done") in statuses
+    if optimistic:
+        assert state["node_timings"]["agent"]["start_offset_seconds"] < 0.05
+
+
+@pytest.mark.parametrize("optimistic", [True, False])
+def test_rejected_guard_blocks_the_guarded_node(optimistic):
+    effects = []
+    state = run(_guarded_graph("injection", optimistic, effects))
+
+    assert "result" not in state and effects == []
+    assert state["node_timings"]["agent"]["status"] == "blocked"
+
+
+def test_resume_skips_completed_nodes_and_commits_new_outputs():
+    calls = []
+
+    def tracked(key, value):
+        async def _func(state):
+            calls.append(key)
+            return {key: value}
+        return _func
+
+    runtime = GraphRuntime()
+    runtime.add_node(Node("a", tracked("x", 1), outputs=("x",)))
+    runtime.add_node(Node("b", tracked("y", 2), inputs=("x",), outputs=("y",)))
+    commits = []
+
+    state = run(runtime, {}, completed={"a": {"x": 10, "extra": "ignorado"}},
+                on_commit=lambda node, outputs: commits.append((node, outputs)))
+
+    assert calls == ["y"]
+    assert state["x"] == 10 and state["y"] == 2 and "extra" not in state
+    assert commits == [("b", {"y": 2})]
+    assert state["node_timings"]["a"]["restored"] is True
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from agentic_backend.llm.cancellation import CancellationToken
+from agentic_backend.llm.scheduler import BatchScheduler
+
+PROMPTS = ["Qual é a capital do Brasil?", "Moeda do Japão?"]
+GREEDY = {"do_sample": False}
+
+
+@pytest.fixture
+def engine(make_engine):
+    return make_engine()
+
+
+def _plain(engine, prompt, max_new_tokens):
+    return engine.generate_text(prompt, max_new_tokens=max_new_tokens, **GREEDY)
+
+
+def test_batch_matches_sequential_generation(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=2, batch_window_ms=0)
+    results = scheduler.run_batch([(prompt, {"max_new_tokens": 12, **GREEDY}) for prompt in PROMPTS])
+
+    assert results == [_plain(engine, prompt, 12) for prompt in PROMPTS]
+    assert not any(result.truncated for result in results)
+
+
+def test_finished_rows_shrink_the_wave(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=2, batch_window_ms=0)
+    before = len(engine._model.generators)
+    results = scheduler.run_batch([
+        (PROMPTS[0], {"max_new_tokens": 2, **GREEDY}),
+        (PROMPTS[1], {"max_new_tokens": 30, **GREEDY}),
+    ])
+
+    # A linha terminada deixou de ser decodificada junto com a outra
+    row_steps = sum(g.row_steps for g in engine._model.generators[before:])
+    assert row_steps == 2 * 2 + 28
+    assert scheduler.get_stats()["shrinks"] == 1
+    assert results == [_plain(engine, PROMPTS[0], 2), _plain(engine, PROMPTS[1], 30)]
+
+
+def test_cancelled_before_the_wave_is_not_prefilled(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=2, batch_window_ms=0)
+    token = CancellationToken()
+    token.cancel("client_disconnected")
+    before = len(engine._model.generators)
+
+    results = scheduler.run_batch([(PROMPTS[0], {"max_new_tokens": 8, **GREEDY})], stop_event=token)
+
+    assert results == [""]
+    assert results[0].truncated and results[0].finish_reason == "client_disconnected"
+    assert len(engine._model.generators) == before
+
+
+def test_cancelled_row_stops_and_reports_truncation(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=2, batch_window_ms=0)
+    token = CancellationToken()
+    chunks = []
+
+    def _on_chunk(chunk):
+        chunks.append(chunk)
+        if len(chunks) == 3:
+            token.cancel("deadline")
+
+    scheduler.start()
+    try:
+        cancelled = scheduler.submit(PROMPTS[0], on_chunk=_on_chunk, stop_event=token,
+                                     max_new_tokens=40, **GREEDY)
+        full = scheduler.submit(PROMPTS[1], max_new_tokens=10, **GREEDY)
+        cancelled_result, full_result = cancelled.result(timeout=5), full.result(timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert cancelled_result.finish_reason == "deadline"
+    assert cancelled_result == "".join(chunks) and len(chunks) == 3
+    assert full_result == _plain(engine, PROMPTS[1], 10) and not full_result.truncated
+
+
+def test_queued_cancelled_sequence_never_enters_a_wave(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=2, batch_window_ms=0)
+    stop = threading.Event()
+    stop.set()
+    before = len(engine._model.generators)
+
+    scheduler.start()
+    try:
+        result = scheduler.submit(PROMPTS[0], stop_event=stop, max_new_tokens=8, **GREEDY).result(timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert result == "" and result.finish_reason == "cancelled"
+    assert len(engine._model.generators) == before
+    assert scheduler.get_stats()["waves"] == 0
+
+
+def test_engine_keeps_scheduler_finish_reason(engine):
+    scheduler = BatchScheduler(engine, max_batch_size=2, batch_window_ms=0)
+    stop = threading.Event()
+    stop.set()
+    [text] = scheduler.run_batch([(PROMPTS[0], {"max_new_tokens": 8, **GREEDY})], stop_event=stop)
+
+    assert engine._finish(text, None).truncated
@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+
+import fake_genai
+from agentic_backend.llm.speculative import SpeculativeDecoder, SpeculativeUnavailable, _distribution
+
+GREEDY = {"do_sample": False, "batch_size": 1}
+PROMPT = [5, 9, 13, 2]
+
+
+def _decoder(tmp_path, num_tokens=3, eos=(fake_genai.EOS,), seed=0):
+    decoder = SpeculativeDecoder(str(tmp_path / "model-draft"), num_tokens=num_tokens, eos_token_ids=eos)
+    decoder._rng = np.random.default_rng(seed)
+    return decoder
+
+
+def _target():
+    return fake_genai.Model(fake_genai.Config("model"))
+
+
+def _plain_greedy(prompt, max_new_tokens):
+    """Referência: decodificação token a token no modelo principal"""
+    seq = list(prompt)
+    out = []
+    for _ in range(max_new_tokens):
+        token = fake_genai.next_token(seq)
+        out.append(token)
+        if token == fake_genai.EOS:
+            break
+        seq.append(token)
+    return out
+
+
+class TestDistribution:
+    def test_greedy_is_one_hot_on_argmax(self):
+        logits = np.array([0.1, 2.0, 1.5, -1.0])
+        assert _distribution(logits, GREEDY).tolist() == [0.0, 1.0, 0.0, 0.0]
+
+    def test_top_k_keeps_k_tokens(self):
+        logits = np.array([3.0, 2.0, 1.0, 0.0])
+        p = _distribution(logits, {"do_sample": True, "temperature": 1.0, "top_k": 2})
+        assert np.count_nonzero(p) == 2 and p[0] > p[1] > 0
+        assert p.sum() == pytest.approx(1.0)
+
+    def test_top_p_keeps_smallest_nucleus(self):
+        logits = np.log(np.array([0.5, 0.3, 0.15, 0.05]))
+        p = _distribution(logits, {"do_sample": True, "temperature": 1.0, "top_p": 0.7})
+        assert p[2] == p[3] == 0.0
+        assert p[:2] == pytest.approx([0.5 / 0.8, 0.3 / 0.8])
+
+
+class TestAcceptRule:
+    def test_accepts_when_target_is_at_least_as_likely(self, fake_runtime, tmp_path):
+        decoder = _decoder(tmp_path)
+        assert all(decoder.accept(0.4, 0.4) for _ in range(100))
+        assert all(decoder.accept(0.9, 0.1) for _ in range(100))
+
+    def test_rejects_tokens_the_draft_could_not_propose(self, fake_runtime, tmp_path):
+        assert not _decoder(tmp_path).accept(0.5, 0.0)
+
+    def test_accepts_with_probability_p_over_q(self, fake_runtime, tmp_path):
+        decoder = _decoder(tmp_path)
+        rate = np.mean([decoder.accept(0.2, 0.8) for _ in range(20000)])
+        assert rate == pytest.approx(0.25, abs=0.02)
+
+
+class TestSpeculativeRun:
+    def test_greedy_matches_plain_decoding(self, fake_runtime, tmp_path):
+        decoder = _decoder(tmp_path)
+        run = decoder.start(_target(), PROMPT, {**GREEDY, "max_length": len(PROMPT) + 40})
+
+        out = list(run.tokens(40, lambda: False))
+
+        assert out == _plain_greedy(PROMPT, 40)
+        stats = decoder.get_stats()
+        # O rascunho discorda em parte das posições: houve rejeição (e rewind)
+        assert 0 < stats["accepted"] < stats["drafted"]
+        assert stats["tokens_per_target_forward"] > 1
+
+    def test_rewind_keeps_target_kv_in_sync(self, fake_runtime, tmp_path):
+        decoder = _decoder(tmp_path)
+        target = _target()
+        run = decoder.start(target, PROMPT, {**GREEDY, "max_length": len(PROMPT) + 25})
+
+        out = list(run.tokens(25, lambda: False))
+
+        # Nada descartado ficou no KV; só o último token emitido pode ainda estar fora dele
+        seq = target.generators[0].seq
+        assert seq == (PROMPT + out)[:len(seq)]
+        assert len(seq) >= len(PROMPT) + len(out) - 1
+
+    def test_stops_at_eos(self, fake_runtime, tmp_path):
+        reference = _plain_greedy(PROMPT, 30)
+        eos = reference[7]
+        decoder = _decoder(tmp_path, eos=(eos,))
+        run = decoder.start(_target(), PROMPT, {**GREEDY, "max_length": len(PROMPT) + 30})
+
+        assert list(run.tokens(30, lambda: False)) == reference[:8]
+
+    def test_should_stop_interrupts_between_rounds(self, fake_runtime, tmp_path):
+        decoder = _decoder(tmp_path)
+        run = decoder.start(_target(), PROMPT, {**GREEDY, "max_length": len(PROMPT) + 40})
+        out = []
+        for token in run.tokens(40, lambda: len(out) >= 5):
+            out.append(token)
+        assert 5 <= len(out) < 40
+        assert out == _plain_greedy(PROMPT, 40)[:len(out)]
+
+    def test_sampling_preserves_target_distribution(self, fake_runtime, tmp_path):
+        # Segundo token: aceito do rascunho com min(1, p/q) ou amostrado do resíduo
+        options = {"do_sample": True, "temperature": 1.0, "top_k": 0, "top_p": 1.0, "batch_size": 1,
+                   "max_length": len(PROMPT) + 4}
+        decoder = _decoder(tmp_path, num_tokens=1, eos=())
+        target = _target()
+        counts = {}
+        trials = 3000
+        for _ in range(trials):
+            first, second = list(decoder.start(target, PROMPT, options).tokens(2, lambda: False))
+            counts.setdefault(first, {}).setdefault(second, 0)
+            counts[first][second] += 1
+
+        checked = 0
+        for first, seconds in counts.items():
+            n = sum(seconds.values())
+            if n < 500:
+                continue
+            checked += 1
+            p = _distribution(fake_genai.logits_for(PROMPT + [first]), options)
+            for token, count in seconds.items():
+                assert count / n == pytest.approx(p[token], abs=0.05)
+        assert checked
+
+    def test_start_requires_logits_for_every_position(self, fake_runtime, tmp_path, monkeypatch):
+        monkeypatch.setattr(fake_genai.Generator, "full_logits", False)
+        with pytest.raises(SpeculativeUnavailable):
+            _decoder(tmp_path).start(_target(), PROMPT, {**GREEDY, "max_length": 20})
+
+
+class TestEngineFallback:
+    PROMPT = "Qual é a capital do Brasil?"
+
+    def test_speculative_output_matches_plain_engine(self, make_engine):
+        plain = make_engine(draft=False)
+        spec = make_engine(draft=True)
+
+        assert plain._speculative is None and spec._speculative is not None
+        expected = plain.generate_text(self.PROMPT, do_sample=False, max_new_tokens=30)
+        assert spec.generate_text(self.PROMPT, do_sample=False, max_new_tokens=30) == expected
+        assert spec._speculative.get_stats()["rounds"] > 0
+
+    def test_unsupported_runtime_falls_back_to_plain_decoding(self, make_engine, monkeypatch):
+        plain = make_engine(draft=False)
+        expected = plain.generate_text(self.PROMPT, do_sample=False, max_new_tokens=30)
+
+        monkeypatch.setattr(fake_genai.Generator, "full_logits", False)
+        spec = make_engine(draft=True)
+        assert spec.generate_text(self.PROMPT, do_sample=False, max_new_tokens=30) == expected
+        assert spec._speculative.enabled is False